@@ -0,0 +1,123 @@
+# ************************************************
+# |docname| - Unit tests for `../webperf3/anomaly.py`
+# ************************************************
+#
+#
+# Imports
+# =======
+# These are listed in the order prescribed by `PEP 8`_.
+#
+# Standard library
+# ----------------
+import asyncio
+import json
+from pathlib import Path
+
+# Third-party imports
+# -------------------
+import websockets
+
+# Local application imports
+# -------------------------
+from webperf3.anomaly import AlertStore, AnomalyDetector, is_alert_message
+from webperf3.loadtest import WebPerf3Instance
+from webperf3.synthetic import format_iperf3_block, iperf3_result
+
+
+# Tests
+# =====
+# Drops, stalls, and missing directions are flagged once the baselines warm up.
+def test_detector():
+    detector = AnomalyDetector(warmup=3)
+    steady = [(5201, t, 10e6 + t % 2 * 1e5, 20e6, "UE 1") for t in range(1, 6)]
+    # The first call trains, without alerts.
+    assert detector.ingest(steady[:1]) == []
+    assert detector.ingest(steady) == []
+    # Runs already seen are skipped.
+    assert detector.ingest(steady) == []
+
+    alerts = detector.ingest([(5201, 6, 4e6, 20e6, "UE 1")])
+    assert [(a["kind"], a["direction"], a["baseline_of"]) for a in alerts] == [
+        ("drop", "send", "ue")
+    ]
+    # The UE's baseline follows it to another port, which has no baseline yet.
+    alerts = detector.ingest([(5202, 7, 3e6, 20e6, "UE 1")])
+    assert [(a["kind"], a["port"]) for a in alerts] == [("drop", 5202)]
+
+    # A receive-only run, like ``no_bidir_iperf3_output.json``, and a stall.
+    alerts = detector.ingest([(5201, 8, None, 0.0, None)])
+    assert [a["kind"] for a in alerts] == ["missing-send", "stall"]
+    # The stall didn't affect the baseline, so a normal rate isn't flagged.
+    assert detector.ingest([(5201, 9, 10e6, 20e6, "UE 1")]) == []
+
+    # A missing direction is reported once per port, until it returns.
+    receive_only = [(5203, t, None, 20e6, None) for t in range(10, 13)]
+    alerts = detector.ingest(receive_only)
+    assert [a["kind"] for a in alerts] == ["missing-send"]
+    assert detector.ingest([(5203, 13, 10e6, 20e6, None)]) == []
+    alerts = detector.ingest([(5203, 14, None, 20e6, None)])
+    assert [a["kind"] for a in alerts] == ["missing-send"]
+
+
+def test_alert_store(tmp_path: Path):
+    path = tmp_path / "alerts.jsonl"
+    store = AlertStore(capacity=3)
+    alerts = [dict(kind="stall", port=5201 + i % 2, ue=f"UE {i}") for i in range(4)]
+    store.add(alerts, path)
+    assert [a["id"] for a in alerts] == [1, 2, 3, 4]
+    # Only ``capacity`` alerts are kept in memory.
+    assert [a["id"] for a in store.query()] == [2, 3, 4]
+    assert [a["id"] for a in store.query(since=2)] == [3, 4]
+    assert [a["id"] for a in store.query(port=5201)] == [3]
+    assert [a["id"] for a in store.query(ue="UE 2")] == [3]
+    assert [a["id"] for a in store.query(limit=1)] == [4]
+
+    # Another process sees the recorded alerts, and continues numbering from them.
+    other = AlertStore(capacity=3)
+    other.reload_if_behind(path, store.last_id)
+    assert other.query() == store.query()
+    store.add([dict(kind="stall", port=5201, ue=None)], path)
+    # The file is only read once the other process learns of a new alert.
+    other.reload_if_behind(path, 4)
+    assert other.last_id == 4
+    other.reload_if_behind(path, store.last_id)
+    assert [a["id"] for a in other.query()] == [3, 4, 5]
+    assert other.next_id == 6
+
+    # The file is compacted to the alerts in memory once it holds twice as many.
+    for i in range(10):
+        store.add([dict(kind="stall", port=5201, ue=None)], path)
+        assert len(path.read_text().splitlines()) <= 6
+    other.load(path)
+    assert other.query() == store.query()
+    assert other.next_id == store.next_id == 16
+
+
+# A drop is pushed over the websocket and recorded for ``/alerts``.
+def test_alerts(tmp_path: Path):
+    log_path = tmp_path / "port-5201.json"
+    log_path.write_text(
+        "".join(
+            format_iperf3_block(iperf3_result(t, 20e6, 10e6, "UE 1"))
+            for t in range(1647312652, 1647312952, 30)
+        )
+    )
+
+    async def run(instance):
+        async with websockets.connect(instance.ws_url) as ws:
+            # Discard the greeting.
+            await ws.recv()
+            with open(log_path, "a") as f:
+                f.write(
+                    format_iperf3_block(iperf3_result(1647313000, 2e6, 10e6, "UE 1"))
+                )
+            while True:
+                message = await asyncio.wait_for(ws.recv(), 10)
+                if is_alert_message(message):
+                    return json.loads(message)["alert"]
+
+    with WebPerf3Instance(1, tmp_path) as instance:
+        alert = asyncio.run(run(instance))
+        assert (alert["kind"], alert["direction"]) == ("drop", "receive")
+        assert json.loads(instance.get("/alerts")) == [alert]
+        assert json.loads(instance.get(f"/alerts?since={alert['id']}")) == []
@@ -0,0 +1,84 @@
+# ********************************************************************************************
+# |docname| - Unit tests for `../webperf3/benchmark.py` and `../webperf3/synthetic.py`
+# ********************************************************************************************
+#
+#
+# Imports
+# =======
+# These are listed in the order prescribed by `PEP 8`_.
+#
+# Standard library
+# ----------------
+# None.
+#
+# Third-party imports
+# -------------------
+# None.
+#
+# Local application imports
+# -------------------------
+from webperf3.benchmark import compare, percentile, run_suite
+from webperf3.synthetic import write_synthetic_logs
+from webperf3.webperf3 import (
+    extract_iperf3_performance,
+    read_all_iperf3_json_log,
+    read_iperf3_json_log,
+)
+
+
+# Tests
+# =====
+# The synthetic logs should parse just as the real logs do: error blocks are skipped, while results provide all the data the webserver displays.
+def test_synthetic_logs(tmp_path):
+    paths = write_synthetic_logs(tmp_path, 2, 20, error_rate=0.25, seed=1)
+    assert [p.name for p in paths] == ["port-5201.json", "port-5202.json"]
+    text = paths[0].read_text()
+    num_errors = text.count("iperf3: exiting")
+    assert num_errors > 0
+
+    arr = read_all_iperf3_json_log(paths[0])
+    assert len(arr) == 20 - num_errors
+    for d in arr:
+        timestamp, send_bps, receive_bps, extra_data = extract_iperf3_performance(d)
+        assert timestamp and receive_bps
+        # Only ``--bidir`` runs send data and provide a name.
+        assert (send_bps is None) == (extra_data is None)
+
+    # The same seed produces the same logs.
+    write_synthetic_logs(tmp_path / "again", 2, 20, error_rate=0.25, seed=1)
+    assert (tmp_path / "again/port-5201.json").read_text() == text
+
+    # The last block of the log is read correctly, even if it's an error.
+    assert read_iperf3_json_log(paths[0]) == (
+        {} if text.endswith("exiting\n") else arr[-1]
+    )
+
+
+def test_percentile():
+    assert percentile([3, 1, 2], 0.5) == 2
+    assert percentile([1, 2], 0.25) == 1.25
+    assert percentile([5], 0.99) == 5
+
+
+def test_suite():
+    results = run_suite(ports=2, runs=5, repeat=2)
+    assert set(results["results"]) == {
+        "read_iperf3_json_log",
+        "read_all_iperf3_json_log",
+        "read_all_iperf3_logs",
+        "export_csv (cold)",
+        "create_table (cold)",
+        "export_csv (warm)",
+        "create_table (warm)",
+        "GET /table",
+        "GET /csv",
+    }
+    # Comparing a suite against itself shows no regressions; doubling the times does.
+    assert not any(c[4] for c in compare(results, results))
+    slower = {
+        "results": {
+            name: dict(r, median=r["median"] * 2)
+            for name, r in results["results"].items()
+        }
+    }
+    assert all(c[4] for c in compare(results, slower))
@@ -0,0 +1,81 @@
+# *************************************************
+# |docname| - Unit tests for `../webperf3/capacity.py`
+# *************************************************
+#
+#
+# Imports
+# =======
+# These are listed in the order prescribed by `PEP 8`_.
+#
+# Standard library
+# ----------------
+import os
+import shutil
+import socket
+
+# Third-party imports
+# -------------------
+import pytest
+
+# Local application imports
+# -------------------------
+from webperf3.capacity import (
+    client_throughput,
+    find_knee,
+    jain_index,
+    listening_ports,
+    run_capacity_benchmark,
+)
+
+
+# Tests
+# =====
+def test_jain_index():
+    assert jain_index([5, 5, 5]) == 1
+    assert jain_index([1, 0, 0, 0]) == pytest.approx(0.25)
+    assert jain_index([0, 0]) == 1
+
+
+def test_client_throughput():
+    end = dict(
+        sum_sent=dict(bits_per_second=3e6),
+        sum_received=dict(bits_per_second=2e6),
+        sum_received_bidir_reverse=dict(bits_per_second=1e6),
+    )
+    assert client_throughput(dict(end=end)) == 3e6
+    assert client_throughput(dict(end={}, error="unable to connect")) is None
+
+
+# The knee is the last client count before throughput stops scaling or fairness falls.
+def test_find_knee():
+    assert find_knee([10, 20, 29, 29.5, 28], [1] * 5) == (
+        3,
+        "adding client 4 changed the aggregate throughput by +5% of a lone client's",
+    )
+    assert find_knee([10, 20, 30], [1, 1, 0.5]) == (
+        2,
+        "with 3 clients, fairness fell to 0.50",
+    )
+    assert find_knee([10, 20, 30], [1, 1, 1])[0] == 3
+    assert find_knee([0, 5], [1, 1])[0] == 0
+
+
+@pytest.mark.skipif(not os.path.exists("/proc/net/tcp"), reason="Requires /proc.")
+def test_listening_ports():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+        assert listening_ports([port]) == []
+        s.listen()
+        assert listening_ports([port, port + 1]) in ([port], [port, port + 1])
+
+
+# Run a brief benchmark with real iPerf3 servers and clients.
+@pytest.mark.skipif(not shutil.which("iperf3"), reason="Requires iperf3.")
+def test_capacity_benchmark():
+    report = run_capacity_benchmark(num_ports=2, duration=1, settle_time=10)
+    assert [step["clients"] for step in report["steps"]] == [1, 2]
+    assert all(step["aggregate_bps"] > 0 for step in report["steps"])
+    assert report["steps"][0]["notification_delay"] is not None
+    assert report["steps"][0]["ingestion_delay"] is not None
+    assert 1 <= report["knee"] <= 2
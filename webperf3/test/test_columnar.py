@@ -0,0 +1,81 @@
+# *************************************************
+# |docname| - Unit tests for `../webperf3/columnar.py`
+# *************************************************
+#
+#
+# Imports
+# =======
+# These are listed in the order prescribed by `PEP 8`_.
+#
+# Standard library
+# ----------------
+import io
+
+# Third-party imports
+# -------------------
+import pytest
+
+# Local application imports
+# -------------------------
+from webperf3 import webperf3
+from webperf3.columnar import (
+    arrow_stream,
+    extract_iperf3_intervals,
+    iter_runs,
+    parquet_stream,
+)
+from webperf3.synthetic import iperf3_result, write_synthetic_logs
+
+
+# Fixtures
+# ========
+@pytest.fixture
+def logs(tmp_path, monkeypatch):
+    monkeypatch.setattr(webperf3, "log_dir", tmp_path)
+    monkeypatch.setattr(webperf3, "log_index", webperf3.LogIndex())
+    write_synthetic_logs(tmp_path, 3, 20, error_rate=0.2)
+
+
+# Tests
+# =====
+def test_extract_intervals():
+    starts, send, receive = extract_iperf3_intervals(
+        iperf3_result(0, 2e6, 1e6, duration=3)
+    )
+    assert starts == [0, 1, 2]
+    assert send == [1e6] * 3
+    assert receive == [2e6] * 3
+    assert extract_iperf3_intervals(iperf3_result(0, 2e6, duration=2))[1] == [
+        None,
+        None,
+    ]
+
+
+# The runs match those in the CSV export, with or without intervals.
+def test_iter_runs(logs):
+    runs = list(iter_runs(3))
+    assert len(runs) == len(webperf3.export_csv(3).splitlines()) - 1
+    with_intervals = list(iter_runs(3, intervals=True))
+    assert [run[:5] for run in with_intervals] == runs
+    assert all(len(run[5]) == 10 for run in with_intervals)
+
+
+# Both formats round-trip through pyarrow, in several batches.
+def test_streams(logs):
+    pa = pytest.importorskip("pyarrow")
+    import pyarrow.parquet as pq
+
+    runs = list(iter_runs(3, intervals=True))
+    chunks = list(arrow_stream(3, intervals=True, size=7))
+    # Each batch is yielded as it's written.
+    assert len(chunks) > len(runs) // 7
+    table = pa.ipc.open_stream(b"".join(chunks)).read_all()
+    assert table.num_rows == len(runs)
+    assert table.column("port").to_pylist() == [run[0] for run in runs]
+    assert table.schema.field("timestamp").type == pa.timestamp("s", tz="UTC")
+    assert table.column("timestamp")[0].value == runs[0][2]
+    assert table.column("interval_receive_bps").to_pylist() == [run[7] for run in runs]
+
+    parquet = pq.read_table(io.BytesIO(b"".join(parquet_stream(3, size=7))))
+    assert parquet.num_rows == len(runs)
+    assert parquet.column("receive_bps").to_pylist() == [run[4] for run in runs]
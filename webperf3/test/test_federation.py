@@ -0,0 +1,115 @@
+# ****************************************************
+# |docname| - Unit tests for `../webperf3/federation.py`
+# ****************************************************
+#
+#
+# Imports
+# =======
+# These are listed in the order prescribed by `PEP 8`_.
+#
+# Standard library
+# ----------------
+from pathlib import Path
+import time
+
+# Third-party imports
+# -------------------
+# None.
+#
+# Local application imports
+# -------------------------
+from webperf3.federation import Collector, FederatedTable, parse_nodes
+from webperf3.loadtest import WebPerf3Instance
+from webperf3.synthetic import format_iperf3_block, iperf3_result, write_synthetic_logs
+
+
+# Tests
+# =====
+def test_parse_nodes():
+    assert parse_nodes(["a=http://10.0.0.1", "http://10.0.0.2:8080"]) == {
+        "a": "http://10.0.0.1",
+        "10.0.0.2:8080": "http://10.0.0.2:8080",
+    }
+
+
+# Updates replace only one node's rows; nodes go stale when disconnected or not heard from.
+def test_federated_table():
+    now = [0.0]
+    table = FederatedTable(["a", "b"], stale_after=10, clock=lambda: now[0])
+    table.set_starting_port("b", 5301)
+    table.seen("a", connected=True)
+    table.seen("b", connected=True)
+    assert table.update("a", [[1, 2.0, 3.0, "UE"], None])
+    assert not table.update("a", [[1, 2.0, 3.0, "UE"], None])
+    # Node b reports telemetry; node a predates it.
+    assert table.update("b", [[4, None, 5.0, None, {"cpu_percent": 9.5}]])
+    assert table.table() == [
+        ["a", 5201, 1, 2.0, 3.0, "UE", None, False],
+        ["a", 5202, None, None, None, None, None, False],
+        ["b", 5301, 4, None, 5.0, None, {"cpu_percent": 9.5}, False],
+    ]
+
+    now[0] = 11
+    table.seen("a")
+    table.disconnected("a")
+    status = table.status()
+    assert status["a"]["stale"] and status["b"]["stale"]
+    assert status["b"]["age"] == 11
+
+    # Only changed nodes need their CSV data fetched.
+    assert table.stale_csv() == [("a", 1), ("b", 1)]
+    header = "Port,Name,Timestamp,Send rate (bps),Receive rate (bps)\r\n"
+    table.update_csv("a", 1, header + "5201,UE,44000.5,2.0,3.0\r\n")
+    table.update_csv("b", 1, header + "5301,,44000.25,,5.0\r\n")
+    assert table.stale_csv() == []
+    assert table.csv().splitlines()[1:] == [
+        "b,5301,,44000.25,,5.0",
+        "a,5201,UE,44000.5,2.0,3.0",
+    ]
+    # Nodes reporting different telemetry columns are merged by column name.
+    table.update_csv(
+        "a", 2, header[:-2] + ",CPU use (%),br0 rx\r\n5201,UE,44000.5,2.0,3.0,10,7\r\n"
+    )
+    table.update_csv(
+        "b", 2, header[:-2] + ",CPU use (%),wlan0 rx\r\n5301,,44000.25,,5.0,20,9\r\n"
+    )
+    assert table.csv().splitlines() == [
+        "Node,Port,Name,Timestamp,Send rate (bps),Receive rate (bps),CPU use (%),br0 rx,wlan0 rx",
+        "b,5301,,44000.25,,5.0,20,,9",
+        "a,5201,UE,44000.5,2.0,3.0,10,7,",
+    ]
+
+
+# Collect from two local instances.
+def test_collector(tmp_path: Path):
+    write_synthetic_logs(tmp_path / "a", 2, 3, error_rate=0)
+    write_synthetic_logs(tmp_path / "b", 1, 3, error_rate=0)
+    with WebPerf3Instance(2, tmp_path / "a") as a, WebPerf3Instance(
+        1, tmp_path / "b"
+    ) as b:
+        collector = Collector(
+            {
+                "a": f"http://127.0.0.1:{a.http_port}",
+                "b": f"http://127.0.0.1:{b.http_port}",
+            }
+        )
+        collector.start()
+        try:
+
+            def wait_until(condition):
+                deadline = time.monotonic() + 20
+                while not condition():
+                    assert time.monotonic() < deadline
+                    time.sleep(0.05)
+
+            wait_until(lambda: len(collector.table.table()) == 3)
+            assert not any(row[-1] for row in collector.table.table())
+            assert len(collector.federated_csv().splitlines()) == 1 + 3 * 3
+
+            # A new run on one node updates the federated table and CSV.
+            with open(tmp_path / "b/port-5201.json", "a") as f:
+                f.write(format_iperf3_block(iperf3_result(2000000000, 1.0, 2.0, "new")))
+            wait_until(lambda: collector.table.table()[-1][5] == "new")
+            assert len(collector.federated_csv().splitlines()) == 1 + 3 * 3 + 1
+        finally:
+            collector.stop()
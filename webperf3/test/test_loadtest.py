@@ -0,0 +1,47 @@
+# **************************************************
+# |docname| - Unit tests for `../webperf3/loadtest.py`
+# **************************************************
+#
+#
+# Imports
+# =======
+# These are listed in the order prescribed by `PEP 8`_.
+#
+# Standard library
+# ----------------
+import os
+
+# Third-party imports
+# -------------------
+import pytest
+
+# Local application imports
+# -------------------------
+from webperf3.loadtest import read_process_usage, run_load_test
+
+
+# Tests
+# =====
+@pytest.mark.skipif(not os.path.exists("/proc/self/stat"), reason="Requires /proc.")
+def test_read_process_usage():
+    cpu_secs, rss = read_process_usage(os.getpid())
+    assert cpu_secs > 0
+    assert rss > 0
+
+
+# Run a brief load test against a real instance.
+def test_load_test():
+    report = run_load_test(
+        num_ports=2,
+        initial_runs=5,
+        ws_clients=5,
+        http_clients=1,
+        duration=2,
+        write_interval=0.2,
+    )
+    assert report["websocket"]["connected"] == 5
+    assert report["num_http_errors"] == 0
+    assert report["http"]["/table"]["count"] > 0
+    assert report["log_writes"] > 0
+    assert report["notification_delay"] is not None
+    assert report["notification_delay"]["count"] > 0
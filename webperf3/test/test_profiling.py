@@ -0,0 +1,130 @@
+# **************************************************
+# |docname| - Unit tests for `../webperf3/profiling.py`
+# **************************************************
+#
+#
+# Imports
+# =======
+# These are listed in the order prescribed by `PEP 8`_.
+#
+# Standard library
+# ----------------
+import http.client
+import json
+import marshal
+from pathlib import Path
+import threading
+import time
+import tracemalloc
+
+# Third-party imports
+# -------------------
+# None.
+#
+# Local application imports
+# -------------------------
+from webperf3 import profiling
+from webperf3.loadtest import WebPerf3Instance
+from webperf3.profiling import ProfileSession, memory_report, profiled
+
+
+# Support code
+# ============
+def busy(seconds: float) -> None:
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        sum(range(1000))
+
+
+def function_names(pstats_data: bytes) -> set:
+    return {key[2] for key in marshal.loads(pstats_data)}
+
+
+# Tests
+# =====
+# A sampling profile records other threads' stacks.
+def test_sampling():
+    session = ProfileSession("sampling", 10, interval=0.002)
+    session.start()
+    worker = threading.Thread(target=busy, args=(0.3,), name="busy-thread")
+    worker.start()
+    worker.join()
+    session.stop()
+    assert not session.running
+    assert session.num_samples > 10
+    lines = session.collapsed().splitlines()
+    assert any(
+        line.startswith("busy-thread;") and "busy (test_profiling.py" in line
+        for line in lines
+    )
+    assert "busy" in function_names(session.pstats_data())
+
+
+# A deterministic profile covers calls made through ``profiled``, only while it runs.
+def test_deterministic(monkeypatch):
+    assert profiled(busy) is busy
+    session = ProfileSession("deterministic", 10)
+    monkeypatch.setattr(profiling, "session", session)
+    session.start()
+    worker = threading.Thread(target=lambda: profiled(busy)(0.1))
+    worker.start()
+    worker.join()
+    session.stop()
+    assert "busy" in function_names(session.pstats_data())
+    assert profiled(busy) is busy
+
+
+def test_memory_report(monkeypatch):
+    monkeypatch.setattr(profiling, "snapshots", profiling.deque(maxlen=2))
+    assert memory_report().startswith("No snapshots")
+    tracemalloc.start()
+    try:
+        profiling.snapshots.append(tracemalloc.take_snapshot())
+        leak = [bytearray(1000) for _ in range(1000)]
+        profiling.snapshots.append(tracemalloc.take_snapshot())
+    finally:
+        tracemalloc.stop()
+    report = memory_report(top=3)
+    assert "test_profiling.py" in report.splitlines()[1]
+    assert len(leak) == 1000
+
+
+# The endpoints require the token, and profile a running server.
+def test_endpoints(tmp_path: Path):
+    token = "secret"
+    with WebPerf3Instance(
+        1, tmp_path, extra_args=("--no-iperf3", "--admin-token", token)
+    ) as instance:
+
+        def request(method: str, path: str, auth: str = token):
+            conn = http.client.HTTPConnection("127.0.0.1", instance.http_port)
+            try:
+                conn.request(method, path, headers={"Authorization": f"Bearer {auth}"})
+                response = conn.getresponse()
+                return response.status, response.read()
+            finally:
+                conn.close()
+
+        assert request("GET", "/admin/profile/status", "wrong")[0] == 401
+        assert request("GET", "/admin/profile/result")[0] == 404
+        status, body = request("POST", "/admin/profile/start?duration=0.5")
+        assert status == 200 and json.loads(body)["running"]
+        assert request("POST", "/admin/profile/start")[0] == 409
+        time.sleep(1)
+        status, body = request("GET", "/admin/profile/result?format=collapsed")
+        assert status == 200 and b" " in body
+
+        assert request("POST", "/admin/profile/start?mode=deterministic")[0] == 200
+        instance.get("/table")
+        assert request("POST", "/admin/profile/stop")[0] == 200
+        status, body = request("GET", "/admin/profile/result")
+        assert "create_table" in function_names(body)
+
+        assert request("POST", "/admin/memory/snapshot?frames=0")[0] == 400
+        assert request("POST", "/admin/memory/snapshot")[0] == 200
+        instance.get("/csv")
+        status, body = request("POST", "/admin/memory/snapshot")
+        assert json.loads(body)["snapshots"] == 2
+        status, body = request("GET", "/admin/memory/diff?top=5")
+        assert body.startswith(b"Top 5 changes")
+        assert request("POST", "/admin/memory/stop")[0] == 200
@@ -0,0 +1,68 @@
+# ************************************************
+# |docname| - Unit tests for `../webperf3/replay.py`
+# ************************************************
+#
+#
+# Imports
+# =======
+# These are listed in the order prescribed by `PEP 8`_.
+#
+# Standard library
+# ----------------
+import math
+from pathlib import Path
+import shutil
+
+# Third-party imports
+# -------------------
+# None.
+#
+# Local application imports
+# -------------------------
+from webperf3.replay import read_recorded_blocks, replay
+from webperf3.synthetic import write_synthetic_logs
+
+
+# Globals
+# =======
+test_local = Path(__file__).resolve().parent
+
+
+# Tests
+# =====
+# Replaying as fast as possible reproduces the original logs.
+def test_replay_max_speed(tmp_path):
+    src = tmp_path / "src"
+    write_synthetic_logs(src, 3, 10, error_rate=0.2)
+    blocks = read_recorded_blocks(src)
+    assert len(blocks) == 30
+    assert [b.timesecs for b in blocks] == sorted(b.timesecs for b in blocks)
+
+    dest = tmp_path / "dest"
+    assert replay(blocks, dest, math.inf) == 30
+    for path in src.iterdir():
+        assert (dest / path.name).read_text() == path.read_text()
+
+
+# Replaying at a given speed reproduces the original spacing.
+def test_replay_spacing(tmp_path):
+    src = tmp_path / "src"
+    src.mkdir()
+    shutil.copy(test_local / "multiple_iperf3_output.json", src / "port-5201.json")
+    shutil.copy(test_local / "error_0_iperf3_output.json", src / "port-5202.json")
+    blocks = read_recorded_blocks(src)
+    # The error blocks lack timestamps, so they're replayed first.
+    names = [b.file_name for b in blocks]
+    assert names == ["port-5202.json"] * (len(names) - 2) + ["port-5201.json"] * 2
+
+    now = [0.0]
+    sleeps = []
+
+    def sleep(delay):
+        sleeps.append(delay)
+        now[0] += delay
+
+    replay(blocks, tmp_path / "dest", 10, sleep, lambda: now[0])
+    # The two runs started 5079 seconds apart; at 10x, that's about 508 seconds.
+    assert sleeps == [(blocks[-1].timesecs - blocks[-2].timesecs) / 10]
+    assert math.isclose(sleeps[0], 507.9, abs_tol=1)
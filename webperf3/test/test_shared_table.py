@@ -0,0 +1,99 @@
+# ******************************************************
+# |docname| - Unit tests for `../webperf3/shared_table.py`
+# ******************************************************
+#
+#
+# Imports
+# =======
+# These are listed in the order prescribed by `PEP 8`_.
+#
+# Standard library
+# ----------------
+import json
+from pathlib import Path
+from threading import Event, Thread
+
+# Third-party imports
+# -------------------
+import pytest
+
+# Local application imports
+# -------------------------
+from webperf3.ci_utils import is_win
+from webperf3.loadtest import WebPerf3Instance
+from webperf3.shared_table import ResultsTable
+from webperf3.synthetic import write_synthetic_logs
+
+
+# Tests
+# =====
+# Published rows read back unchanged, including missing logs and missing values.
+def test_publish_read():
+    table = ResultsTable.create(4)
+    try:
+        assert table.read() == (0, [None] * 4)
+        rows = [
+            (1647312652, 1.5e6, 2.5e7, "UE 1", dict(cpu_percent=12.5)),
+            None,
+            (None, None, None, None, None),
+            (1647312682, None, 3e7, "é" * 40, None),
+        ]
+        table.publish(rows)
+        version, read_rows = table.read()
+        assert version == 2
+        # Names are truncated to 62 bytes, without splitting a character.
+        assert read_rows == rows[:3] + [(1647312682, None, 3e7, "é" * 31, None)]
+
+        # Another process sees the same data.
+        other = ResultsTable.attach(table.name)
+        try:
+            assert other.read() == (version, read_rows)
+            table.set_ready(0b101)
+            assert other.ready == 0b101
+            table.set_last_alert_id(7)
+            assert other.last_alert_id == 7
+        finally:
+            other.close()
+
+        # Telemetry which doesn't fit is omitted.
+        table.publish([(1, 2.0, 3.0, "UE", dict(x="x" * 600))])
+        assert table.read()[1][0] == (1, 2.0, 3.0, "UE", None)
+    finally:
+        table.close()
+
+
+# A reader never sees a torn update.
+def test_concurrent_read():
+    table = ResultsTable.create(8)
+    versions = [
+        [(i, 1.0, 2.0, "é" * 31, dict(cpu_percent=1.0)) for i in range(8)],
+        [(i, 3.0, 4.0, "ü" * 20, dict(cpu_percent=99.5)) for i in range(8)],
+    ]
+    stop = Event()
+
+    def publish():
+        while not stop.is_set():
+            for rows in versions:
+                table.publish(rows)
+
+    publisher = Thread(target=publish)
+    publisher.start()
+    try:
+        for _ in range(500):
+            assert table.read()[1] in versions
+    finally:
+        stop.set()
+        publisher.join()
+        table.close()
+
+
+# Worker processes serve the same results as a single process.
+@pytest.mark.skipif(is_win, reason="--workers requires fork.")
+def test_workers(tmp_path: Path):
+    write_synthetic_logs(tmp_path, 3, 10)
+    with WebPerf3Instance(3, tmp_path) as single:
+        expected = json.loads(single.get("/table"))
+        expected_csv = single.get("/csv")
+    with WebPerf3Instance(3, tmp_path, ("--no-iperf3", "--workers", "2")) as multi:
+        assert json.loads(multi.get("/table")) == expected
+        assert multi.get("/csv") == expected_csv
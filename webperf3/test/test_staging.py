@@ -0,0 +1,132 @@
+# ************************************************
+# |docname| - Unit tests for `../webperf3/staging.py`
+# ************************************************
+#
+#
+# Imports
+# =======
+# These are listed in the order prescribed by `PEP 8`_.
+#
+# Standard library
+# ----------------
+import json
+import os
+from pathlib import Path
+import time
+
+# Third-party imports
+# -------------------
+# None.
+#
+# Local application imports
+# -------------------------
+from webperf3.loadtest import WebPerf3Instance
+from webperf3.staging import LogPersister, complete_length
+from webperf3.synthetic import format_iperf3_block, iperf3_result
+
+
+# Support code
+# ============
+def block(timestamp: int) -> str:
+    return format_iperf3_block(iperf3_result(timestamp, 2e7, 1e7, "UE 1"))
+
+
+# Tests
+# =====
+def test_complete_length():
+    data = (block(1) + block(2)).encode()
+    assert complete_length("port-5201.json", data, False) == len(data)
+    # The last block is still being written.
+    assert complete_length("port-5201.json", data[:-10], False) == len(block(1))
+    assert complete_length("port-5201.json", data[:-10], True) == len(data) - 10
+    assert complete_length("alerts.jsonl", b'{"a": 1}\n{"b"', False) == 9
+
+
+# Only completed blocks are persisted, until the file stops changing.
+def test_flush(tmp_path: Path):
+    stage, durable = tmp_path / "stage", tmp_path / "durable"
+    persister = LogPersister(stage, durable, replaced=["index.json"])
+    assert persister.recover() == []
+    log = stage / "port-5201.json"
+    partial = block(2)[:-10]
+    log.write_text(block(1) + partial)
+    (stage / "index.json").write_text("{}")
+    (stage / "other.txt").write_text("ignored")
+    persister.flush()
+    assert (durable / "port-5201.json").read_text() == block(1)
+    assert (durable / "index.json").read_text() == "{}"
+    assert not (durable / "other.txt").exists()
+    # Unchanged since the last batch, so the partial block is complete.
+    persister.flush()
+    assert (durable / "port-5201.json").read_text() == block(1) + partial
+    with open(log, "a") as f:
+        f.write(block(3))
+    assert persister.flush() == len(block(3))
+    assert (durable / "port-5201.json").read_bytes() == log.read_bytes()
+    assert persister.flush() == 0
+    # If the durable copy is removed, it's rewritten in full.
+    (durable / "port-5201.json").unlink()
+    with open(log, "a") as f:
+        f.write(block(4))
+    persister.flush()
+    assert (durable / "port-5201.json").read_bytes() == log.read_bytes()
+    # A line file which is compacted by replacing it is rewritten, even if it's grown past the durable copy.
+    journal = stage / "telemetry.jsonl"
+    journal.write_text('{"a": 1}\n')
+    persister.flush()
+    compacted = stage / "compacted.tmp"
+    compacted.write_text('{"b": 2}\n{"c": 3}\n')
+    os.replace(compacted, journal)
+    persister.flush()
+    assert (durable / "telemetry.jsonl").read_text() == journal.read_text()
+
+
+# After a reboot, the staging directory is restored; after a crash, it's kept.
+def test_recover(tmp_path: Path):
+    stage, durable = tmp_path / "stage", tmp_path / "durable"
+    durable.mkdir()
+    (durable / "port-5201.json").write_text(block(1))
+    (durable / "port-5202.json").write_text(block(1))
+    (durable / "index.json").write_text("{}")
+    stage.mkdir()
+    # This port's staged log is ahead of the durable copy.
+    (stage / "port-5202.json").write_text(block(1) + block(2))
+    persister = LogPersister(stage, durable, replaced=["index.json"])
+    assert persister.recover() == ["index.json", "port-5201.json"]
+    assert (stage / "port-5201.json").read_text() == block(1)
+    assert persister.flush() == len(block(2))
+    assert (durable / "port-5202.json").read_text() == block(1) + block(2)
+
+    # A staged log which doesn't continue the durable copy is replaced.
+    (stage / "port-5201.json").write_text(block(5))
+    assert LogPersister(stage, durable).recover() == ["port-5201.json"]
+    assert (stage / "port-5201.json").read_text() == block(1)
+
+
+# webperf3 serves from the staging directory, and persists to the log directory.
+def test_staged_server(tmp_path: Path):
+    stage, durable = tmp_path / "stage", tmp_path / "durable"
+    durable.mkdir()
+    (durable / "port-5201.json").write_text(block(1647312652))
+    with WebPerf3Instance(
+        1,
+        durable,
+        extra_args=(
+            "--no-iperf3",
+            "--stage-dir",
+            str(stage),
+            "--persist-interval",
+            "0.1",
+        ),
+    ) as instance:
+        assert json.loads(instance.get("/table"))[0][0] == 1647312652
+        with open(stage / "port-5201.json", "a") as f:
+            f.write(block(1647312700))
+        deadline = time.monotonic() + 10
+        while (durable / "port-5201.json").stat().st_size < os.stat(
+            stage / "port-5201.json"
+        ).st_size:
+            assert time.monotonic() < deadline
+            time.sleep(0.1)
+        assert json.loads(instance.get("/table"))[0][0] == 1647312700
+    assert (durable / ".webperf3-index.json").exists()
@@ -0,0 +1,180 @@
+# ***************************************************
+# |docname| - Unit tests for `../webperf3/telemetry.py`
+# ***************************************************
+#
+#
+# Imports
+# =======
+# These are listed in the order prescribed by `PEP 8`_.
+#
+# Standard library
+# ----------------
+import csv
+from io import StringIO
+import os
+
+# Third-party imports
+# -------------------
+import pytest
+
+# Local application imports
+# -------------------------
+from webperf3 import webperf3
+from webperf3.telemetry import (
+    Sample,
+    TelemetrySampler,
+    parse_proc_net_dev,
+    parse_proc_stat,
+    summarize_samples,
+    summary_fields,
+)
+from webperf3.synthetic import (
+    default_start_time,
+    format_iperf3_block,
+    iperf3_result,
+    write_synthetic_logs,
+)
+
+
+# Tests
+# =====
+def test_parse():
+    stat = "cpu  10 1 5 80 4 0 0 0 0 0\ncpu0 10 1 5 80 4 0 0 0 0 0\n"
+    assert parse_proc_stat(stat) == (16, 100)
+    net_dev = (
+        "Inter-|   Receive                |  Transmit\n"
+        " face |bytes    packets errs drop|bytes    packets\n"
+        "    lo: 100 1 0 0 0 0 0 0 200 2 0 0 0 0 0 0\n"
+        "  br0: 300 3 0 0 0 0 0 0 400 4 0 0 0 0 0 0\n"
+    )
+    assert parse_proc_net_dev(net_dev) == {"lo": (100, 200), "br0": (300, 400)}
+
+
+def test_summarize_samples():
+    samples = [
+        Sample(0, 100, 1000, 50000, 1500000, 0, ((0, 0), None)),
+        Sample(1, 150, 1050, 61500, 600000, 0x4, ((1000, 500), None)),
+        Sample(2, 200, 1100, 55000, 1500000, 0, ((2000, 1000), None)),
+    ]
+    assert summarize_samples(samples, ["br0", "wlan0"]) == dict(
+        cpu_percent=100.0,
+        max_temp_c=61.5,
+        min_freq_mhz=600,
+        throttled=True,
+        br0_rx_bps=8000,
+        br0_tx_bps=4000,
+        wlan0_rx_bps=None,
+        wlan0_tx_bps=None,
+    )
+    assert [key for key, _ in summary_fields(["br0", "wlan0"])] == list(
+        summarize_samples(samples, ["br0", "wlan0"])
+    )
+
+
+# The sampler keeps a fixed number of samples and summarizes those in a window.
+@pytest.mark.skipif(not os.path.exists("/proc/stat"), reason="Requires /proc.")
+def test_sampler():
+    now = [0.0]
+    sampler = TelemetrySampler(capacity=3, interfaces=["lo"], clock=lambda: now[0])
+    for now[0] in range(5):
+        sampler.samples.append(sampler.sample())
+    assert [sample.time for sample in sampler.samples] == [2, 3, 4]
+    assert sampler.summarize(0, 2) is None
+    assert sampler.summarize(2, 4)["lo_rx_bps"] is not None
+    assert sampler.status()["samples"] == 3
+
+
+class FakeSampler:
+    # Provide telemetry for only the first run.
+    def summarize(self, start, end):
+        if start == default_start_time + 1:
+            return dict(cpu_percent=50.0, throttled=False)
+        return None
+
+
+# The log index annotates each run with its telemetry, which appears in ``/csv`` and persists in a journal.
+def test_annotation(tmp_path, monkeypatch):
+    monkeypatch.setattr(webperf3, "log_dir", tmp_path)
+    monkeypatch.setattr(webperf3, "log_index", webperf3.LogIndex())
+    monkeypatch.setattr(webperf3, "telemetry_sampler", FakeSampler())
+    monkeypatch.setattr(webperf3, "telemetry_interfaces", [])
+    write_synthetic_logs(tmp_path, 1, 3, error_rate=0)
+
+    rows = list(csv.reader(StringIO(webperf3.export_csv(1))))
+    assert rows[0][5:] == [
+        "CPU use (%)",
+        "Max temperature (C)",
+        "Min CPU clock (MHz)",
+        "Throttled",
+    ]
+    assert rows[1][5:] == ["50.0", "", "", "False"]
+    assert rows[2][5:] == ["", "", "", ""]
+
+    journal_path = tmp_path / "telemetry.jsonl"
+    webperf3.log_index.save_telemetry(journal_path)
+    loaded = webperf3.LogIndex()
+    loaded.load_telemetry(journal_path)
+    assert loaded.run_telemetry(webperf3.starting_port, default_start_time + 1) == dict(
+        cpu_percent=50.0, throttled=False
+    )
+
+
+class CountingSampler:
+    # Provide a different summary for each call.
+    def __init__(self):
+        self.calls = 0
+
+    def summarize(self, start, end):
+        self.calls += 1
+        return dict(cpu_percent=float(self.calls))
+
+
+# Runs on different ports which start in the same second have their own telemetry, which is pruned along with their runs.
+def test_telemetry_per_port(tmp_path, monkeypatch):
+    monkeypatch.setattr(webperf3, "log_dir", tmp_path)
+    monkeypatch.setattr(webperf3, "log_index", webperf3.LogIndex())
+    sampler = CountingSampler()
+    monkeypatch.setattr(webperf3, "telemetry_sampler", sampler)
+
+    def write_log(port, timestamps):
+        (tmp_path / f"port-{port}.json").write_text(
+            "".join(
+                format_iperf3_block(iperf3_result(timestamp, 1e7, 2e7, "UE", 10, port))
+                for timestamp in timestamps
+            )
+        )
+
+    port = webperf3.starting_port
+    write_log(port, [100, 200])
+    write_log(port + 1, [100])
+    index = webperf3.log_index
+    index.read_all(2)
+    assert index.run_telemetry(port, 100) != index.run_telemetry(port + 1, 100)
+    assert len(index.telemetry) == 3
+    # Another process follows the journal.
+    journal_path = tmp_path / "telemetry.jsonl"
+    index.save_telemetry(journal_path)
+    reader = webperf3.LogIndex()
+    reader.load_telemetry(journal_path)
+    assert reader.telemetry == index.telemetry
+
+    # A replaced log keeps the telemetry of runs it still contains.
+    kept = index.run_telemetry(port, 100)
+    write_log(port, [100])
+    index.read_all(2)
+    assert index.run_telemetry(port, 100) == kept
+    assert index.run_telemetry(port, 200) is None
+    # A removed log loses its telemetry.
+    (tmp_path / f"port-{port + 1}.json").unlink()
+    index.read_all(2)
+    assert list(index.telemetry) == [index.telemetry_key(port, 100)]
+    # Pruning rewrites the journal; new telemetry is appended to it.
+    index.save_telemetry(journal_path)
+    reader.load_telemetry(journal_path)
+    assert reader.telemetry == index.telemetry
+    write_log(port, [100, 300])
+    index.read_all(2)
+    index.save_telemetry(journal_path)
+    reader.load_telemetry(journal_path)
+    assert reader.telemetry == index.telemetry
+    assert len(journal_path.read_text().splitlines()) == 2
@@ -9,7 +9,9 @@
 #
 # Standard library
 # ----------------
+import asyncio
 from pathlib import Path
+import random
 
 
 # Third-party imports
@@ -18,10 +20,17 @@ from pathlib import Path
 #
 # Local application imports
 # -------------------------
+from webperf3 import webperf3
+from webperf3.synthetic import generate_log_blocks, write_synthetic_logs
 from webperf3.webperf3 import (
+    BroadcastHub,
+    LogIndex,
     extract_iperf3_performance,
     read_iperf3_json_log,
     read_all_iperf3_json_log,
+    read_all_iperf3_logs,
+    resync_message,
+    update_message,
 )
 
 
@@ -78,6 +87,160 @@ def test_5():
     ]
 
 
+# A stand-in for a websocket connection, which records what it sends. If ``stalled``, sends never complete.
+class FakeWebSocket:
+    def __init__(self, stalled=False, subprotocol=None):
+        self.stalled = stalled
+        self.subprotocol = subprotocol
+        self.sent = []
+        self.close_code = None
+
+    async def send(self, message):
+        if self.stalled:
+            await asyncio.Event().wait()
+        self.sent.append(message)
+
+    async def close(self, code=1000, reason=""):
+        self.close_code = code
+
+
+# Wait until ``condition()`` is true, failing after a few seconds.
+async def wait_until(condition, timeout=5):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, "Timed out."
+        await asyncio.sleep(0.01)
+
+
+# Run ``test(hub, tasks)``, then cancel any client tasks it leaves running, so that a failing test reports a failure instead of hanging.
+def run_hub_test(test, **kwargs):
+    async def run():
+        hub = BroadcastHub(**kwargs)
+        tasks = []
+        try:
+            await asyncio.wait_for(test(hub, tasks), 10)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    asyncio.run(run())
+
+
+# Each client receives the initial message and all published messages; a client whose queue overflows receives a resync instead of its backlog.
+def test_broadcast_hub():
+    async def test(hub, tasks):
+        fast = FakeWebSocket()
+        tasks.append(asyncio.create_task(hub.serve(fast)))
+        await wait_until(lambda: fast.sent == [update_message])
+        # Publish a message, then let the client send it.
+        hub.publish("1")
+        await wait_until(lambda: len(fast.sent) == 2)
+        assert fast.sent == [update_message, "1"]
+
+        # Publish more messages than the queue holds, without giving the client time to send them.
+        for message in "234":
+            hub.publish(message)
+        hub.close()
+        await tasks[0]
+        assert fast.sent == [update_message, "1", resync_message]
+        assert not hub.clients
+
+    run_hub_test(test, queue_size=2, send_timeout=0.1)
+
+
+# A stalled client is disconnected without delaying other clients.
+def test_broadcast_hub_stalled():
+    async def test(hub, tasks):
+        stalled = FakeWebSocket(stalled=True)
+        ok = FakeWebSocket()
+        tasks.append(asyncio.create_task(hub.serve(stalled)))
+        tasks.append(asyncio.create_task(hub.serve(ok)))
+        await wait_until(lambda: ok.sent == [update_message])
+        hub.publish("1")
+        await wait_until(lambda: len(ok.sent) == 2)
+        assert ok.sent == [update_message, "1"]
+
+        await tasks[0]
+        assert stalled.close_code == 1011
+        assert list(hub.clients) == [ok]
+        hub.close()
+        await tasks[1]
+
+    run_hub_test(test, send_timeout=0.1)
+
+
+# Binary clients receive the binary form of a message, when there is one, and the latest snapshot when they connect.
+def test_broadcast_hub_binary():
+    async def test(hub, tasks):
+        text = FakeWebSocket()
+        binary = FakeWebSocket(subprotocol="webperf3.msgpack")
+        tasks.append(asyncio.create_task(hub.serve(text)))
+        tasks.append(asyncio.create_task(hub.serve(binary)))
+        await wait_until(lambda: binary.sent == [update_message])
+        assert hub.binary_clients == {binary}
+        hub.publish("1", b"1")
+        hub.publish("2")
+        await wait_until(lambda: len(binary.sent) == 3 and len(text.sent) == 3)
+        assert text.sent == [update_message, "1", "2"]
+        assert binary.sent == [update_message, b"1", "2"]
+
+        hub.last_snapshot = b"snapshot"
+        late = FakeWebSocket(subprotocol="webperf3.msgpack")
+        tasks.append(asyncio.create_task(hub.serve(late)))
+        await wait_until(lambda: late.sent == [b"snapshot"])
+        hub.close()
+        await asyncio.gather(*tasks)
+        assert not hub.binary_clients
+
+    run_hub_test(test)
+
+
+# The log index produces the same results as reading the logs directly, both initially and as the logs grow; a persisted index is reused.
+def test_log_index(tmp_path, monkeypatch):
+    monkeypatch.setattr(webperf3, "log_dir", tmp_path)
+    write_synthetic_logs(tmp_path, 3, 10, error_rate=0.2)
+    index = LogIndex()
+
+    def check(index):
+        assert index.read_all(4) == read_all_iperf3_logs(3)
+        for server_index in range(3):
+            assert index.latest(server_index) == extract_iperf3_performance(
+                read_iperf3_json_log(webperf3.iperf3_log_file_name(server_index))
+            )
+        assert index.latest(3) is None
+
+    check(index)
+    # Append runs, including errors, to a log.
+    rng = random.Random(1)
+    with open(webperf3.iperf3_log_file_name(1), "a") as f:
+        f.write("".join(generate_log_blocks(rng, 5, error_rate=0.5)))
+    check(index)
+
+    # A persisted index doesn't need to re-parse unchanged logs.
+    index_path = tmp_path / "index.json"
+    index.save(index_path)
+    loaded = LogIndex()
+    loaded.load(index_path)
+    loaded.read_all(3)
+    assert not loaded.dirty
+    check(loaded)
+    # A replaced log is re-parsed.
+    webperf3.iperf3_log_file_name(0).write_text("")
+    check(loaded)
+
+    # ``refresh`` returns only the runs parsed since it last returned, including those parsed by requests.
+    assert loaded.refresh(3) == []
+    port = webperf3.starting_port + 1
+    before = [row for row in read_all_iperf3_logs(3) if row[0] == port]
+    with open(webperf3.iperf3_log_file_name(1), "a") as f:
+        f.write("".join(generate_log_blocks(rng, 5, port=port)))
+    loaded.latest(1)
+    after = [row for row in read_all_iperf3_logs(3) if row[0] == port]
+    assert loaded.refresh(3) == after[len(before) :]
+    assert loaded.refresh(3) == []
+
+
 # For simple interactive testing.
 if False:
     from webperf3.webperf3 import export_csv
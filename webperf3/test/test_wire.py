@@ -0,0 +1,85 @@
+# *********************************************
+# |docname| - Unit tests for `../webperf3/wire.py`
+# *********************************************
+#
+#
+# Imports
+# =======
+# These are listed in the order prescribed by `PEP 8`_.
+#
+# Standard library
+# ----------------
+import asyncio
+import json
+from pathlib import Path
+
+# Third-party imports
+# -------------------
+import pytest
+import websockets
+
+# Local application imports
+# -------------------------
+from webperf3.loadtest import WebPerf3Instance
+from webperf3.synthetic import format_iperf3_block, iperf3_result
+from webperf3.wire import (
+    decode_snapshot,
+    encode_alert,
+    encode_snapshot,
+    msgpack_subprotocol,
+)
+
+
+# Tests
+# =====
+# A snapshot round-trips to the same rows as ``/table``.
+def test_snapshot():
+    msgpack = pytest.importorskip("msgpack")
+    rows = [
+        [1647312652, 2e7, 1e7, "UE 1", {"cpu_percent": 42.0}],
+        None,
+        [None, None, None, None, None],
+        [1647312700, None, 3.5e6, None, None],
+    ]
+    data = encode_snapshot(rows)
+    assert decode_snapshot(data) == rows
+    # Numeric columns are packed arrays, rather than a value per row.
+    assert len(msgpack.unpackb(data)["timestamp"]) == 8 * len(rows)
+    # For a full table, it's smaller than JSON.
+    rows = [
+        [1647312652 + i, 5588500339.161147 + i, 6218445861.06448, f"UE {i}", None]
+        for i in range(50)
+    ]
+    assert len(encode_snapshot(rows)) < 0.7 * len(json.dumps(rows))
+    assert msgpack.unpackb(encode_alert({"id": 1})) == dict(
+        type="alert", alert={"id": 1}
+    )
+
+
+# A client which asks for binary messages receives snapshots; other clients receive text, as before. Both are compressed.
+def test_binary_clients(tmp_path: Path):
+    pytest.importorskip("msgpack")
+    log_path = tmp_path / "port-5201.json"
+    log_path.write_text(
+        format_iperf3_block(iperf3_result(1647312652, 2e7, 1e7, "UE 1"))
+    )
+
+    async def run(instance):
+        async with websockets.connect(
+            instance.ws_url, subprotocols=[msgpack_subprotocol]
+        ) as binary, websockets.connect(instance.ws_url) as text:
+            assert binary.subprotocol == msgpack_subprotocol
+            assert text.subprotocol is None
+            assert [e.name for e in binary.extensions] == ["permessage-deflate"]
+            # No snapshot has been published yet, so the greeting is text.
+            assert await binary.recv() == "new data"
+            assert await text.recv() == "new data"
+            with open(log_path, "a") as f:
+                f.write(format_iperf3_block(iperf3_result(1647312700, 3e7, 1e7)))
+            snapshot = await asyncio.wait_for(binary.recv(), 10)
+            assert await asyncio.wait_for(text.recv(), 10) == "new data"
+            return snapshot
+
+    with WebPerf3Instance(1, tmp_path) as instance:
+        snapshot = asyncio.run(run(instance))
+        assert decode_snapshot(snapshot) == json.loads(instance.get("/table"))
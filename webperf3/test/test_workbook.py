@@ -0,0 +1,60 @@
+# *************************************************
+# |docname| - Unit tests for `../webperf3/workbook.py`
+# *************************************************
+#
+#
+# Imports
+# =======
+# These are listed in the order prescribed by `PEP 8`_.
+#
+# Standard library
+# ----------------
+import re
+import time
+import zipfile
+
+# Third-party imports
+# -------------------
+import pytest
+
+# Local application imports
+# -------------------------
+from webperf3 import webperf3
+from webperf3.synthetic import write_synthetic_logs
+from webperf3.workbook import ExcelDates, export_xlsx
+
+
+# Tests
+# =====
+# Dates match the conversion used by ``export_csv``, including across a daylight saving transition.
+def test_excel_dates():
+    excel_date = ExcelDates()
+    for timestamp in range(1647312652, 1647312652 + 86400 * 200, 3571):
+        assert excel_date(timestamp) == pytest.approx(
+            (timestamp + time.localtime(timestamp).tm_gmtoff) / 86400 + 25569
+        )
+
+
+# The workbook has a combined sheet plus one per port, with a row per run.
+def test_export_xlsx(tmp_path, monkeypatch):
+    pytest.importorskip("xlsxwriter")
+    monkeypatch.setattr(webperf3, "log_dir", tmp_path)
+    monkeypatch.setattr(webperf3, "log_index", webperf3.LogIndex())
+    write_synthetic_logs(tmp_path, 2, 15, error_rate=0.2)
+    num_runs = len(webperf3.export_csv(2).splitlines()) - 1
+
+    path = tmp_path / "export.xlsx"
+    export_xlsx(2, path)
+    with zipfile.ZipFile(path) as z:
+        workbook = z.read("xl/workbook.xml").decode()
+        assert re.findall(r'<sheet name="([^"]+)"', workbook) == [
+            "All ports",
+            "Port 5201",
+            "Port 5202",
+        ]
+        num_rows = [
+            z.read(f"xl/worksheets/sheet{i}.xml").decode().count("<row ") - 1
+            for i in (1, 2, 3)
+        ]
+    assert num_rows[0] == num_runs
+    assert num_rows[1] + num_rows[2] == num_runs
@@ -1,8 +1,21 @@
 # *********************************************
 # |docname| - Execute `webperf3.py` as a module
 # *********************************************
-from sys import argv
+# ``python -m webperf3 replay ...`` runs the `replay tool <replay.py>`, ``python -m webperf3 collect ...`` runs the `federation collector <federation.py>`, and ``python -m webperf3 capacity ...`` runs the `capacity benchmark <capacity.py>`; otherwise, this runs the webserver.
+import sys
 from .webperf3 import main
 
 if __name__ == "__main__":
-    main(argv)
+    if len(sys.argv) > 1 and sys.argv[1] == "replay":
+        from .replay import main as replay_main
+
+        sys.exit(replay_main(sys.argv[1:]))
+    if len(sys.argv) > 1 and sys.argv[1] == "collect":
+        from .federation import main as collect_main
+
+        sys.exit(collect_main(sys.argv[1:]))
+    if len(sys.argv) > 1 and sys.argv[1] == "capacity":
+        from .capacity import main as capacity_main
+
+        sys.exit(capacity_main(sys.argv[1:]))
+    main(sys.argv)
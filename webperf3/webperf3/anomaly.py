@@ -0,0 +1,296 @@
+# ***********************************************
+# |docname| - Detect anomalies in iPerf3 results
+# ***********************************************
+# The dashboard highlights rows which changed, but doesn't say when a UE's throughput falls well below its recent norm. This module watches each newly ingested run and raises an alert when:
+#
+# ``drop``
+#   A rate is far below its rolling baseline.
+# ``stall``
+#   A rate is (nearly) zero.
+# ``missing-send``, ``missing-receive``
+#   The run lacks a direction, such as a run without ``--bidir`` (see ``no_bidir_iperf3_output.json``), which has no send rate. Since a port may run one-way tests on purpose, this is raised once, then not again for that port until a run has the direction.
+#
+# Baselines are kept separately for each port and for each UE (the client's ``--extra-data``), for each direction, since a UE may move between ports. Each baseline is an exponentially weighted moving average (EWMA) of the rate, plus an exponentially weighted mean absolute deviation from that average; the latter stands in for the median absolute deviation (MAD), which can't be updated in O(1) time. A rate is a drop when it's more than ``threshold`` (scaled) deviations below the average.
+#
+# The `watcher <webperf3.py>` pushes each alert to websocket clients as a JSON message, ``{"alert": {...}}``; the `alert store`_ records alerts in the log directory for ``/alerts`` to query.
+#
+# .. contents:: Table of Contents
+#   :local:
+#   :depth: 2
+#
+#
+# Imports
+# =======
+# These are listed in the order prescribed by `PEP 8`_.
+#
+# Standard library
+# ----------------
+from collections import deque
+import itertools
+import json
+import os
+from pathlib import Path
+from threading import Lock
+import time
+from typing import Any, Deque, Dict, Iterable, List, Optional, Set, Tuple
+
+# Third-party imports
+# -------------------
+# None.
+#
+# Local application imports
+# -------------------------
+# None.
+
+
+# Messages
+# ========
+# Format an alert as a websocket message.
+def alert_message(alert: Dict[str, Any]) -> str:
+    return json.dumps(dict(alert=alert))
+
+
+# Return True if ``message`` is an alert, rather than a notification to fetch the table.
+def is_alert_message(message: Any) -> bool:
+    return isinstance(message, str) and message.startswith('{"alert"')
+
+
+# Baselines
+# =========
+# The factor relating the mean absolute deviation of normally-distributed data to its standard deviation is sqrt(pi/2); this scales deviations to match the usual thresholds for standard deviations.
+deviation_scale = 1.2533
+
+
+class RollingBaseline:
+    def __init__(self, alpha: float) -> None:
+        # The weight given to each new value.
+        self.alpha = alpha
+        # The number of values seen.
+        self.count = 0
+        # The EWMA of the values.
+        self.mean = 0.0
+        # The EWMA of the absolute deviation of each value from ``mean``.
+        self.deviation = 0.0
+
+    def update(self, value: float) -> None:
+        if self.count == 0:
+            self.mean = value
+        else:
+            self.deviation += self.alpha * (abs(value - self.mean) - self.deviation)
+            self.mean += self.alpha * (value - self.mean)
+        self.count += 1
+
+
+# Detector
+# ========
+class AnomalyDetector:
+    def __init__(
+        self,
+        # The weight of each new run in a baseline; smaller values give longer memory.
+        alpha: float = 0.2,
+        # A drop is a rate more than this many scaled deviations below its baseline.
+        threshold: float = 3,
+        # A drop is also at least this fraction of its baseline, so that a very steady baseline doesn't flag small changes.
+        min_drop: float = 0.2,
+        # The number of runs a baseline needs before it can flag drops.
+        warmup: int = 5,
+        # A rate at or below this (bps) is a stall.
+        stall_bps: float = 1e3,
+    ):
+        self.alpha = alpha
+        self.threshold = threshold
+        self.min_drop = min_drop
+        self.warmup = warmup
+        self.stall_bps = stall_bps
+        self.baselines: Dict[Tuple, RollingBaseline] = {}
+        # The timestamp of the last run processed from each port, so that each run is processed once.
+        self.last_timestamp: Dict[int, int] = {}
+        # The ``(port, direction)`` of each direction reported missing, until a run on that port has it again.
+        self.missing: Set[Tuple[int, str]] = set()
+        # True after the first call to ``ingest``.
+        self.primed = False
+        self.lock = Lock()
+
+    def _baseline(self, key: Tuple) -> RollingBaseline:
+        baseline = self.baselines.get(key)
+        if baseline is None:
+            baseline = self.baselines[key] = RollingBaseline(self.alpha)
+        return baseline
+
+    # Process one run, returning its alerts.
+    def process(
+        self,
+        port: int,
+        timestamp: int,
+        send_bps: Optional[float],
+        receive_bps: Optional[float],
+        name: Optional[str],
+    ) -> List[Dict[str, Any]]:
+        alerts = []
+
+        def alert(kind: str, direction: str, **kwargs: Any) -> None:
+            ue = f" ({name})" if name else ""
+            alerts.append(
+                dict(
+                    kind=kind,
+                    port=port,
+                    ue=name,
+                    timestamp=timestamp,
+                    direction=direction,
+                    message=f"Port {port}{ue}: {kwargs.pop('text')}.",
+                    **kwargs,
+                )
+            )
+
+        for direction, value in (("send", send_bps), ("receive", receive_bps)):
+            if value is None:
+                if (port, direction) not in self.missing:
+                    self.missing.add((port, direction))
+                    alert(
+                        f"missing-{direction}",
+                        direction,
+                        text=f"no {direction} rate",
+                    )
+                continue
+            self.missing.discard((port, direction))
+            if value <= self.stall_bps:
+                # Don't let a stall drag down the baseline.
+                alert("stall", direction, value=value, text=f"{direction} stalled")
+                continue
+            keys: List[Tuple] = [("port", port, direction)]
+            if name:
+                keys.append(("ue", name, direction))
+            # Report at most one drop per direction, preferring the UE's baseline, since it follows the UE across ports.
+            dropped = False
+            for key in reversed(keys):
+                baseline = self._baseline(key)
+                if not dropped and baseline.count >= self.warmup:
+                    limit = min(
+                        baseline.mean
+                        - self.threshold * deviation_scale * baseline.deviation,
+                        baseline.mean * (1 - self.min_drop),
+                    )
+                    if value < limit:
+                        dropped = True
+                        alert(
+                            "drop",
+                            direction,
+                            value=value,
+                            baseline=baseline.mean,
+                            baseline_of=key[0],
+                            text=f"{direction} rate {value / 1e6:.1f} Mbps is below the usual {baseline.mean / 1e6:.1f} Mbps",
+                        )
+                baseline.update(value)
+        return alerts
+
+    # Process the runs in ``rows`` (as returned by ``LogIndex.refresh`` or ``LogIndex.read_all`` in `webperf3.py`), returning their alerts. The watcher passes only newly parsed runs, so each run costs O(1); runs no newer than those already processed from their port are skipped. If ``train`` is True, only update the baselines. The first call always trains, since it sees the history present at startup, which shouldn't raise alerts.
+    def ingest(
+        self,
+        rows: Iterable[
+            Tuple[int, Optional[int], Optional[float], Optional[float], Optional[str]]
+        ],
+        train: bool = False,
+    ) -> List[Dict[str, Any]]:
+        alerts = []
+        with self.lock:
+            train = train or not self.primed
+            self.primed = True
+            for port, timestamp, send_bps, receive_bps, name in rows:
+                # Skip runs which failed (these have no timestamp) or were already processed.
+                if not timestamp or timestamp <= self.last_timestamp.get(port, 0):
+                    continue
+                self.last_timestamp[port] = timestamp
+                run_alerts = self.process(port, timestamp, send_bps, receive_bps, name)
+                if not train:
+                    alerts += run_alerts
+        return alerts
+
+
+# Alert store
+# ===========
+# Alerts are appended to a JSON Lines file, so that they survive a restart; the most recent ``capacity`` alerts are also kept in memory for queries. Only these can be queried, so once the file holds twice as many, it's compacted to just these.
+class AlertStore:
+    def __init__(self, capacity: int = 1000) -> None:
+        self.alerts: Deque[Dict[str, Any]] = deque(maxlen=capacity)
+        self.next_id = 1
+        # The number of alerts in the file.
+        self.file_size = 0
+        # Alerts are added by the watcher and queried by the webserver's threads.
+        self.lock = Lock()
+
+    # Load the alerts in ``path``, if it exists.
+    def load(self, path: Path) -> None:
+        alerts: Deque[Dict[str, Any]] = deque(maxlen=self.alerts.maxlen)
+        file_size = 0
+        try:
+            with open(path) as f:
+                for line in f:
+                    file_size += 1
+                    try:
+                        alerts.append(json.loads(line))
+                    except ValueError:
+                        # Skip a line partially written by a crash.
+                        continue
+        except FileNotFoundError:
+            return
+        with self.lock:
+            self.alerts = alerts
+            self.next_id = alerts[-1]["id"] + 1 if alerts else 1
+            self.file_size = file_size
+
+    # The id of the latest alert, or 0 if there are none.
+    @property
+    def last_id(self) -> int:
+        return self.next_id - 1
+
+    # Load ``path`` if another process (the ingester) recorded alerts since it was last loaded; ``last_id`` is the id of the latest alert it recorded. This touches the file only when there's something new to read.
+    def reload_if_behind(self, path: Path, last_id: int) -> None:
+        if last_id != self.last_id:
+            self.load(path)
+
+    # Number ``alerts``, record them in memory and in ``path``, and return them.
+    def add(
+        self, alerts: List[Dict[str, Any]], path: Optional[Path] = None
+    ) -> List[Dict[str, Any]]:
+        if not alerts:
+            return alerts
+        now = time.time()
+        with self.lock:
+            for alert in alerts:
+                alert["id"] = self.next_id
+                alert["detected"] = now
+                self.next_id += 1
+                self.alerts.append(alert)
+            if path:
+                assert self.alerts.maxlen
+                if self.file_size + len(alerts) > 2 * self.alerts.maxlen:
+                    # Write to a temporary file then rename it, so that a crash doesn't lose the alerts.
+                    temp_path = path.with_suffix(".tmp")
+                    temp_path.write_text(
+                        "".join(json.dumps(alert) + "\n" for alert in self.alerts)
+                    )
+                    os.replace(temp_path, path)
+                    self.file_size = len(self.alerts)
+                else:
+                    with open(path, "a") as f:
+                        f.writelines(json.dumps(alert) + "\n" for alert in alerts)
+                    self.file_size += len(alerts)
+        return alerts
+
+    # Return up to ``limit`` of the most recent alerts with an id greater than ``since``, optionally only those for ``port`` or ``ue``, oldest first.
+    def query(
+        self,
+        since: int = 0,
+        port: Optional[int] = None,
+        ue: Optional[str] = None,
+        limit: int = 100,
+    ) -> List[Dict[str, Any]]:
+        with self.lock:
+            matches = (
+                alert
+                for alert in reversed(self.alerts)
+                if alert["id"] > since
+                and (port is None or alert["port"] == port)
+                and (ue is None or alert["ue"] == ue)
+            )
+            return list(reversed(list(itertools.islice(matches, limit))))
@@ -0,0 +1,256 @@
+# *****************************************************************
+# |docname| - Micro-benchmarks for iPerf3 log parsing and exporting
+# *****************************************************************
+# This times the functions which do the bulk of the work when serving results, plus HTTP round trips for ``/table`` and ``/csv`` to a local webserver, using `synthetic logs <synthetic.py>` of ``--ports`` log files with ``--runs`` runs each (intermixed with error output). To use:
+#
+# .. code-block:: text
+#
+#   python -m webperf3.benchmark --save baseline.json
+#   ...make changes...
+#   python -m webperf3.benchmark --compare baseline.json
+#
+# The comparison re-runs the suite using the configuration stored in the baseline, then exits with a non-zero status if any benchmark's median time grew by more than ``--tolerance``. Baselines are only comparable when produced on the same class of machine; the ``platform`` section of a baseline records the machine which produced it.
+#
+# .. contents:: Table of Contents
+#   :local:
+#   :depth: 2
+#
+#
+# Imports
+# =======
+# These are listed in the order prescribed by `PEP 8`_.
+#
+# Standard library
+# ----------------
+import argparse
+import json
+import os
+from pathlib import Path
+import platform
+import statistics
+import sys
+from tempfile import TemporaryDirectory
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Third-party imports
+# -------------------
+# None.
+#
+# Local application imports
+# -------------------------
+from . import webperf3
+from .synthetic import write_synthetic_logs
+
+
+# Statistics
+# ==========
+# Return the ``fraction`` (from 0 to 1) percentile of ``values``, interpolating between values.
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return float("nan")
+    position = (len(ordered) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+# Summarize a list of times, in seconds.
+def summarize(times: List[float]) -> Dict[str, float]:
+    return {
+        "min": min(times),
+        "median": statistics.median(times),
+        "p99": percentile(times, 0.99),
+        "mean": statistics.mean(times),
+        "count": len(times),
+    }
+
+
+# Call ``func`` ``repeat`` times, returning a summary of the time taken by each call. If given, call ``setup`` before each call, outside the timed region.
+def time_calls(
+    func: Callable[[], Any],
+    repeat: int,
+    setup: Optional[Callable[[], Any]] = None,
+) -> Dict[str, float]:
+    # Warm up, so that the first call's imports and OS file caching don't skew the results.
+    func()
+    times = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return summarize(times)
+
+
+# The suite
+# =========
+# Run all benchmarks, returning a baseline: a dict of the configuration used, the platform the suite ran on, and the results of each benchmark.
+def run_suite(
+    # The number of ports (log files) to generate.
+    ports: int = 10,
+    # The number of runs in each log file.
+    runs: int = 100,
+    # The fraction of runs which produce an error.
+    error_rate: float = 0.1,
+    # The number of times to time each benchmark.
+    repeat: int = 20,
+    # The seed for the synthetic log generator.
+    seed: int = 0,
+) -> Dict[str, Any]:
+    config = dict(
+        ports=ports, runs=runs, error_rate=error_rate, repeat=repeat, seed=seed
+    )
+    # The functions under test use these globals; restore them when done.
+    old_log_dir = webperf3.log_dir
+    old_num_servers = webperf3.num_servers
+    old_log_index = webperf3.log_index
+    with TemporaryDirectory() as temp_dir:
+        try:
+            webperf3.log_dir = Path(temp_dir)
+            webperf3.num_servers = ports
+            paths = write_synthetic_logs(
+                webperf3.log_dir, ports, runs, error_rate, seed, webperf3.starting_port
+            )
+            benchmarks: Dict[str, Callable[[], Any]] = {
+                "read_iperf3_json_log": lambda: webperf3.read_iperf3_json_log(paths[0]),
+                "read_all_iperf3_json_log": lambda: webperf3.read_all_iperf3_json_log(
+                    paths[0]
+                ),
+                "read_all_iperf3_logs": lambda: webperf3.read_all_iperf3_logs(ports),
+            }
+            results = {
+                name: time_calls(func, repeat) for name, func in benchmarks.items()
+            }
+
+            # These read through the log index, so time them twice: cold, as after a restart, parsing every log; then warm, as in steady state, when the index is already up to date.
+            def reset_log_index() -> None:
+                webperf3.log_index = webperf3.LogIndex()
+
+            indexed: Dict[str, Callable[[], Any]] = {
+                "export_csv": lambda: webperf3.export_csv(ports),
+                # This times only the handler for ``/table``; the ``GET /table`` benchmark below includes routing and webserver overhead.
+                "create_table": webperf3.create_table,
+            }
+            for name, func in indexed.items():
+                results[f"{name} (cold)"] = time_calls(func, repeat, reset_log_index)
+            for name, func in indexed.items():
+                results[f"{name} (warm)"] = time_calls(func, repeat)
+            # Time round trips to a local instance serving the same logs. Import this here, since the load tester imports this module.
+            from .loadtest import WebPerf3Instance
+
+            with WebPerf3Instance(ports, webperf3.log_dir) as instance:
+                results["GET /table"] = time_calls(
+                    lambda: instance.get("/table"), repeat
+                )
+                results["GET /csv"] = time_calls(lambda: instance.get("/csv"), repeat)
+        finally:
+            webperf3.log_dir = old_log_dir
+            webperf3.num_servers = old_num_servers
+            webperf3.log_index = old_log_index
+
+    return {
+        "config": config,
+        "platform": {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "processor": platform.processor(),
+            "cpu_count": os.cpu_count(),
+        },
+        "results": results,
+    }
+
+
+# Compare
+# =======
+# Compare the ``current`` results with a ``baseline``, both produced by `run_suite`. Return a list of (name, baseline median, current median, ratio, is regression) for each benchmark in the baseline.
+def compare(
+    baseline: Dict[str, Any],
+    current: Dict[str, Any],
+    # The fractional slowdown allowed before a benchmark is reported as a regression.
+    tolerance: float = 0.1,
+) -> List[Tuple[str, float, float, float, bool]]:
+    comparison = []
+    for name, base in baseline["results"].items():
+        cur = current["results"].get(name)
+        if cur is None:
+            continue
+        ratio = cur["median"] / base["median"]
+        comparison.append(
+            (name, base["median"], cur["median"], ratio, ratio > 1 + tolerance)
+        )
+    return comparison
+
+
+# Main
+# ====
+def print_results(results: Dict[str, Any]) -> None:
+    print(f"{'Benchmark':<26} {'min (ms)':>10} {'median (ms)':>12} {'p99 (ms)':>10}")
+    for name, r in results["results"].items():
+        print(
+            f"{name:<26} {r['min'] * 1e3:>10.3f} {r['median'] * 1e3:>12.3f} {r['p99'] * 1e3:>10.3f}"
+        )
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m webperf3.benchmark",
+        description="Benchmark iPerf3 log parsing and exporting using synthetic logs.",
+    )
+    parser.add_argument("--ports", type=int, default=10, help="Number of log files.")
+    parser.add_argument("--runs", type=int, default=100, help="Runs per log file.")
+    parser.add_argument(
+        "--error-rate", type=float, default=0.1, help="Fraction of runs with errors."
+    )
+    parser.add_argument("--repeat", type=int, default=20, help="Timings per benchmark.")
+    parser.add_argument("--seed", type=int, default=0, help="Random number seed.")
+    parser.add_argument("--save", type=Path, help="Save the results to this JSON file.")
+    parser.add_argument(
+        "--compare",
+        type=Path,
+        help="Compare with the baseline in this JSON file, using its configuration.",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.1,
+        help="Fractional slowdown allowed by --compare before reporting a regression.",
+    )
+    args = parser.parse_args(argv)
+
+    baseline = None
+    config = dict(
+        ports=args.ports,
+        runs=args.runs,
+        error_rate=args.error_rate,
+        repeat=args.repeat,
+        seed=args.seed,
+    )
+    if args.compare:
+        baseline = json.loads(args.compare.read_text())
+        config = baseline["config"]
+
+    results = run_suite(**config)
+    print_results(results)
+    if args.save:
+        args.save.write_text(json.dumps(results, indent=4))
+        print(f"Saved results to {args.save}.")
+
+    if baseline is not None:
+        print(f"\nComparison with {args.compare}:")
+        regressed = False
+        for name, base, cur, ratio, is_regression in compare(
+            baseline, results, args.tolerance
+        ):
+            regressed |= is_regression
+            print(
+                f"{name:<26} {base * 1e3:>10.3f} -> {cur * 1e3:>10.3f} ms ({ratio:.2f}x){'  REGRESSION' if is_regression else ''}"
+            )
+        return 1 if regressed else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,402 @@
+# *****************************************************************
+# |docname| - Benchmark the capacity of the Pi's iPerf3 server pool
+# *****************************************************************
+# How many ports should ``rc.local`` pass to ``python -m webperf3``? Each iPerf3 server handles one client at a time, so every port added lets one more UE test concurrently -- until the Pi runs out of CPU and the concurrent tests start sharing, rather than adding, throughput. This benchmark finds that point on a single Linux box, with no network: all clients connect over the loopback interface. It:
+#
+# #.  Starts webperf3 with ``--ports`` iPerf3 servers, exactly as ``rc.local`` does (see `start iPerf3 servers <webperf3.py>`), logging to a temporary directory.
+# #.  For k = 1 to ``--ports``, runs k concurrent ``iperf3 --client 127.0.0.1 --bidir`` clients, one per port, for ``--time`` seconds, recording:
+#
+#     - The aggregate throughput (both directions, as received) of all k clients.
+#     - Per-port fairness, as `Jain's fairness index <https://en.wikipedia.org/wiki/Fairness_measure>`_: 1 when every client gets the same throughput, falling toward 1/k as one client dominates.
+#     - CPU saturation: the busy fraction of all CPUs (from ``/proc/stat``), and the CPU use of the webperf3 process itself.
+#     - The webperf3 pipeline's latency from each server's log write (the log file's modification time) to the websocket notification (notification latency), and to the run appearing in ``/table`` (ingestion latency).
+#
+# #.  Reports the knee: the largest k before adding a client stops adding throughput (the marginal gain falls below ``--min-gain`` of a lone client's throughput) or starts starving some clients (fairness falls below ``--min-fairness``).
+#
+# This requires Linux (for ``/proc``) and ``iperf3`` on the ``PATH``. Since the clients compete with the servers for the same CPUs, this measures what the Pi can serve when clients cost nothing; a knee measured with remote clients may come later, but not earlier. For example:
+#
+# .. code-block:: text
+#
+#   python -m webperf3 capacity --ports 8 --time 10 --save capacity.json
+#
+# .. contents:: Table of Contents
+#   :local:
+#   :depth: 2
+#
+#
+# Imports
+# =======
+# These are listed in the order prescribed by `PEP 8`_.
+#
+# Standard library
+# ----------------
+import argparse
+import asyncio
+import json
+import os
+from pathlib import Path
+import shutil
+import subprocess
+import sys
+from tempfile import TemporaryDirectory
+from threading import Event, Thread
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+# Third-party imports
+# -------------------
+import websockets
+
+# Local application imports
+# -------------------------
+from .anomaly import is_alert_message
+from .benchmark import summarize
+from .loadtest import WebPerf3Instance, read_process_usage
+from .telemetry import parse_proc_stat
+from .webperf3 import starting_port
+
+
+# Analysis
+# ========
+# Return Jain's fairness index of ``values``; an empty or all-zero list is perfectly fair.
+def jain_index(values: List[float]) -> float:
+    total = sum(values)
+    squares = sum(value * value for value in values)
+    return total * total / (len(values) * squares) if squares else 1.0
+
+
+# Return the throughput of a client's run, in bps: the rates received by the server (from the client) and by the client (from the server, in the reverse direction of a ``--bidir`` run), given the client's ``--json`` output. Return None if the run failed.
+def client_throughput(result: Dict[str, Any]) -> Optional[float]:
+    end = result.get("end", {})
+    if "error" in result or "sum_received" not in end:
+        return None
+    return sum(
+        end.get(key, {}).get("bits_per_second", 0)
+        for key in ("sum_received", "sum_received_bidir_reverse")
+    )
+
+
+# Find the knee, given the ``aggregate`` throughput and ``fairness`` measured with 1, 2, ... clients. Return ``(k, reason)``, where k is the number of clients at the knee; this is 0 if a lone client got no throughput.
+def find_knee(
+    aggregate: List[float],
+    fairness: List[float],
+    # Adding a client must raise the aggregate throughput by at least this fraction of a lone client's throughput.
+    min_gain: float = 0.1,
+    # The fairness index must stay at or above this.
+    min_fairness: float = 0.9,
+) -> Tuple[int, str]:
+    if not aggregate or aggregate[0] <= 0:
+        return 0, "a lone client got no throughput"
+    for k in range(2, len(aggregate) + 1):
+        gain = (aggregate[k - 1] - aggregate[k - 2]) / aggregate[0]
+        if gain < min_gain:
+            return (
+                k - 1,
+                f"adding client {k} changed the aggregate throughput by {gain:+.0%} of a lone client's",
+            )
+        if fairness[k - 1] < min_fairness:
+            return k - 1, f"with {k} clients, fairness fell to {fairness[k - 1]:.2f}"
+    return len(aggregate), f"throughput was still scaling with {len(aggregate)} clients"
+
+
+# Measurement
+# ===========
+# Return the ports (from ``ports``) which have a listening TCP socket, per ``/proc/net/tcp`` and ``tcp6``.
+def listening_ports(ports: List[int]) -> List[int]:
+    listening = set()
+    for name in ("tcp", "tcp6"):
+        try:
+            lines = Path(f"/proc/net/{name}").read_text().splitlines()[1:]
+        except FileNotFoundError:
+            continue
+        for line in lines:
+            # Fields are: entry number, local address:port (in hex), remote address:port, state (0A is LISTEN), ...
+            fields = line.split()
+            if fields[3] == "0A":
+                listening.add(int(fields[1].rsplit(":", 1)[1], 16))
+    return [port for port in ports if port in listening]
+
+
+# Watch the websocket of ``instance`` until ``stop`` is set. After each notification, fetch ``/table``, as the dashboard does. Record the wall-clock time of each notification in ``notifications``, and the time each port's latest run first appeared in the table in ``ingested``, as ``{port: {timestamp: time}}``.
+async def watch_pipeline(
+    instance: WebPerf3Instance,
+    starting_port: int,
+    stop: Event,
+    notifications: List[float],
+    ingested: Dict[int, Dict[int, float]],
+) -> None:
+    async with websockets.connect(instance.ws_url, open_timeout=60) as ws:  # type: ignore
+        while not stop.is_set():
+            try:
+                message = await asyncio.wait_for(ws.recv(), 0.5)
+            except asyncio.TimeoutError:
+                continue
+            # Alerts from the anomaly detector follow a notification; they aren't notifications themselves.
+            if is_alert_message(message):
+                continue
+            notifications.append(time.time())
+            table = json.loads(await asyncio.to_thread(instance.get, "/table"))
+            now = time.time()
+            for index, row in enumerate(table):
+                if row and row[0]:
+                    ingested.setdefault(starting_port + index, {}).setdefault(
+                        row[0], now
+                    )
+
+
+# Run one step of the benchmark: concurrent clients on each of ``ports``, for ``duration`` seconds. Return the step's results.
+def run_step(
+    instance: WebPerf3Instance,
+    ports: List[int],
+    duration: int,
+    settle_time: float,
+    notifications: List[float],
+    ingested: Dict[int, Dict[int, float]],
+) -> Dict[str, Any]:
+    assert instance.process
+    log_paths = [instance.log_dir / f"port-{port}.json" for port in ports]
+    start_mtimes = [path.stat().st_mtime if path.exists() else 0 for path in log_paths]
+    cpu_start = parse_proc_stat(Path("/proc/stat").read_text())
+    server_cpu_start = read_process_usage(instance.process.pid)[0]
+    start = time.monotonic()
+    start_timestamp = int(time.time())
+
+    clients = [
+        subprocess.Popen(
+            [
+                "iperf3",
+                "--client",
+                "127.0.0.1",
+                "--port",
+                str(port),
+                "--json",
+                "--time",
+                str(duration),
+                "--bidir",
+                "--extra-data",
+                f"capacity {len(ports)}",
+            ],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+        for port in ports
+    ]
+    outputs = [client.communicate()[0] for client in clients]
+
+    elapsed = time.monotonic() - start
+    cpu_end = parse_proc_stat(Path("/proc/stat").read_text())
+    server_cpu = read_process_usage(instance.process.pid)[0] - server_cpu_start
+
+    throughputs = []
+    errors = []
+    for port, output in zip(ports, outputs):
+        try:
+            throughput = client_throughput(json.loads(output))
+        except ValueError:
+            throughput = None
+        if throughput is None:
+            errors.append(port)
+        throughputs.append(throughput or 0.0)
+
+    # Measure the pipeline's latency from each server's log write. Wait until every log written during this step reaches the table, or ``settle_time`` passes.
+    notify_delays = []
+    ingest_delays = []
+    deadline = time.monotonic() + settle_time
+    for path, start_mtime in zip(log_paths, start_mtimes):
+        mtime = path.stat().st_mtime if path.exists() else 0
+        if mtime <= start_mtime:
+            continue
+        port = int(path.stem.split("-")[1])
+        while True:
+            # Look for a run which began during this step.
+            times = [
+                ingest_time
+                for timestamp, ingest_time in list(ingested.get(port, {}).items())
+                if timestamp >= start_timestamp
+            ]
+            if times or time.monotonic() > deadline:
+                break
+            time.sleep(0.05)
+        if times:
+            ingest_delays.append(min(times) - mtime)
+        notify = [t for t in list(notifications) if t >= mtime]
+        if notify:
+            notify_delays.append(notify[0] - mtime)
+
+    return {
+        "clients": len(ports),
+        "aggregate_bps": sum(throughputs),
+        "throughput_bps": dict(zip(ports, throughputs)),
+        "fairness": jain_index(throughputs),
+        "errors": errors,
+        "cpu_busy_percent": 100
+        * (cpu_end[0] - cpu_start[0])
+        / (cpu_end[1] - cpu_start[1] or 1),
+        "webperf3_cpu_percent": 100 * server_cpu / elapsed,
+        "notification_delay": summarize(notify_delays) if notify_delays else None,
+        "ingestion_delay": summarize(ingest_delays) if ingest_delays else None,
+    }
+
+
+# The benchmark
+# =============
+# Run the benchmark, returning a report.
+def run_capacity_benchmark(
+    # The number of iPerf3 servers; the benchmark runs up to this many clients.
+    num_ports: int = 4,
+    # The length of each client's run, in whole seconds, as iPerf3 requires.
+    duration: int = 5,
+    # The time to wait, after the clients finish, for their runs to reach the dashboard.
+    settle_time: float = 10,
+    # The time between steps, letting the servers return to listening.
+    pause: float = 1,
+    min_gain: float = 0.1,
+    min_fairness: float = 0.9,
+) -> Dict[str, Any]:
+    if not shutil.which("iperf3"):
+        raise RuntimeError("This benchmark requires iperf3 on the PATH.")
+    config = dict(
+        num_ports=num_ports,
+        duration=duration,
+        settle_time=settle_time,
+        pause=pause,
+        min_gain=min_gain,
+        min_fairness=min_fairness,
+        num_cpus=os.cpu_count(),
+    )
+    # webperf3 starts its iPerf3 servers on consecutive ports from its ``starting_port``.
+    ports = list(range(starting_port, starting_port + num_ports))
+    steps = []
+    with TemporaryDirectory() as temp_dir:
+        # Let webperf3 start the iPerf3 servers itself.
+        with WebPerf3Instance(num_ports, Path(temp_dir), extra_args=()) as instance:
+            deadline = time.monotonic() + 30
+            while len(listening_ports(ports)) < num_ports:
+                if time.monotonic() > deadline:
+                    raise RuntimeError("The iPerf3 servers failed to start.")
+                time.sleep(0.1)
+
+            stop = Event()
+            notifications: List[float] = []
+            ingested: Dict[int, Dict[int, float]] = {}
+            watcher = Thread(
+                target=asyncio.run,
+                args=(
+                    watch_pipeline(
+                        instance, starting_port, stop, notifications, ingested
+                    ),
+                ),
+            )
+            watcher.start()
+            try:
+                for k in range(1, num_ports + 1):
+                    time.sleep(pause)
+                    step = run_step(
+                        instance,
+                        ports[:k],
+                        duration,
+                        settle_time,
+                        notifications,
+                        ingested,
+                    )
+                    steps.append(step)
+                    print(format_step(step), flush=True)
+            finally:
+                stop.set()
+                watcher.join()
+
+    knee, reason = find_knee(
+        [step["aggregate_bps"] for step in steps],
+        [step["fairness"] for step in steps],
+        min_gain,
+        min_fairness,
+    )
+    return {
+        "config": config,
+        "steps": steps,
+        "knee": knee,
+        "knee_reason": reason,
+    }
+
+
+# Main
+# ====
+def format_step(step: Dict[str, Any]) -> str:
+    def ms(summary: Optional[Dict[str, float]]) -> str:
+        return f"{summary['median'] * 1e3:.0f} ms" if summary else "-"
+
+    errors = f", {len(step['errors'])} failed" if step["errors"] else ""
+    return (
+        f"{step['clients']} clients: {step['aggregate_bps'] / 1e6:.0f} Mbps, "
+        f"fairness {step['fairness']:.2f}, CPU {step['cpu_busy_percent']:.0f}% "
+        f"(webperf3 {step['webperf3_cpu_percent']:.0f}%), "
+        f"notification {ms(step['notification_delay'])}, "
+        f"ingestion {ms(step['ingestion_delay'])}{errors}"
+    )
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    steps = report["steps"]
+    knee = report["knee"]
+    print(f"Knee: {knee} clients; {report['knee_reason']}.")
+    if knee:
+        step = steps[knee - 1]
+        print(
+            f"At the knee: {step['aggregate_bps'] / 1e6:.0f} Mbps, CPU {step['cpu_busy_percent']:.0f}% of {report['config']['num_cpus']} CPUs."
+        )
+    saturated = [step["clients"] for step in steps if step["cpu_busy_percent"] >= 95]
+    if saturated:
+        print(f"The CPUs saturated with {saturated[0]} clients.")
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m webperf3 capacity",
+        description="Find how many concurrent iPerf3 clients this machine can serve, using loopback clients.",
+    )
+    parser.add_argument(
+        "--ports",
+        type=int,
+        default=4,
+        help="the number of iPerf3 servers to start; the benchmark runs 1 to this many clients.",
+    )
+    parser.add_argument(
+        "--time", type=int, default=5, help="the length of each run, in seconds."
+    )
+    parser.add_argument(
+        "--settle-time",
+        type=float,
+        default=10,
+        help="the time to wait for runs to reach the dashboard, in seconds.",
+    )
+    parser.add_argument(
+        "--min-gain",
+        type=float,
+        default=0.1,
+        help="the knee is where adding a client adds less than this fraction of a lone client's throughput.",
+    )
+    parser.add_argument(
+        "--min-fairness",
+        type=float,
+        default=0.9,
+        help="or where Jain's fairness index falls below this.",
+    )
+    parser.add_argument("--save", type=Path, help="save the report to this JSON file.")
+    args = parser.parse_args(argv[1:])
+
+    try:
+        report = run_capacity_benchmark(
+            args.ports,
+            args.time,
+            args.settle_time,
+            min_gain=args.min_gain,
+            min_fairness=args.min_fairness,
+        )
+    except RuntimeError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    print_report(report)
+    if args.save:
+        args.save.write_text(json.dumps(report, indent=4))
+        print(f"Saved report to {args.save}.")
+    return 0
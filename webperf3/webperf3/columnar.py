@@ -0,0 +1,235 @@
+# ************************************************
+# |docname| - Export results in a columnar format
+# ************************************************
+# Analysis notebooks which download ``/csv`` must parse its text, then convert its Excel serial dates back to timestamps. Instead, ``/arrow`` and ``/parquet`` provide the same runs as typed columns:
+#
+# ``port``
+#   The iPerf3 server's port, as a ``uint16``.
+# ``name``
+#   The UE name (the client's ``--extra-data``), as a string.
+# ``timestamp``
+#   The start of the run, as a ``timestamp[s, tz=UTC]``.
+# ``send_bps``, ``receive_bps``
+#   The average rates, as ``float64``; see ``extract_iperf3_performance`` in `webperf3.py`.
+#
+# With ``?intervals=1``, each run also includes its per-interval series as ``list<float64>`` columns: ``interval_start`` (seconds from the start of the run), ``interval_send_bps``, and ``interval_receive_bps``. Since the log index doesn't keep these, this reads the logs.
+#
+# Runs are listed in log order: by port, then by time. Both formats are streamed in record batches of ``batch_size`` runs, so that a long history is never held in memory as a whole. An Arrow IPC stream loads without copying:
+#
+# .. code-block:: python
+#
+#   import pyarrow as pa
+#   table = pa.ipc.open_stream(urlopen("http://pi/arrow")).read_all()
+#
+# These formats require pyarrow, which is an optional dependency: ``pip install webperf3[columnar]``.
+#
+# .. contents:: Table of Contents
+#   :local:
+#   :depth: 2
+#
+#
+# Imports
+# =======
+# These are listed in the order prescribed by `PEP 8`_.
+#
+# Standard library
+# ----------------
+import io
+import json
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional, Tuple
+
+# Third-party imports
+# -------------------
+# pyarrow is optional, so it's imported by the functions which need it.
+if TYPE_CHECKING:
+    import pyarrow
+
+# Local application imports
+# -------------------------
+from . import webperf3
+
+
+# Globals
+# =======
+# The number of runs in each record batch.
+batch_size = 65536
+
+
+# Runs
+# ====
+# Return the per-interval series of the run in ``iperf3_log_data``, as ``(start, send bps, receive bps)`` lists. As in ``extract_iperf3_performance``, the first stream is received by the server and the second (present only with ``--bidir``) is sent.
+def extract_iperf3_intervals(
+    iperf3_log_data: Dict[str, Any],
+) -> Tuple[List[float], List[Optional[float]], List[Optional[float]]]:
+    starts: List[float] = []
+    send: List[Optional[float]] = []
+    receive: List[Optional[float]] = []
+    for interval in iperf3_log_data.get("intervals", []):
+        streams = interval.get("streams", [])
+        if not streams:
+            continue
+        starts.append(streams[0]["start"])
+        receive.append(streams[0]["bits_per_second"])
+        send.append(streams[1]["bits_per_second"] if len(streams) > 1 else None)
+    return starts, send, receive
+
+
+# Yield ``(port, name, timestamp, send bps, receive bps)`` for each run with a timestamp, followed by its per-interval series if ``intervals`` is true.
+def iter_runs(num_servers: int, intervals: bool = False) -> Iterator[Tuple]:
+    if not intervals:
+        # The log index has everything needed.
+        for port, timestamp, send_bps, receive_bps, name in webperf3.log_index.read_all(
+            num_servers
+        ):
+            if timestamp:
+                yield port, name, timestamp, send_bps, receive_bps
+        return
+
+    # Read the logs one at a time, so that only one is in memory.
+    for server_index in range(num_servers):
+        log_path = webperf3.iperf3_log_file_name(server_index)
+        try:
+            text = log_path.read_text()
+        except FileNotFoundError:
+            continue
+        port = server_index + webperf3.starting_port
+        for block in webperf3.split_iperf3_json_log(text):
+            try:
+                log_data = json.loads(block)
+            except json.decoder.JSONDecodeError:
+                continue
+            timestamp, send_bps, receive_bps, name = (
+                webperf3.extract_iperf3_performance(log_data)
+            )
+            if timestamp:
+                yield (
+                    port,
+                    name,
+                    timestamp,
+                    send_bps,
+                    receive_bps,
+                ) + extract_iperf3_intervals(log_data)
+
+
+# Group ``runs`` into lists of at most ``size`` runs.
+def batched(runs: Iterator[Tuple], size: int) -> Iterator[List[Tuple]]:
+    batch = []
+    for run in runs:
+        batch.append(run)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# Arrow
+# =====
+def arrow_schema(intervals: bool) -> "pyarrow.Schema":
+    import pyarrow as pa
+
+    fields = [
+        pa.field("port", pa.uint16()),
+        pa.field("name", pa.string()),
+        pa.field("timestamp", pa.timestamp("s", tz="UTC")),
+        pa.field("send_bps", pa.float64()),
+        pa.field("receive_bps", pa.float64()),
+    ]
+    if intervals:
+        fields += [
+            pa.field(name, pa.list_(pa.float64()))
+            for name in ("interval_start", "interval_send_bps", "interval_receive_bps")
+        ]
+    return pa.schema(fields)
+
+
+# Yield the runs as Arrow record batches.
+def record_batches(
+    num_servers: int, intervals: bool = False, size: int = batch_size
+) -> Iterator["pyarrow.RecordBatch"]:
+    import pyarrow as pa
+
+    schema = arrow_schema(intervals)
+    for batch in batched(iter_runs(num_servers, intervals), size):
+        columns = list(zip(*batch))
+        yield pa.RecordBatch.from_arrays(
+            [
+                pa.array(column, type=field.type)
+                for column, field in zip(columns, schema)
+            ],
+            schema=schema,
+        )
+
+
+# Streaming
+# ---------
+# A file-like object which collects what's written to it, so that a writer's output can be streamed as it's produced.
+class _ChunkSink(io.RawIOBase):
+    def __init__(self) -> None:
+        self.chunks: List[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b: Any) -> int:
+        self.chunks.append(bytes(b))
+        return len(b)
+
+    # Return and forget everything written so far.
+    def take(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+# Yield an Arrow IPC stream of the runs, one record batch at a time.
+def arrow_stream(
+    num_servers: int, intervals: bool = False, size: int = batch_size
+) -> Iterator[bytes]:
+    import pyarrow as pa
+
+    sink = _ChunkSink()
+    with pa.ipc.new_stream(sink, arrow_schema(intervals)) as writer:
+        for batch in record_batches(num_servers, intervals, size):
+            writer.write_batch(batch)
+            yield sink.take()
+    yield sink.take()
+
+
+# Yield a Parquet file of the runs, one row group per record batch.
+def parquet_stream(
+    num_servers: int, intervals: bool = False, size: int = batch_size
+) -> Iterator[bytes]:
+    import pyarrow.parquet as pq
+
+    sink = _ChunkSink()
+    with pq.ParquetWriter(sink, arrow_schema(intervals)) as writer:
+        for batch in record_batches(num_servers, intervals, size):
+            writer.write_batch(batch)
+            yield sink.take()
+    yield sink.take()
+
+
+# Endpoints
+# =========
+# Serve ``/arrow`` or ``/parquet``, depending on ``file_format``.
+def download_columnar(file_format: str) -> Iterator[bytes]:
+    from bottle import abort, request, response
+
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        abort(501, "This export requires pyarrow; install webperf3[columnar].")
+
+    intervals = request.query.get("intervals", "0") not in ("", "0")
+    num_servers = webperf3.num_servers or 0
+    if file_format == "arrow":
+        response.content_type = "application/vnd.apache.arrow.stream"
+        stream = arrow_stream(num_servers, intervals)
+    else:
+        response.content_type = "application/vnd.apache.parquet"
+        stream = parquet_stream(num_servers, intervals)
+    response.set_header(
+        "content_disposition", f"attachment; filename=iperf3_log.{file_format}"
+    )
+    return stream
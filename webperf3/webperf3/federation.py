@@ -0,0 +1,438 @@
+# *****************************************************************
+# |docname| - Collect results from several webperf3 nodes into one
+# *****************************************************************
+# When several Pis each run webperf3, this collector shows all their results in one place. For example:
+#
+# .. code-block:: text
+#
+#   python -m webperf3 collect pi-a=http://10.0.0.21 pi-b=http://10.0.0.22 --http-port 8080
+#
+# For each node, the collector:
+#
+# - Reads the node's ``/ready`` endpoint to find its websocket port and its first iPerf3 port.
+# - Subscribes to the node's websocket. Each notification causes it to fetch the node's ``/table``, replacing only that node's rows in the federated table.
+# - Fetches the node's ``/csv`` only when the federated ``/csv`` is requested and the node has changed since its CSV was last fetched.
+#
+# All requests to a node share a small pool of keep-alive HTTP connections. A node is stale when its websocket is disconnected, or when it hasn't been heard from in ``--stale-after`` seconds; the federated table reports this per node.
+#
+# The collector serves:
+#
+# ``/table``
+#   A JSON list of ``[node, port, timestamp, send bps, receive bps, name, telemetry, stale]`` rows.
+# ``/csv``
+#   The CSV data from all nodes, with a Node column added, sorted by timestamp.
+# ``/nodes``
+#   A JSON dict giving the status of each node.
+#
+# .. contents:: Table of Contents
+#   :local:
+#   :depth: 2
+#
+#
+# Imports
+# =======
+# These are listed in the order prescribed by `PEP 8`_.
+#
+# Standard library
+# ----------------
+import argparse
+import asyncio
+import csv
+import http.client
+from io import StringIO
+import json
+from queue import Empty, LifoQueue
+from threading import Lock, Thread
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+# Third-party imports
+# -------------------
+# None. As in `webperf3.py`, the heavy imports are performed by the functions which need them.
+#
+# Local application imports
+# -------------------------
+from .anomaly import is_alert_message
+
+
+# Connection pool
+# ===============
+# A pool of keep-alive HTTP connections to one node.
+class ConnectionPool:
+    def __init__(
+        self,
+        # The node's host name or address.
+        host: str,
+        # The node's webserver port.
+        port: int,
+        # The maximum number of idle connections to keep.
+        size: int = 4,
+        # The timeout, in seconds, for each request.
+        timeout: float = 10,
+    ):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.idle: LifoQueue = LifoQueue(size)
+
+    # Fetch ``path``, returning the response body. Raise ``OSError`` or ``http.client.HTTPException`` on failure.
+    def get(self, path: str) -> bytes:
+        try:
+            conn = self.idle.get_nowait()
+        except Empty:
+            conn = http.client.HTTPConnection(
+                self.host, self.port, timeout=self.timeout
+            )
+        try:
+            conn.request("GET", path)
+            response = conn.getresponse()
+            body = response.read()
+        except (OSError, http.client.HTTPException):
+            # Don't reuse a connection in an unknown state.
+            conn.close()
+            raise
+        if response.status != 200:
+            conn.close()
+            raise http.client.HTTPException(f"{path}: HTTP {response.status}")
+        # Return the connection to the pool, unless the pool is full or the server closed it.
+        if response.will_close or self.idle.full():
+            conn.close()
+        else:
+            self.idle.put_nowait(conn)
+        return body
+
+    def close(self) -> None:
+        while not self.idle.empty():
+            self.idle.get_nowait().close()
+
+
+# Federated table
+# ===============
+# The state of one node.
+class NodeState:
+    def __init__(self) -> None:
+        # The rows of this node's ``/table``, or ``None`` if it hasn't been fetched.
+        self.rows: Optional[List[Optional[List[Any]]]] = None
+        # This node's first iPerf3 port.
+        self.starting_port = 5201
+        # True if the collector's websocket to this node is open.
+        self.connected = False
+        # The time (from ``time.monotonic``) the collector last heard from this node, or ``None`` if never.
+        self.last_seen: Optional[float] = None
+        # Incremented each time this node's table changes.
+        self.version = 0
+        # The header and rows of this node's ``/csv``, and the ``version`` they were fetched at. Each row maps the node's column names to its values.
+        self.csv_header: List[str] = []
+        self.csv_rows: List[Dict[str, str]] = []
+        self.csv_version = -1
+
+
+# Merge the results from several nodes. This is shared by the collector's event loop and the webserver's threads.
+class FederatedTable:
+    def __init__(
+        self,
+        # The names of the nodes.
+        nodes: List[str],
+        # A node not heard from in this many seconds is stale.
+        stale_after: float = 60,
+        # This is provided for testing.
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.stale_after = stale_after
+        self.clock = clock
+        self.nodes = {node: NodeState() for node in nodes}
+        self.lock = Lock()
+
+    # Record contact with a node.
+    def seen(self, node: str, connected: Optional[bool] = None) -> None:
+        with self.lock:
+            state = self.nodes[node]
+            state.last_seen = self.clock()
+            if connected is not None:
+                state.connected = connected
+
+    def disconnected(self, node: str) -> None:
+        with self.lock:
+            self.nodes[node].connected = False
+
+    def set_starting_port(self, node: str, starting_port: int) -> None:
+        with self.lock:
+            self.nodes[node].starting_port = starting_port
+
+    # Replace a node's rows with those from its ``/table``. Return True if they changed.
+    def update(self, node: str, rows: List[Optional[List[Any]]]) -> bool:
+        with self.lock:
+            state = self.nodes[node]
+            state.last_seen = self.clock()
+            if rows == state.rows:
+                return False
+            state.rows = rows
+            state.version += 1
+            return True
+
+    def is_stale(self, node: str) -> bool:
+        state = self.nodes[node]
+        return (
+            not state.connected
+            or state.last_seen is None
+            or self.clock() - state.last_seen > self.stale_after
+        )
+
+    # Return the federated table; see ``/table`` in the introduction.
+    def table(self) -> List[List[Any]]:
+        with self.lock:
+            result = []
+            for node, state in self.nodes.items():
+                stale = self.is_stale(node)
+                for index, row in enumerate(state.rows or []):
+                    result.append(
+                        [node, state.starting_port + index]
+                        # Pad rows from nodes which don't report telemetry.
+                        + (list(row or []) + [None] * 5)[:5]
+                        + [stale]
+                    )
+            return result
+
+    # Return the status of each node; see ``/nodes`` in the introduction.
+    def status(self) -> Dict[str, Dict[str, Any]]:
+        with self.lock:
+            now = self.clock()
+            return {
+                node: dict(
+                    connected=state.connected,
+                    stale=self.is_stale(node),
+                    age=None if state.last_seen is None else now - state.last_seen,
+                    version=state.version,
+                    num_ports=len(state.rows or []),
+                )
+                for node, state in self.nodes.items()
+            }
+
+    # Return the nodes whose CSV data is out of date, with the version to record once it's fetched.
+    def stale_csv(self) -> List[Tuple[str, int]]:
+        with self.lock:
+            return [
+                (node, state.version)
+                for node, state in self.nodes.items()
+                if state.csv_version != state.version
+            ]
+
+    # Record the CSV data fetched from a node.
+    def update_csv(self, node: str, version: int, csv_text: str) -> None:
+        header, *rows = list(csv.reader(StringIO(csv_text))) or [[]]
+        with self.lock:
+            state = self.nodes[node]
+            state.csv_header = header
+            state.csv_rows = [dict(zip(header, row)) for row in rows]
+            state.csv_version = version
+
+    # Return the federated CSV data; see ``/csv`` in the introduction.
+    def csv(self) -> str:
+        # Nodes may report different telemetry columns (for example, when they monitor different network interfaces), so the header is the union of their columns, in the order first seen; a node's row is blank in the columns it lacks.
+        header = [
+            "Node",
+            "Port",
+            "Name",
+            "Timestamp",
+            "Send rate (bps)",
+            "Receive rate (bps)",
+        ]
+        with self.lock:
+            rows = []
+            for node, state in self.nodes.items():
+                header += [name for name in state.csv_header if name not in header]
+                rows += [dict(row, Node=node) for row in state.csv_rows]
+        rows.sort(key=lambda row: float(row["Timestamp"]))
+        s = StringIO()
+        writer = csv.DictWriter(s, header, restval="")
+        writer.writeheader()
+        writer.writerows(rows)
+        return s.getvalue()
+
+
+# Collector
+# =========
+class Collector:
+    def __init__(
+        self,
+        # A dict of {node name: base URL} for each node, such as ``{"pi-a": "http://10.0.0.21"}``.
+        nodes: Dict[str, str],
+        # See ``FederatedTable``.
+        stale_after: float = 60,
+        # The delay, in seconds, before reconnecting to a node.
+        retry_delay: float = 2,
+    ):
+        self.urls = nodes
+        self.pools = {}
+        for node, url in nodes.items():
+            parts = urlsplit(url)
+            self.pools[node] = ConnectionPool(parts.hostname or "", parts.port or 80)
+        self.table = FederatedTable(list(nodes), stale_after)
+        self.retry_delay = retry_delay
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.stop_event: Optional[asyncio.Event] = None
+        self.thread: Optional[Thread] = None
+
+    # Fetch a node's table, then merge it.
+    def fetch_table(self, node: str) -> None:
+        rows = json.loads(self.pools[node].get("/table"))
+        self.table.update(node, rows)
+
+    # Bring the CSV data of all changed nodes up to date, then return the federated CSV data. Nodes which can't be reached keep their previous data.
+    def federated_csv(self) -> str:
+        for node, version in self.table.stale_csv():
+            try:
+                csv_text = self.pools[node].get("/csv").decode("utf-8")
+            except (OSError, http.client.HTTPException) as e:
+                print(f"{node}: unable to fetch CSV data: {e}")
+                continue
+            self.table.update_csv(node, version, csv_text)
+        return self.table.csv()
+
+    # Follow one node: subscribe to its websocket, fetching its table on each notification. Reconnect after failures until stopped.
+    async def follow(self, node: str) -> None:
+        import websockets
+        import websockets.exceptions
+
+        pool = self.pools[node]
+        assert self.stop_event
+        while not self.stop_event.is_set():
+            try:
+                ready = json.loads(await asyncio.to_thread(pool.get, "/ready"))
+                self.table.set_starting_port(node, ready["starting_port"])
+                async with websockets.connect(  # type: ignore
+                    f"ws://{pool.host}:{ready['websocket_port']}"
+                ) as ws:
+                    self.table.seen(node, connected=True)
+                    while True:
+                        try:
+                            message = await asyncio.wait_for(
+                                ws.recv(), self.table.stale_after / 2
+                            )
+                        except asyncio.TimeoutError:
+                            # A quiet node is still fresh if it answers a ping.
+                            await asyncio.wait_for(
+                                await ws.ping(), self.table.stale_after / 2
+                            )
+                            self.table.seen(node)
+                            continue
+                        # Each notification (including the greeting sent on connect) means the table may have changed; an alert doesn't.
+                        self.table.seen(node)
+                        if not is_alert_message(message):
+                            await asyncio.to_thread(self.fetch_table, node)
+            except (
+                OSError,
+                ValueError,
+                KeyError,
+                http.client.HTTPException,
+                websockets.exceptions.WebSocketException,
+                asyncio.TimeoutError,
+            ) as e:
+                print(f"{node}: {e!r}")
+            self.table.disconnected(node)
+            try:
+                await asyncio.wait_for(self.stop_event.wait(), self.retry_delay)
+            except asyncio.TimeoutError:
+                pass
+
+    async def amain(self) -> None:
+        self.loop = asyncio.get_running_loop()
+        self.stop_event = asyncio.Event()
+        tasks = [asyncio.create_task(self.follow(node)) for node in self.urls]
+        await self.stop_event.wait()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def start(self) -> None:
+        self.thread = Thread(target=asyncio.run, args=(self.amain(),))
+        self.thread.start()
+
+    # Stop following the nodes from another thread.
+    def stop(self) -> None:
+        assert self.loop and self.stop_event and self.thread
+        self.loop.call_soon_threadsafe(self.stop_event.set)
+        self.thread.join()
+        for pool in self.pools.values():
+            pool.close()
+
+
+# Webserver
+# =========
+def create_app(collector: Collector) -> Any:
+    import bottle
+
+    app = bottle.Bottle()
+
+    @app.route("/table")
+    def table():
+        bottle.response.content_type = "application/json"
+        return json.dumps(collector.table.table())
+
+    @app.route("/csv")
+    def download_csv():
+        bottle.response.content_type = "text/csv"
+        bottle.response.set_header(
+            "content_disposition", "attachment; filename=iperf3_federated_log.csv"
+        )
+        return collector.federated_csv()
+
+    @app.route("/nodes")
+    def nodes():
+        bottle.response.content_type = "application/json"
+        return json.dumps(collector.table.status())
+
+    return app
+
+
+# Main
+# ====
+# Interpret a node from the command line as ``[NAME=]URL``; if the name is omitted, use the URL's ``host:port``.
+def parse_nodes(specs: List[str]) -> Dict[str, str]:
+    nodes = {}
+    for spec in specs:
+        name, sep, url = spec.partition("=")
+        if not sep:
+            url = spec
+            name = urlsplit(url).netloc
+        nodes[name] = url
+    return nodes
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m webperf3 collect",
+        description="Collect results from several webperf3 nodes.",
+    )
+    parser.add_argument(
+        "nodes",
+        nargs="+",
+        metavar="[NAME=]URL",
+        help="the base URL of each node, such as http://10.0.0.21; optionally preceded by a name for the node.",
+    )
+    parser.add_argument(
+        "--http-port", type=int, default=8080, help="the port for the webserver."
+    )
+    parser.add_argument(
+        "--stale-after",
+        type=float,
+        default=60,
+        help="the time, in seconds, after which a node not heard from is stale.",
+    )
+    args = parser.parse_args(argv[1:])
+
+    collector = Collector(parse_nodes(args.nodes), args.stale_after)
+    collector.start()
+    from bottle import run
+
+    run(
+        create_app(collector),
+        host="0.0.0.0",
+        port=args.http_port,
+        server="paste",
+        protocol_version="HTTP/1.1",
+    )
+    print("Shutting down...")
+    collector.stop()
+    return 0
@@ -0,0 +1,454 @@
+# **************************************************************
+# |docname| - Load test a webperf3 instance with many dashboards
+# **************************************************************
+# This simulates a room full of laptops with the dashboard open during a demo. It starts a local webperf3 instance without iPerf3 servers (``--no-iperf3``), then, for ``--duration`` seconds:
+#
+# - A log writer thread appends a `synthetic <synthetic.py>` iPerf3 run to a random port's log every ``--write-interval`` seconds, in place of the iPerf3 servers.
+# - ``--ws-clients`` websocket clients wait for notifications from the `WebSocketWatcher <webperf3.py>`, recording the delay between each log write and the resulting notification.
+# - ``--http-clients`` threads fetch ``/table`` and ``/csv`` as fast as the server responds, recording the latency of each request.
+# - A sampler records the server's CPU use and resident set size (RSS) from ``/proc``; this requires Linux.
+#
+# It then prints (and optionally saves) a report. For example:
+#
+# .. code-block:: text
+#
+#   python -m webperf3.loadtest --ws-clients 300 --http-clients 8 --duration 60 --save report.json
+#
+# .. contents:: Table of Contents
+#   :local:
+#   :depth: 2
+#
+#
+# Imports
+# =======
+# These are listed in the order prescribed by `PEP 8`_.
+#
+# Standard library
+# ----------------
+import argparse
+import asyncio
+import http.client
+import json
+import os
+from pathlib import Path
+import random
+import signal
+import socket
+import subprocess
+import sys
+from tempfile import TemporaryDirectory
+from threading import Event, Thread
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+# Third-party imports
+# -------------------
+import websockets
+
+# Local application imports
+# -------------------------
+from .anomaly import is_alert_message
+from .benchmark import summarize
+from .synthetic import format_iperf3_block, iperf3_result, write_synthetic_logs
+
+
+# Support code
+# ============
+# Return a currently unused TCP port on the loopback interface.
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+# Return the CPU time (user + system, in seconds) and RSS (in bytes) of a process by reading its ``/proc`` entries.
+def read_process_usage(pid: int) -> Tuple[float, int]:
+    # The process name in ``/proc/PID/stat`` may contain spaces; the fields after the closing parenthesis start with the process state. See `proc(5) <https://man7.org/linux/man-pages/man5/proc.5.html>`_.
+    fields = Path(f"/proc/{pid}/stat").read_text().rsplit(")", 1)[1].split()
+    cpu_secs = (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    rss = 0
+    for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+        if line.startswith("VmRSS:"):
+            rss = int(line.split()[1]) * 1024
+    return cpu_secs, rss
+
+
+# A webperf3 instance
+# ===================
+# A context manager which runs ``python -m webperf3`` in a subprocess, returning once its ``/ready`` endpoint reports that it's ready.
+class WebPerf3Instance:
+    def __init__(
+        self,
+        # The number of ports to monitor.
+        num_ports: int,
+        # The directory containing the logs.
+        log_dir: Path,
+        # Additional command-line arguments to pass to webperf3.
+        extra_args: Tuple[str, ...] = ("--no-iperf3",),
+    ):
+        self.num_ports = num_ports
+        self.log_dir = log_dir
+        self.extra_args = extra_args
+        self.http_port = free_port()
+        self.ws_port = free_port()
+        self.process: Optional[subprocess.Popen] = None
+
+    def __enter__(self) -> "WebPerf3Instance":
+        self.process = subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                "webperf3",
+                str(self.num_ports),
+                "--http-port",
+                str(self.http_port),
+                "--ws-port",
+                str(self.ws_port),
+                "--log-dir",
+                str(self.log_dir),
+                *self.extra_args,
+            ],
+            # Run from the directory containing the ``webperf3`` package, so that it's importable even when not installed.
+            cwd=Path(__file__).parents[1],
+            # Discard the server's output (including a line for every HTTP request), which would otherwise swamp the report.
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            # Put webperf3 and any iPerf3 servers it starts in their own process group, so that all of them can be stopped together.
+            start_new_session=True,
+        )
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                if json.loads(self.get("/ready"))["ready"]:
+                    return self
+            except OSError:
+                # The webserver isn't listening yet.
+                pass
+            if self.process.poll() is not None or time.monotonic() > deadline:
+                self.__exit__(None, None, None)
+                raise RuntimeError("webperf3 failed to start.")
+            time.sleep(0.1)
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        assert self.process
+        self.process.terminate()
+        try:
+            self.process.wait(10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+        # webperf3 doesn't stop the iPerf3 servers it started; stop them, along with anything else left in its process group.
+        try:
+            os.killpg(self.process.pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+
+    # Fetch ``path`` using a new connection, returning the body.
+    def get(self, path: str) -> bytes:
+        conn = http.client.HTTPConnection("127.0.0.1", self.http_port, timeout=30)
+        try:
+            conn.request("GET", path)
+            return conn.getresponse().read()
+        finally:
+            conn.close()
+
+    @property
+    def ws_url(self) -> str:
+        return f"ws://127.0.0.1:{self.ws_port}"
+
+
+# Load generators
+# ===============
+# Append a synthetic iPerf3 run to a random log file every ``interval`` seconds until ``stop`` is set, appending the time of each write to ``write_times``.
+def write_logs(
+    log_dir: Path,
+    num_ports: int,
+    interval: float,
+    stop: Event,
+    write_times: List[float],
+    seed: int = 0,
+    starting_port: int = 5201,
+) -> None:
+    rng = random.Random(seed)
+    while not stop.wait(interval):
+        port = starting_port + rng.randrange(num_ports)
+        block = format_iperf3_block(
+            iperf3_result(
+                int(time.time()),
+                rng.uniform(1e6, 5e7),
+                rng.uniform(1e6, 5e7),
+                f"UE {port}",
+                port=port,
+            )
+        )
+        with open(log_dir / f"port-{port}.json", "a") as f:
+            f.write(block)
+        write_times.append(time.monotonic())
+
+
+# Fetch each of ``paths`` in turn over a keep-alive connection until ``stop`` is set, appending each request's latency to ``latencies[path]``.
+def fetch_http(
+    port: int,
+    paths: List[str],
+    stop: Event,
+    latencies: Dict[str, List[float]],
+    errors: List[str],
+) -> None:
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    while not stop.is_set():
+        for path in paths:
+            start = time.monotonic()
+            try:
+                conn.request("GET", path)
+                response = conn.getresponse()
+                response.read()
+                if response.status != 200:
+                    errors.append(f"{path}: HTTP {response.status}")
+                    continue
+            except (OSError, http.client.HTTPException) as e:
+                errors.append(f"{path}: {e}")
+                conn.close()
+                continue
+            latencies[path].append(time.monotonic() - start)
+    conn.close()
+
+
+# Connect to the websocket, then record the delay from each log write to the notification it produces until ``stop_time``. Return the number of messages received.
+async def watch_websocket(
+    url: str,
+    stop_time: float,
+    write_times: List[float],
+    delays: List[float],
+) -> int:
+    messages = 0
+    async with websockets.connect(url, open_timeout=60) as ws:  # type: ignore
+        # The server greets each new client with a notification, which isn't caused by a log write; discard it. Then, ignore writes before this client subscribed, since they may have been included in the greeting.
+        await asyncio.wait_for(ws.recv(), max(stop_time - time.monotonic(), 0))
+        messages += 1
+        seen = len(write_times)
+        while True:
+            remaining = stop_time - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                message = await asyncio.wait_for(ws.recv(), remaining)
+            except asyncio.TimeoutError:
+                break
+            now = time.monotonic()
+            # Alerts from the anomaly detector follow a notification; they aren't notifications themselves.
+            if is_alert_message(message):
+                continue
+            messages += 1
+            # Several writes may produce a single notification; measure from the oldest of these.
+            num_writes = len(write_times)
+            if num_writes > seen:
+                delays.append(now - write_times[seen])
+                seen = num_writes
+    return messages
+
+
+async def run_websocket_clients(
+    url: str,
+    num_clients: int,
+    duration: float,
+    write_times: List[float],
+    delays: List[float],
+) -> Tuple[int, int, List[str]]:
+    stop_time = time.monotonic() + duration
+    results = await asyncio.gather(
+        *[
+            watch_websocket(url, stop_time, write_times, delays)
+            for _ in range(num_clients)
+        ],
+        return_exceptions=True,
+    )
+    errors = [repr(r) for r in results if isinstance(r, BaseException)]
+    messages = sum(r for r in results if isinstance(r, int))
+    return num_clients - len(errors), messages, errors
+
+
+# Sample the CPU use and RSS of process ``pid`` every ``interval`` seconds until ``stop`` is set.
+def sample_process(
+    pid: int,
+    interval: float,
+    stop: Event,
+    samples: List[Tuple[float, float, int]],
+) -> None:
+    while not stop.wait(interval):
+        try:
+            cpu_secs, rss = read_process_usage(pid)
+        except (OSError, ValueError, IndexError):
+            break
+        samples.append((time.monotonic(), cpu_secs, rss))
+
+
+# The load test
+# =============
+# Run a load test, returning a report.
+def run_load_test(
+    # The number of ports (log files) the instance monitors.
+    num_ports: int = 10,
+    # The number of runs in each log file when the test starts.
+    initial_runs: int = 100,
+    # The number of websocket clients.
+    ws_clients: int = 100,
+    # The number of threads fetching ``/table`` and ``/csv``.
+    http_clients: int = 4,
+    # The length of the test, in seconds.
+    duration: float = 30,
+    # The time between log writes, in seconds.
+    write_interval: float = 0.5,
+) -> Dict[str, Any]:
+    config = dict(
+        num_ports=num_ports,
+        initial_runs=initial_runs,
+        ws_clients=ws_clients,
+        http_clients=http_clients,
+        duration=duration,
+        write_interval=write_interval,
+    )
+    with TemporaryDirectory() as temp_dir:
+        log_dir = Path(temp_dir)
+        write_synthetic_logs(log_dir, num_ports, initial_runs)
+        with WebPerf3Instance(num_ports, log_dir) as instance:
+            assert instance.process
+            stop = Event()
+            write_times: List[float] = []
+            delays: List[float] = []
+            latencies: Dict[str, List[float]] = {"/table": [], "/csv": []}
+            http_errors: List[str] = []
+            samples: List[Tuple[float, float, int]] = []
+            threads = [
+                Thread(
+                    target=write_logs,
+                    args=(log_dir, num_ports, write_interval, stop, write_times),
+                ),
+                Thread(
+                    target=sample_process,
+                    args=(instance.process.pid, 0.5, stop, samples),
+                ),
+            ] + [
+                Thread(
+                    target=fetch_http,
+                    args=(
+                        instance.http_port,
+                        list(latencies),
+                        stop,
+                        latencies,
+                        http_errors,
+                    ),
+                )
+                for _ in range(http_clients)
+            ]
+            for thread in threads:
+                thread.start()
+            try:
+                connected, messages, ws_errors = asyncio.run(
+                    run_websocket_clients(
+                        instance.ws_url, ws_clients, duration, write_times, delays
+                    )
+                )
+            finally:
+                stop.set()
+                for thread in threads:
+                    thread.join()
+
+    # Compute CPU use between successive samples.
+    cpu_percent = [
+        100 * (c1 - c0) / (t1 - t0)
+        for (t0, c0, _), (t1, c1, _) in zip(samples, samples[1:])
+    ]
+    return {
+        "config": config,
+        "http": {
+            path: summarize(times) if times else None
+            for path, times in latencies.items()
+        },
+        "http_errors": http_errors[:20],
+        "num_http_errors": len(http_errors),
+        "notification_delay": summarize(delays) if delays else None,
+        "websocket": {
+            "connected": connected,
+            "messages": messages,
+            "errors": ws_errors[:20],
+        },
+        "log_writes": len(write_times),
+        "server": {
+            "cpu_percent_mean": (
+                sum(cpu_percent) / len(cpu_percent) if cpu_percent else None
+            ),
+            "cpu_percent_max": max(cpu_percent, default=None),
+            "rss_max_bytes": max((s[2] for s in samples), default=None),
+        },
+    }
+
+
+# Main
+# ====
+def print_report(report: Dict[str, Any]) -> None:
+    def ms(summary: Optional[Dict[str, float]]) -> str:
+        return (
+            f"p50 {summary['median'] * 1e3:.1f} ms, p99 {summary['p99'] * 1e3:.1f} ms, {summary['count']} samples"
+            if summary
+            else "no samples"
+        )
+
+    for path, summary in report["http"].items():
+        print(f"{path}: {ms(summary)}")
+    print(f"HTTP errors: {report['num_http_errors']}")
+    ws = report["websocket"]
+    print(
+        f"Websockets: {ws['connected']} connected, {ws['messages']} messages, {len(ws['errors'])} errors"
+    )
+    print(f"Log write to notification: {ms(report['notification_delay'])}")
+    server = report["server"]
+    if server["cpu_percent_mean"] is not None:
+        print(
+            f"Server CPU: mean {server['cpu_percent_mean']:.0f}%, max {server['cpu_percent_max']:.0f}%; max RSS {server['rss_max_bytes'] / 2**20:.1f} MiB"
+        )
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m webperf3.loadtest",
+        description="Load test a local webperf3 instance with many websocket and HTTP clients.",
+    )
+    parser.add_argument("--ports", type=int, default=10, help="Number of log files.")
+    parser.add_argument(
+        "--initial-runs", type=int, default=100, help="Runs per log file at startup."
+    )
+    parser.add_argument(
+        "--ws-clients", type=int, default=100, help="Number of websocket clients."
+    )
+    parser.add_argument(
+        "--http-clients", type=int, default=4, help="Number of HTTP client threads."
+    )
+    parser.add_argument(
+        "--duration", type=float, default=30, help="Test length, in seconds."
+    )
+    parser.add_argument(
+        "--write-interval",
+        type=float,
+        default=0.5,
+        help="Time between log writes, in seconds.",
+    )
+    parser.add_argument("--save", type=Path, help="Save the report to this JSON file.")
+    args = parser.parse_args(argv)
+
+    report = run_load_test(
+        args.ports,
+        args.initial_runs,
+        args.ws_clients,
+        args.http_clients,
+        args.duration,
+        args.write_interval,
+    )
+    print_report(report)
+    if args.save:
+        args.save.write_text(json.dumps(report, indent=4))
+        print(f"Saved report to {args.save}.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
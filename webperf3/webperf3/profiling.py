@@ -0,0 +1,478 @@
+# ********************************************
+# |docname| - Profile a running webperf3 server
+# ********************************************
+# When the Pi runs slowly in the field, there's no debugger to attach. Instead, start webperf3 with an admin token (``--admin-token``, or the ``WEBPERF3_ADMIN_TOKEN`` environment variable), then use the admin endpoints below. Each requires the header ``Authorization: Bearer TOKEN``; without a token, these endpoints don't exist.
+#
+# ``POST /admin/profile/start?mode=sampling&duration=30``
+#   Profile for ``duration`` seconds (at most `max_duration`_), or until stopped. A ``sampling`` profile (the default) records the stack of every thread each ``interval`` seconds (default 0.005); it covers the HTTP threads, the `WebSocketWatcher <webperf3.py>` event loop, and the log index refreshes it runs, at a cost which doesn't depend on how busy they are. A ``deterministic`` profile runs `cProfile <https://docs.python.org/3/library/profile.html>`_ over the same code: before Python 3.12, by profiling each HTTP request, the event loop's thread, and each log index refresh separately; afterwards, with a single profiler.
+# ``POST /admin/profile/stop``, ``GET /admin/profile/status``
+#   Stop the profile early; report on the current or last profile.
+# ``GET /admin/profile/result?format=pstats``
+#   Download the last profile. A deterministic profile is a `pstats <https://docs.python.org/3/library/profile.html#pstats.Stats>`_ file (view it with ``python -m pstats`` or `snakeviz <https://jiffyclub.github.io/snakeviz/>`_); a sampling profile is either a pstats file, or (with ``format=collapsed``) collapsed stacks for `flamegraph.pl <https://github.com/brendangregg/FlameGraph>`_ or `speedscope <https://www.speedscope.app/>`_.
+# ``POST /admin/memory/snapshot?frames=1``
+#   Start `tracemalloc <https://docs.python.org/3/library/tracemalloc.html>`_ (recording ``frames`` frames per allocation) if it isn't running, then take a snapshot.
+# ``GET /admin/memory/diff?top=20&key=lineno``
+#   Show the ``top`` allocation sites (grouped by ``key``: ``lineno``, ``filename``, or ``traceback``) which grew the most between the last two snapshots, or the largest in the only snapshot.
+# ``POST /admin/memory/stop``
+#   Stop tracemalloc and discard its snapshots.
+#
+# When no profile is running and tracemalloc is stopped, profiling costs nothing: no profiler or sampler is installed, and requests and refreshes run unwrapped. For example:
+#
+# .. code-block:: text
+#
+#   curl -X POST -H "Authorization: Bearer $TOKEN" "http://pi/admin/profile/start?duration=60"
+#   curl -H "Authorization: Bearer $TOKEN" "http://pi/admin/profile/result?format=collapsed" | flamegraph.pl > flame.svg
+#
+# With ``--workers``, each request may reach a different process; therefore, the admin endpoints are only available when serving from a single process.
+#
+# .. contents:: Table of Contents
+#   :local:
+#   :depth: 2
+#
+#
+# Imports
+# =======
+# These are listed in the order prescribed by `PEP 8`_.
+#
+# Standard library
+# ----------------
+import asyncio
+from collections import Counter, deque
+import cProfile
+import functools
+import hmac
+import json
+import marshal
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from types import FrameType
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+# Third-party imports
+# -------------------
+# Bottle is imported by the functions which need it.
+#
+# Local application imports
+# -------------------------
+# None.
+
+
+# Profiles
+# ========
+# The longest profile allowed, in seconds, so that a forgotten profile doesn't run for the rest of a flight.
+max_duration = 600
+# The most frames of each allocation's traceback that tracemalloc may store.
+max_frames = 100
+
+# Starting with Python 3.12, ``cProfile`` is built on ``sys.monitoring``: one profiler records every thread, and only one may be enabled at a time. Before that, a profiler records only the thread which enabled it.
+profiler_sees_all_threads = sys.version_info >= (3, 12)
+
+
+# Return the collapsed-stack label of a frame.
+def _frame_label(frame: FrameType) -> str:
+    code = frame.f_code
+    return (
+        f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+    )
+
+
+class ProfileSession:
+    def __init__(
+        self,
+        # ``sampling`` or ``deterministic``.
+        mode: str,
+        # The length of the profile, in seconds.
+        duration: float,
+        # For a sampling profile, the time between samples, in seconds.
+        interval: float = 0.005,
+        # For a deterministic profile, the event loop to profile.
+        loop: Optional[asyncio.AbstractEventLoop] = None,
+    ):
+        self.mode = mode
+        self.duration = duration
+        self.interval = interval
+        self.loop = loop
+        self.started = time.time()
+        self.stopped: Optional[float] = None
+        self.stop_event = threading.Event()
+        self.lock = threading.Lock()
+        # For a deterministic profile, the profiler for each thread, keyed by thread id; if ``profiler_sees_all_threads``, a single profiler, keyed by 0.
+        self.profilers: Dict[int, cProfile.Profile] = {}
+        # True if each thread needs its own profiler: requests, the event loop, and refreshes must enable their own.
+        self.per_thread = mode == "deterministic" and not profiler_sees_all_threads
+        # For a sampling profile, the number of samples of each stack, as a tuple of frames from the outermost, led by the thread's name.
+        self.stacks: Counter = Counter()
+        self.num_samples = 0
+        self.thread = threading.Thread(
+            target=self._run, name="webperf3-profiler", daemon=True
+        )
+
+    @property
+    def running(self) -> bool:
+        return self.stopped is None
+
+    def start(self) -> None:
+        if self.per_thread and self.loop:
+            self.loop.call_soon_threadsafe(self._enable_in_thread)
+        elif self.mode == "deterministic":
+            self.profilers[0] = cProfile.Profile()
+            self.profilers[0].enable()
+        self.thread.start()
+
+    # Stop profiling; wait until the results are complete.
+    def stop(self) -> None:
+        self.stop_event.set()
+        if self.thread is not threading.current_thread():
+            self.thread.join()
+
+    # This thread samples stacks until the profile ends, then stops the event loop's profiler.
+    def _run(self) -> None:
+        deadline = time.monotonic() + self.duration
+        if self.mode == "sampling":
+            own_id = threading.get_ident()
+            while not self.stop_event.wait(self.interval):
+                if time.monotonic() >= deadline:
+                    break
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id == own_id:
+                        continue
+                    stack: List[str] = []
+                    f: Optional[FrameType] = frame
+                    while f is not None:
+                        stack.append(_frame_label(f))
+                        f = f.f_back
+                    stack.append(names.get(thread_id, str(thread_id)))
+                    self.stacks[tuple(reversed(stack))] += 1
+                self.num_samples += 1
+        elif not self.per_thread:
+            self.stop_event.wait(self.duration)
+            self.profilers[0].disable()
+        else:
+            self.stop_event.wait(self.duration)
+            if self.loop and not self.loop.is_closed():
+                done = threading.Event()
+
+                def disable() -> None:
+                    self._disable_in_thread()
+                    done.set()
+
+                self.loop.call_soon_threadsafe(disable)
+                done.wait(5)
+        self.stopped = time.time()
+
+    # Profile everything the calling thread runs, until ``_disable_in_thread``.
+    def _enable_in_thread(self) -> None:
+        if self.running:
+            self._profiler().enable()
+
+    def _disable_in_thread(self) -> None:
+        profiler = self.profilers.get(threading.get_ident())
+        if profiler:
+            profiler.disable()
+
+    def _profiler(self) -> cProfile.Profile:
+        thread_id = threading.get_ident()
+        with self.lock:
+            profiler = self.profilers.get(thread_id)
+            if profiler is None:
+                profiler = self.profilers[thread_id] = cProfile.Profile()
+        return profiler
+
+    # Profile a call to ``func`` in a per-thread profile.
+    def runcall(self, func: Callable, *args: Any, **kwargs: Any) -> Any:
+        if not self.running:
+            return func(*args, **kwargs)
+        return self._profiler().runcall(func, *args, **kwargs)
+
+    # Results
+    # -------
+    # Return the profile in the pstats file format: a marshalled dict of ``{(file, line, function): (primitive calls, total calls, total time, cumulative time, callers)}``.
+    def pstats_data(self) -> bytes:
+        if self.mode == "deterministic":
+            with self.lock:
+                profilers = list(self.profilers.values())
+            if not profilers:
+                return marshal.dumps({})
+            stats = pstats.Stats(profilers[0])
+            for profiler in profilers[1:]:
+                stats.add(profiler)
+            return marshal.dumps(stats.stats)  # type: ignore
+
+        # Convert samples to times: each sample of a stack adds one interval to the total time of its innermost function, and to the cumulative time of every function on it (once, even if recursive). Calls are counted as samples.
+        entries: Dict[Tuple, List] = {}
+        for stack, count in self.stacks.items():
+            functions = [_pstats_key(label) for label in stack[1:]]
+            seconds = count * self.interval
+            for index, key in enumerate(functions):
+                entry = entries.setdefault(key, [0, 0, 0.0, 0.0, {}])
+                if key not in functions[:index]:
+                    entry[0] += count
+                    entry[1] += count
+                    entry[3] += seconds
+                if index:
+                    caller = entry[4].setdefault(functions[index - 1], [0, 0, 0.0, 0.0])
+                    caller[0] += count
+                    caller[1] += count
+                    caller[3] += seconds
+            if functions:
+                entries[functions[-1]][2] += seconds
+        return marshal.dumps(
+            {
+                key: (
+                    entry[0],
+                    entry[1],
+                    entry[2],
+                    entry[3],
+                    {caller: tuple(value) for caller, value in entry[4].items()},
+                )
+                for key, entry in entries.items()
+            }
+        )
+
+    # Return the sampled stacks in the collapsed format: one line per stack, the frames separated by semicolons, followed by a space and the number of samples.
+    def collapsed(self) -> str:
+        return "".join(
+            f"{';'.join(stack)} {count}\n" for stack, count in self.stacks.items()
+        )
+
+    def status(self) -> Dict[str, Any]:
+        return dict(
+            mode=self.mode,
+            running=self.running,
+            started=self.started,
+            stopped=self.stopped,
+            duration=self.duration,
+            interval=self.interval if self.mode == "sampling" else None,
+            samples=self.num_samples if self.mode == "sampling" else None,
+            threads=len(self.profilers) if self.mode == "deterministic" else None,
+        )
+
+
+# Return the pstats key for a label produced by ``_frame_label``.
+def _pstats_key(label: str) -> Tuple[str, int, str]:
+    name, _, location = label.rpartition(" (")
+    filename, _, line = location[:-1].rpartition(":")
+    return filename, int(line), name
+
+
+# The current or last profile, or None if there hasn't been one.
+session: Optional[ProfileSession] = None
+
+
+# Return ``func``, wrapped to be profiled if a deterministic profile is running. Call this each time ``func`` is scheduled, so that, when no profile is running, ``func`` runs unwrapped.
+def profiled(func: Callable) -> Callable:
+    current = session
+    if current is None or not current.per_thread or not current.running:
+        return func
+    return functools.partial(current.runcall, func)
+
+
+# A `bottle plugin <https://bottlepy.org/docs/dev/plugindev.html>`_ which profiles each request. It's installed only while a per-thread deterministic profile runs.
+class ProfileRequests:
+    name = "webperf3-profile"
+    api = 2
+
+    def __init__(self, session: ProfileSession) -> None:
+        self.session = session
+
+    def apply(self, callback: Callable, route: Any) -> Callable:
+        @functools.wraps(callback)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            return self.session.runcall(callback, *args, **kwargs)
+
+        return wrapper
+
+
+# Memory
+# ======
+# The last two tracemalloc snapshots, oldest first.
+snapshots: Deque[tracemalloc.Snapshot] = deque(maxlen=2)
+
+# Omit allocations by tracemalloc itself.
+snapshot_filters = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<unknown>"),
+]
+
+
+# Return a text report of the ``top`` allocation sites, grouped by ``key``: those which grew most between the last two snapshots, or the largest in the only snapshot.
+def memory_report(top: int = 20, key: str = "lineno") -> str:
+    if not snapshots:
+        return "No snapshots; POST /admin/memory/snapshot first.\n"
+    if len(snapshots) == 1:
+        stats: List[Any] = snapshots[0].statistics(key)
+        heading = f"Top {top} allocation sites"
+    else:
+        stats = snapshots[1].compare_to(snapshots[0], key)
+        heading = f"Top {top} changes in allocations between the last two snapshots"
+    lines = [heading]
+    for stat in stats[:top]:
+        lines.append(str(stat))
+        if key == "traceback":
+            lines.extend(f"    {line}" for line in stat.traceback.format())
+    return "\n".join(lines) + "\n"
+
+
+# Endpoints
+# =========
+# Add the admin endpoints to ``app``, requiring ``token``. ``get_loop`` returns the websocket watcher's event loop (if it's running), for deterministic profiles to include.
+def add_admin_routes(
+    app: Any, token: str, get_loop: Callable[[], Optional[asyncio.AbstractEventLoop]]
+) -> None:
+    from bottle import abort, request, response
+
+    # Check the request's token before calling ``handler``.
+    def admin(handler: Callable) -> Callable:
+        @functools.wraps(handler)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            scheme, _, given = request.get_header("Authorization", "").partition(" ")
+            if scheme.lower() != "bearer" or not hmac.compare_digest(
+                given.encode(), token.encode()
+            ):
+                response.set_header("WWW-Authenticate", "Bearer")
+                abort(401, "A valid admin token is required.")
+            return handler(*args, **kwargs)
+
+        return wrapper
+
+    def as_json(value: Any) -> str:
+        response.content_type = "application/json"
+        return json.dumps(value)
+
+    plugin: Optional[ProfileRequests] = None
+    # Requests run in the server's threads, and the profile may end in its own thread; this serializes starting a profile and installing or removing the plugin, since bottle's plugin list (and the route cache it resets) isn't thread-safe.
+    lock = threading.Lock()
+
+    # Stop the current profile, removing the request plugin.
+    def finish(current: ProfileSession) -> None:
+        nonlocal plugin
+        current.stop()
+        with lock:
+            if plugin is not None and plugin.session is current:
+                app.uninstall(plugin)
+                plugin = None
+
+    def start_profile():
+        global session
+        nonlocal plugin
+        mode = request.query.get("mode", "sampling")
+        if mode not in ("sampling", "deterministic"):
+            abort(400, "mode must be sampling or deterministic.")
+        try:
+            duration = float(request.query.get("duration", 30))
+            interval = float(request.query.get("interval", 0.005))
+        except ValueError:
+            abort(400, "duration and interval must be numbers.")
+        if not 0 < duration <= max_duration or not 0.001 <= interval <= 1:
+            abort(
+                400,
+                f"duration must be between 0 and {max_duration} seconds, and interval between 0.001 and 1 second.",
+            )
+        with lock:
+            if session is not None and session.running:
+                abort(409, "A profile is already running.")
+            session = ProfileSession(
+                mode,
+                duration,
+                interval,
+                get_loop() if mode == "deterministic" else None,
+            )
+            if session.per_thread:
+                plugin = ProfileRequests(session)
+                app.install(plugin)
+            session.start()
+        if session.per_thread:
+            # Remove the plugin when the profile ends, even if it's never stopped.
+            def wait_then_finish(current: ProfileSession) -> None:
+                current.thread.join()
+                finish(current)
+
+            threading.Thread(
+                target=wait_then_finish, args=(session,), daemon=True
+            ).start()
+        return as_json(session.status())
+
+    def stop_profile():
+        if session is None:
+            abort(404, "No profile has run.")
+        finish(session)
+        return as_json(session.status())
+
+    def profile_status():
+        return as_json(session.status() if session else None)
+
+    def profile_result():
+        if session is None:
+            abort(404, "No profile has run.")
+        if session.running:
+            abort(409, "The profile is still running; stop it, or wait until it ends.")
+        result_format = request.query.get("format", "pstats")
+        if result_format == "pstats":
+            response.content_type = "application/octet-stream"
+            response.set_header(
+                "content_disposition", "attachment; filename=webperf3.pstats"
+            )
+            return session.pstats_data()
+        if result_format == "collapsed":
+            if session.mode != "sampling":
+                abort(400, "Collapsed stacks require a sampling profile.")
+            response.content_type = "text/plain"
+            response.set_header(
+                "content_disposition", "attachment; filename=webperf3.collapsed"
+            )
+            return session.collapsed()
+        abort(400, "format must be pstats or collapsed.")
+
+    def memory_snapshot():
+        try:
+            frames = int(request.query.get("frames", 1))
+        except ValueError:
+            abort(400, "frames must be an integer.")
+        # tracemalloc requires at least one frame; deeper tracebacks cost memory for every traced allocation.
+        if not 1 <= frames <= max_frames:
+            abort(400, f"frames must be between 1 and {max_frames}.")
+        if not tracemalloc.is_tracing():
+            snapshots.clear()
+            tracemalloc.start(frames)
+        snapshots.append(tracemalloc.take_snapshot().filter_traces(snapshot_filters))
+        current, peak = tracemalloc.get_traced_memory()
+        return as_json(
+            dict(
+                snapshots=len(snapshots),
+                frames=tracemalloc.get_traceback_limit(),
+                traced_bytes=current,
+                peak_traced_bytes=peak,
+            )
+        )
+
+    def memory_diff():
+        key = request.query.get("key", "lineno")
+        if key not in ("lineno", "filename", "traceback"):
+            abort(400, "key must be lineno, filename, or traceback.")
+        try:
+            top = int(request.query.get("top", 20))
+        except ValueError:
+            abort(400, "top must be an integer.")
+        response.content_type = "text/plain"
+        return memory_report(top, key)
+
+    def memory_stop():
+        tracemalloc.stop()
+        snapshots.clear()
+        return as_json(dict(tracing=False))
+
+    # Keep the admin endpoints themselves out of profiles.
+    skip = dict(skip=[ProfileRequests.name])
+    app.route("/admin/profile/start", "POST", admin(start_profile), **skip)
+    app.route("/admin/profile/stop", "POST", admin(stop_profile), **skip)
+    app.route("/admin/profile/status", "GET", admin(profile_status), **skip)
+    app.route("/admin/profile/result", "GET", admin(profile_result), **skip)
+    app.route("/admin/memory/snapshot", "POST", admin(memory_snapshot), **skip)
+    app.route("/admin/memory/diff", "GET", admin(memory_diff), **skip)
+    app.route("/admin/memory/stop", "POST", admin(memory_stop), **skip)
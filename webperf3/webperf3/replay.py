@@ -0,0 +1,164 @@
+# *****************************************************
+# |docname| - Replay recorded iPerf3 logs in real time
+# *****************************************************
+# This re-appends the blocks from an archived ``iperf3-logs`` directory into a scratch log directory, spaced as they were originally recorded. Running webperf3 against the scratch directory then exercises the watcher, caches, and websocket with realistic traffic, but without iPerf3 or radio hardware. For example, in one terminal:
+#
+# .. code-block:: text
+#
+#   python -m webperf3 replay flight-logs/iperf3-logs --dest /tmp/replay --speed 10
+#
+# then, in another:
+#
+# .. code-block:: text
+#
+#   python -m webperf3 10 --log-dir /tmp/replay --no-iperf3 --http-port 8080
+#
+# iPerf3 writes a block to its log when a run finishes; therefore, each block is replayed at the end of its run -- its ``timesecs`` plus the run's duration. Blocks which lack a timestamp (such as error output) are replayed along with the preceding block from the same log file.
+#
+# .. contents:: Table of Contents
+#   :local:
+#   :depth: 2
+#
+#
+# Imports
+# =======
+# These are listed in the order prescribed by `PEP 8`_.
+#
+# Standard library
+# ----------------
+import argparse
+import json
+import math
+from pathlib import Path
+import sys
+from tempfile import mkdtemp
+import time
+from typing import Callable, List, NamedTuple, Optional
+
+# Third-party imports
+# -------------------
+# None.
+#
+# Local application imports
+# -------------------------
+from .webperf3 import split_iperf3_json_log
+
+
+# Recorded blocks
+# ===============
+class RecordedBlock(NamedTuple):
+    # The time iPerf3 wrote this block, in seconds since the epoch.
+    timesecs: float
+    # The name of the log file containing this block.
+    file_name: str
+    # The text of this block.
+    text: str
+
+
+# Return the time, in seconds since the epoch, when iPerf3 finished writing this block; return ``None`` if the block doesn't contain a timestamp.
+def block_write_time(text: str) -> Optional[float]:
+    try:
+        start = json.loads(text)["start"]
+        return start["timestamp"]["timesecs"] + start["test_start"]["duration"]
+    except (json.decoder.JSONDecodeError, KeyError, TypeError):
+        return None
+
+
+# Read all the blocks in the log files in ``src_dir``, returning them in the order they were written.
+def read_recorded_blocks(src_dir: Path) -> List[RecordedBlock]:
+    blocks = []
+    for log_path in sorted(src_dir.glob("port-*.json")):
+        # Blocks without a timestamp before the first timestamped block are replayed first.
+        timesecs = -math.inf
+        for text in split_iperf3_json_log(log_path.read_text()):
+            timesecs = block_write_time(text) or timesecs
+            blocks.append(RecordedBlock(timesecs, log_path.name, text))
+
+    # Python's sort is stable, so blocks from the same file with the same time stay in order.
+    blocks.sort(key=lambda block: block.timesecs)
+    return blocks
+
+
+# Replay
+# ======
+# Append each of ``blocks`` to the corresponding log file in ``dest_dir``, sleeping between blocks to reproduce their original spacing divided by ``speed``. A ``speed`` of ``math.inf`` replays as fast as possible. Return the number of blocks replayed.
+def replay(
+    blocks: List[RecordedBlock],
+    dest_dir: Path,
+    speed: float = 1,
+    # These are provided for testing.
+    sleep: Callable[[float], None] = time.sleep,
+    clock: Callable[[], float] = time.monotonic,
+) -> int:
+    dest_dir.mkdir(parents=True, exist_ok=True)
+    # Blocks without any timestamp are replayed immediately.
+    timed = [block.timesecs for block in blocks if block.timesecs != -math.inf]
+    first_timesecs = timed[0] if timed else 0
+    start = clock()
+    for block in blocks:
+        if speed != math.inf and block.timesecs != -math.inf:
+            delay = start + (block.timesecs - first_timesecs) / speed - clock()
+            if delay > 0:
+                sleep(delay)
+        with open(dest_dir / block.file_name, "a") as f:
+            f.write(block.text)
+    return len(blocks)
+
+
+# Main
+# ====
+# Interpret a speed from the command line.
+def parse_speed(speed: str) -> float:
+    value = math.inf if speed == "max" else float(speed)
+    if value <= 0:
+        raise argparse.ArgumentTypeError("the speed must be positive.")
+    return value
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m webperf3 replay",
+        description="Replay recorded iPerf3 logs into a scratch log directory.",
+    )
+    parser.add_argument(
+        "src_dir",
+        type=Path,
+        metavar="DIR",
+        help="the directory containing recorded logs.",
+    )
+    parser.add_argument(
+        "--dest",
+        type=Path,
+        help="the scratch log directory to replay into; if omitted, create a temporary directory.",
+    )
+    parser.add_argument(
+        "--speed",
+        type=parse_speed,
+        default=1.0,
+        help="a speed multiplier (for example, 10 replays ten times faster than recorded), or max to replay as fast as possible.",
+    )
+    parser.add_argument(
+        "--clear",
+        action="store_true",
+        help="empty the replayed log files in the scratch directory before replaying.",
+    )
+    args = parser.parse_args(argv[1:])
+
+    blocks = read_recorded_blocks(args.src_dir)
+    if not blocks:
+        print(f"Error: no logs found in {args.src_dir}.", file=sys.stderr)
+        return 1
+    dest_dir = args.dest or Path(mkdtemp(prefix="webperf3-replay-"))
+    if args.clear:
+        for file_name in {block.file_name for block in blocks}:
+            (dest_dir / file_name).unlink(missing_ok=True)
+
+    timed = [block.timesecs for block in blocks if block.timesecs != -math.inf]
+    span = timed[-1] - timed[0] if timed else 0
+    speed = "as fast as possible" if args.speed == math.inf else f"at {args.speed}x"
+    print(
+        f"Replaying {len(blocks)} blocks recorded over {span:.0f} s into {dest_dir} {speed}."
+    )
+    replay(blocks, dest_dir, args.speed)
+    print("Replay complete.")
+    return 0
@@ -0,0 +1,235 @@
+# *****************************************************************
+# |docname| - A table of the latest iPerf3 results in shared memory
+# *****************************************************************
+# With ``--workers N``, several processes serve HTTP requests, so that rendering JSON and CSV isn't limited to one CPU by the GIL. A single ingester process (the one running the watcher) owns the `log index <webperf3.py>`; it publishes the latest results for each port into this table, which the workers read from shared memory without any file I/O.
+#
+# The table holds only what fits in a fixed size: the latest run on each port, plus the id of the latest alert. Endpoints which need the full history (``/csv``, ``/xlsx``, and ``/alerts``) can't be served from it; instead, a worker reads the history from the files the ingester writes, but only when the table says they changed: the logs and the telemetry journal when the version changes (reading only what was appended since), and the alert log when the latest alert id changes. Requests in between are served from memory.
+#
+# Layout
+# ======
+# The table is a header followed by one fixed-size record per port. All values are little-endian.
+#
+# Header:
+#
+# - 8 bytes: a magic number, ``WPERF3`` followed by a two-byte layout version.
+# - 8 bytes: the version counter, which is incremented twice per update: it's odd while the ingester is writing. This implements a `seqlock <https://en.wikipedia.org/wiki/Seqlock>`_: a reader which sees an odd version, or a version which changed while reading, retries. Since a record read during an update may be torn (for example, half of a multi-byte character), a reader copies the records and checks the version before decoding them.
+# - 4 bytes: the number of records.
+# - 4 bytes: the names of the ready parts of the ingester, as a bitmask; see ``ready_events`` in `webperf3.py`.
+# - 4 bytes: the id of the latest alert recorded by the ingester, or 0 if there are none; see `anomaly.py`.
+#
+# Each record:
+#
+# - 1 byte: 1 if the record is present (its log file exists), 0 otherwise.
+# - 3 bytes: padding.
+# - 3 × 8 bytes: the timestamp, send rate, and receive rate, as doubles; NaN represents ``None``.
+# - 2 bytes: the length of the name, in bytes, or 0xFFFF if there's no name.
+# - 62 bytes: the name, encoded as UTF-8 and truncated to fit.
+# - 2 bytes: the length of the telemetry, in bytes, or 0xFFFF if there's no telemetry.
+# - 510 bytes: the `telemetry <telemetry.py>` recorded during the run, as JSON. Telemetry which doesn't fit is omitted.
+#
+# A seqlock relies on the version being written before and after the data. The Python interpreter performs many memory operations, with their associated barriers, between these steps, so this works in practice on both x86 and the Pi's ARM CPU, though the language doesn't formally guarantee it.
+#
+# .. contents:: Table of Contents
+#   :local:
+#   :depth: 2
+#
+#
+# Imports
+# =======
+# These are listed in the order prescribed by `PEP 8`_.
+#
+# Standard library
+# ----------------
+import json
+import math
+from multiprocessing.shared_memory import SharedMemory
+import struct
+import time
+from typing import Any, List, Optional, Sequence, Tuple
+
+# Third-party imports
+# -------------------
+# None.
+#
+# Local application imports
+# -------------------------
+# None.
+#
+#
+# Globals
+# =======
+magic = b"WPERF3\x00\x03"
+header_struct = struct.Struct("<8sQIII")
+record_struct = struct.Struct("<B3xdddH62sH510s")
+# The length of a name or telemetry which is ``None``.
+no_name = 0xFFFF
+
+
+# Shared table
+# ============
+class ResultsTable:
+    def __init__(
+        self,
+        # The shared memory holding the table.
+        shm: SharedMemory,
+        # True if this process created the shared memory, and therefore must unlink it.
+        owner: bool,
+    ):
+        self.shm = shm
+        self.owner = owner
+        assert shm.buf is not None
+        self.buf: memoryview = shm.buf
+        found_magic, _, self.num_records, _, _ = header_struct.unpack_from(self.buf)
+        assert found_magic == magic, "Not a webperf3 results table."
+
+    # Create a table with ``num_records`` empty records.
+    @classmethod
+    def create(cls, num_records: int) -> "ResultsTable":
+        shm = SharedMemory(
+            create=True,
+            size=header_struct.size + num_records * record_struct.size,
+        )
+        buf = shm.buf
+        assert buf is not None
+        header_struct.pack_into(buf, 0, magic, 0, num_records, 0, 0)
+        for index in range(num_records):
+            record_struct.pack_into(
+                buf,
+                header_struct.size + index * record_struct.size,
+                0,
+                math.nan,
+                math.nan,
+                math.nan,
+                no_name,
+                b"",
+                no_name,
+                b"",
+            )
+        return cls(shm, True)
+
+    # Attach to an existing table by name; workers started by ``fork`` don't need this, since they inherit the table.
+    @classmethod
+    def attach(cls, name: str) -> "ResultsTable":
+        return cls(SharedMemory(name=name), False)
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    @property
+    def version(self) -> int:
+        return header_struct.unpack_from(self.buf)[1]
+
+    def _set_version(self, version: int) -> None:
+        struct.pack_into("<Q", self.buf, 8, version)
+
+    # Writer
+    # ------
+    # Publish the latest result for each port. Only one process may call this.
+    def publish(
+        self,
+        # For each port, ``None`` or the data returned by ``extract_iperf3_performance`` followed by the run's telemetry, as produced by ``latest_results`` in `webperf3.py`.
+        rows: Sequence[Optional[Tuple[Any, ...]]],
+    ) -> None:
+        version = self.version
+        self._set_version(version + 1)
+        for index in range(self.num_records):
+            row = rows[index] if index < len(rows) else None
+            present = row is not None
+            timestamp, send_bps, receive_bps, name, telemetry = row or (None,) * 5
+            if name is None:
+                name_len, name_bytes = no_name, b""
+            else:
+                # Truncate to fit, without splitting a multi-byte character.
+                name_bytes = name.encode("utf-8")[:62]
+                name_bytes = name_bytes.decode("utf-8", "ignore").encode("utf-8")
+                name_len = len(name_bytes)
+            telemetry_bytes = json.dumps(telemetry, separators=(",", ":")).encode()
+            if telemetry is None or len(telemetry_bytes) > 510:
+                telemetry_len, telemetry_bytes = no_name, b""
+            else:
+                telemetry_len = len(telemetry_bytes)
+            record_struct.pack_into(
+                self.buf,
+                header_struct.size + index * record_struct.size,
+                present,
+                math.nan if timestamp is None else timestamp,
+                math.nan if send_bps is None else send_bps,
+                math.nan if receive_bps is None else receive_bps,
+                name_len,
+                name_bytes,
+                telemetry_len,
+                telemetry_bytes,
+            )
+        self._set_version(version + 2)
+
+    # Record which parts of the ingester are ready, as a bitmask.
+    def set_ready(self, ready: int) -> None:
+        struct.pack_into("<I", self.buf, 20, ready)
+
+    @property
+    def ready(self) -> int:
+        return header_struct.unpack_from(self.buf)[3]
+
+    # Record the id of the latest alert, after writing it to the alert log.
+    def set_last_alert_id(self, alert_id: int) -> None:
+        struct.pack_into("<I", self.buf, 24, alert_id)
+
+    @property
+    def last_alert_id(self) -> int:
+        return header_struct.unpack_from(self.buf)[4]
+
+    # Readers
+    # -------
+    # Return ``(version, rows)``, where ``rows`` is in the format accepted by ``publish``.
+    def read(self) -> Tuple[int, List[Optional[Tuple[Any, ...]]]]:
+        start = header_struct.size
+        end = start + self.num_records * record_struct.size
+        while True:
+            version = self.version
+            # The ingester is writing; let it run, then try again.
+            if version & 1:
+                time.sleep(0)
+                continue
+            records = bytes(self.buf[start:end])
+            if self.version == version:
+                return version, [
+                    self._decode_record(fields)
+                    for fields in record_struct.iter_unpack(records)
+                ]
+
+    # Decode the unpacked ``fields`` of a record.
+    @staticmethod
+    def _decode_record(fields: Tuple[Any, ...]) -> Optional[Tuple[Any, ...]]:
+        (
+            present,
+            timestamp,
+            send_bps,
+            receive_bps,
+            name_len,
+            name,
+            telemetry_len,
+            telemetry,
+        ) = fields
+        if not present:
+            return None
+
+        def value(x: float) -> Optional[float]:
+            return None if math.isnan(x) else x
+
+        return (
+            None if math.isnan(timestamp) else int(timestamp),
+            value(send_bps),
+            value(receive_bps),
+            None if name_len == no_name else name[:name_len].decode("utf-8"),
+            None if telemetry_len == no_name else json.loads(telemetry[:telemetry_len]),
+        )
+
+    # Cleanup
+    # -------
+    def close(self) -> None:
+        # Release the buffer before closing the shared memory.
+        self.buf.release()
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
@@ -0,0 +1,249 @@
+# ****************************************
+# |docname| - Stage logs in RAM on the Pi
+# ****************************************
+# By default, the iPerf3 servers log to the Pi's SD card, and every refresh of the log index reads it back; flash is slow, and many small writes wear it out. With ``--stage-dir``, webperf3 uses a RAM-backed directory (a tmpfs, such as ``/dev/shm/webperf3``) in place of the log directory: the iPerf3 servers log to it, and the watcher and webserver read from it. A `persister <LogPersister>`_ then copies its contents to the durable log directory (``--log-dir``) in batches, every ``--persist-interval`` seconds:
+#
+# - iPerf3 logs (``port-NNNN.json``) and the alert log (``*.jsonl``) are append-only, so only their completed blocks (or lines) are appended to the durable copy. A run's block is complete once it's valid JSON, or once another block follows it, or once the file stops changing for a full interval (as for iPerf3's error output).
+# - Other state files, such as the log index, are rewritten by their owners; the persister replaces the durable copy when they change.
+#
+# Each batch is written then ``fsync``\ ed, so a power loss loses at most one interval of runs. At startup, `recover`_ restores the staging directory: after a reboot, the tmpfs is empty, so the durable copies are restored into it; after webperf3 alone crashed, the staged files are still there (and may be ahead of the durable copies), so they're kept, and the persister's first batch catches up.
+#
+# .. contents:: Table of Contents
+#   :local:
+#   :depth: 2
+#
+#
+# Imports
+# =======
+# These are listed in the order prescribed by `PEP 8`_.
+#
+# Standard library
+# ----------------
+import json
+import os
+from pathlib import Path
+import re
+import shutil
+from threading import Event, Lock, Thread
+from typing import Dict, Iterable, List, Tuple
+
+# Third-party imports
+# -------------------
+# None.
+#
+# Local application imports
+# -------------------------
+from .ci_utils import is_win
+from .webperf3 import split_iperf3_json_log
+
+
+# Support code
+# ============
+# Names of files which are only appended to.
+log_file_re = re.compile(r"port-\d+\.json")
+line_file_re = re.compile(r".*\.jsonl")
+
+
+def is_appended(name: str) -> bool:
+    return bool(log_file_re.fullmatch(name) or line_file_re.fullmatch(name))
+
+
+# Return the number of bytes at the start of ``data`` (appended to the file ``name``) which are complete. If ``quiescent``, the file hasn't changed for an interval, so nothing more will be added to its last block.
+def complete_length(name: str, data: bytes, quiescent: bool) -> int:
+    if quiescent:
+        return len(data)
+    if line_file_re.fullmatch(name):
+        return data.rfind(b"\n") + 1
+    # Use ``surrogateescape``, as the log index does, so that the encoded length of each block matches its length on disk.
+    blocks = split_iperf3_json_log(data.decode("utf-8", "surrogateescape"))
+    if not blocks:
+        return 0
+    try:
+        json.loads(blocks[-1])
+    except json.decoder.JSONDecodeError:
+        # iPerf3 may still be writing this block.
+        return len(data) - len(blocks[-1].encode("utf-8", "surrogateescape"))
+    return len(data)
+
+
+# Flush the directory at ``path`` to storage, so that files created or renamed in it survive a power loss.
+def fsync_dir(path: Path) -> None:
+    # Windows can't open a directory.
+    if is_win:
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+# Return True if the file ``prefix_path`` is a prefix of the file ``path``.
+def is_prefix(prefix_path: Path, path: Path, chunk_size: int = 1 << 20) -> bool:
+    if prefix_path.stat().st_size > path.stat().st_size:
+        return False
+    with open(prefix_path, "rb") as prefix_file, open(path, "rb") as f:
+        while chunk := prefix_file.read(chunk_size):
+            if f.read(len(chunk)) != chunk:
+                return False
+    return True
+
+
+# The persister
+# =============
+class LogPersister:
+    def __init__(
+        self,
+        # The RAM-backed directory used in place of the log directory.
+        stage_dir: Path,
+        # The durable log directory.
+        durable_dir: Path,
+        # The time between batches, in seconds.
+        interval: float = 60,
+        # The names of other files to persist; these are replaced, rather than appended to.
+        replaced: Iterable[str] = (),
+    ):
+        self.stage_dir = stage_dir
+        self.durable_dir = durable_dir
+        self.interval = interval
+        self.replaced = set(replaced)
+        # For each appended file, the number of its bytes which are in the durable copy, and the staged file's inode. An owner may compact an appended file by replacing it (as the telemetry journal in `webperf3.py` does), which changes its inode.
+        self.offsets: Dict[str, int] = {}
+        self.inodes: Dict[str, int] = {}
+        # For each appended file, its size at the last batch; for each replaced file, its ``(size, modification time)`` when it was last copied.
+        self.sizes: Dict[str, int] = {}
+        self.stats: Dict[str, Tuple[int, int]] = {}
+        # The number of batches which wrote something, and the bytes they wrote.
+        self.num_batches = 0
+        self.bytes_written = 0
+        self.stop_event = Event()
+        # Batches run in the persister's thread, and a final batch at shutdown.
+        self.lock = Lock()
+        self.thread = Thread(target=self._run, daemon=True)
+
+    def _persisted(self, name: str) -> bool:
+        return is_appended(name) or name in self.replaced
+
+    # Recover
+    # -------
+    # Bring the staging directory up to date with the durable directory, returning the names of the files restored from it. Call this before anything writes to the staging directory.
+    def recover(self) -> List[str]:
+        self.stage_dir.mkdir(parents=True, exist_ok=True)
+        self.durable_dir.mkdir(parents=True, exist_ok=True)
+        restored = []
+        for durable_path in sorted(self.durable_dir.iterdir()):
+            name = durable_path.name
+            if not durable_path.is_file() or not self._persisted(name):
+                continue
+            stage_path = self.stage_dir / name
+            if stage_path.exists():
+                if is_appended(name):
+                    # Keep a staged file which continues the durable copy.
+                    if is_prefix(durable_path, stage_path):
+                        self.offsets[name] = durable_path.stat().st_size
+                        self.inodes[name] = stage_path.stat().st_ino
+                        continue
+                elif stage_path.stat().st_mtime_ns >= durable_path.stat().st_mtime_ns:
+                    continue
+            # Copy, preserving the modification time, then rename, so that a reader never sees a partial file.
+            temp_path = stage_path.with_name(f".{name}.restore")
+            shutil.copy2(durable_path, temp_path)
+            os.replace(temp_path, stage_path)
+            restored.append(name)
+            st = stage_path.stat()
+            if is_appended(name):
+                self.offsets[name] = st.st_size
+                self.inodes[name] = st.st_ino
+            else:
+                self.stats[name] = (st.st_size, st.st_mtime_ns)
+        return restored
+
+    # Persist
+    # -------
+    # Copy any changes in the staging directory to the durable directory, returning the number of bytes written. If ``final``, also copy incomplete blocks, since nothing more will be written.
+    def flush(self, final: bool = False) -> int:
+        written = 0
+        with self.lock:
+            for stage_path in sorted(self.stage_dir.iterdir()):
+                name = stage_path.name
+                if not self._persisted(name):
+                    continue
+                try:
+                    if is_appended(name):
+                        written += self._append(stage_path, final)
+                    else:
+                        written += self._replace(stage_path)
+                except OSError as e:
+                    # For example, the SD card is full; try again next time.
+                    print(f"Unable to persist {name}: {e}")
+            if written:
+                self.num_batches += 1
+                self.bytes_written += written
+        return written
+
+    def _append(self, stage_path: Path, final: bool) -> int:
+        name = stage_path.name
+        durable_path = self.durable_dir / name
+        st = stage_path.stat()
+        size = st.st_size
+        offset = self.offsets.get(name, 0)
+        quiescent = final or self.sizes.get(name) == size
+        self.sizes[name] = size
+        if (
+            size < offset
+            or st.st_ino != self.inodes.get(name, st.st_ino)
+            or not durable_path.exists()
+        ):
+            # The staged file was replaced or truncated, or the durable copy is missing; start the durable copy again.
+            offset = self.offsets[name] = 0
+        self.inodes[name] = st.st_ino
+        if size == offset:
+            return 0
+        with open(stage_path, "rb") as f:
+            f.seek(offset)
+            data = f.read(size - offset)
+        length = complete_length(name, data, quiescent)
+        if not length:
+            return 0
+        created = not offset
+        with open(durable_path, "r+b" if offset else "wb") as f:
+            f.seek(offset)
+            f.write(data[:length])
+            f.truncate()
+            f.flush()
+            os.fsync(f.fileno())
+        if created:
+            fsync_dir(self.durable_dir)
+        self.offsets[name] = offset + length
+        return length
+
+    def _replace(self, stage_path: Path) -> int:
+        name = stage_path.name
+        st = stage_path.stat()
+        stat = (st.st_size, st.st_mtime_ns)
+        if self.stats.get(name) == stat:
+            return 0
+        temp_path = self.durable_dir / f".{name}.persist"
+        shutil.copy2(stage_path, temp_path)
+        with open(temp_path, "rb") as f:
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.durable_dir / name)
+        fsync_dir(self.durable_dir)
+        self.stats[name] = stat
+        return st.st_size
+
+    # Thread
+    # ------
+    def start(self) -> None:
+        self.thread.start()
+
+    # Stop the persister, then persist everything.
+    def stop(self) -> None:
+        self.stop_event.set()
+        if self.thread.is_alive():
+            self.thread.join()
+        self.flush(final=True)
+
+    def _run(self) -> None:
+        while not self.stop_event.wait(self.interval):
+            self.flush()
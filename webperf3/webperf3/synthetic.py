@@ -0,0 +1,237 @@
+# ***************************************************
+# |docname| - Generate synthetic iPerf3 JSON log files
+# ***************************************************
+# The benchmarks, load tests, and replay tools need realistic iPerf3 logs without running iPerf3. This module produces them, following the shapes of the test fixtures:
+#
+# - ``single_iperf3_output.json``: a ``--bidir`` run with two streams, one per direction, plus an ``extra_data`` UE name.
+# - ``no_bidir_iperf3_output.json``: a receive-only run with a single stream and no ``extra_data``.
+# - ``error_0_iperf3_output.json`` and ``error_1_iperf3_output.json``: an error block followed by ``iperf3: exiting``, which makes that part of the log invalid JSON.
+#
+# .. contents:: Table of Contents
+#   :local:
+#   :depth: 2
+#
+#
+# Imports
+# =======
+# These are listed in the order prescribed by `PEP 8`_.
+#
+# Standard library
+# ----------------
+import json
+from pathlib import Path
+import random
+from typing import Any, Dict, Iterator, List, Optional
+
+# Third-party imports
+# -------------------
+# None.
+#
+# Local application imports
+# -------------------------
+# None.
+#
+#
+# Globals
+# =======
+# The ``system_info`` reported by a Pi, copied from ``no_bidir_iperf3_output.json``.
+system_info = (
+    "Linux raspberrypi 5.10.103-v7l+ #1530 SMP Tue Mar 8 13:05:01 GMT 2022 armv7l"
+)
+# The timestamp of the first synthetic run, in seconds since the epoch; this matches the ``single_iperf3_output.json`` fixture.
+default_start_time = 1647312652
+# The time between the start of successive runs on one port, in seconds.
+default_run_spacing = 30
+
+
+# Result blocks
+# =============
+# Produce a stream, formatted like an entry in the ``intervals`` or ``end`` sections of an iPerf3 log.
+def _stream(
+    socket: int, start: float, end: float, bps: float, sender: bool
+) -> Dict[str, Any]:
+    seconds = end - start
+    return {
+        "socket": socket,
+        "start": start,
+        "end": end,
+        "seconds": seconds,
+        "bytes": int(bps * seconds / 8),
+        "bits_per_second": bps,
+        "sender": sender,
+    }
+
+
+# Produce the data iPerf3 logs for one successful run.
+def iperf3_result(
+    # The start of this run, in seconds since the epoch.
+    timesecs: int,
+    # The rate (bps) the server received; see ``extract_iperf3_performance``.
+    receive_bps: float,
+    # The rate (bps) the server sent, or ``None`` for a run without ``--bidir``.
+    send_bps: Optional[float] = None,
+    # The ``--extra-data`` provided by the client, or ``None`` if it wasn't provided.
+    extra_data: Optional[str] = None,
+    # The length of this run, in seconds; this also sets the number of one-second intervals.
+    duration: int = 10,
+    # The port the server listened on.
+    port: int = 5201,
+) -> Dict[str, Any]:
+    # The receiving stream is always first; the sending stream (if any) follows it.
+    rates = [(9, receive_bps, False)]
+    if send_bps is not None:
+        rates.append((11, send_bps, True))
+
+    intervals = []
+    for i in range(duration):
+        streams = [
+            dict(_stream(socket, i, i + 1, bps, sender), omitted=False)
+            for socket, bps, sender in rates
+        ]
+        intervals.append({"streams": streams, "sum": streams[0]})
+
+    end_streams = []
+    for socket, bps, sender in rates:
+        # Per the fixtures, only one side of each stream reports a non-zero rate.
+        end_streams.append(
+            {
+                "sender": _stream(socket, 0, duration, bps if sender else 0, sender),
+                "receiver": _stream(socket, 0, duration, 0 if sender else bps, sender),
+            }
+        )
+
+    result: Dict[str, Any] = {
+        "start": {
+            "connected": [
+                {
+                    "socket": socket,
+                    "local_host": "10.0.0.21",
+                    "local_port": port,
+                    "remote_host": "10.0.0.18",
+                    "remote_port": 52202 + socket,
+                }
+                for socket, _, _ in rates
+            ],
+            "version": "iperf 3.9",
+            "system_info": system_info,
+            "timestamp": {
+                "time": "",
+                "timesecs": timesecs,
+            },
+            "test_start": {
+                "protocol": "TCP",
+                "num_streams": 1,
+                "blksize": 131072,
+                "omit": 0,
+                "duration": duration,
+                "bytes": 0,
+                "blocks": 0,
+                "reverse": 0,
+                "tos": 0,
+            },
+        },
+        "intervals": intervals,
+        "end": {
+            "streams": end_streams,
+            "sum_sent": end_streams[-1]["sender"],
+            "sum_received": end_streams[0]["receiver"],
+        },
+    }
+    if extra_data is not None:
+        result["extra_data"] = extra_data
+    return result
+
+
+# Produce the data iPerf3 logs when it fails to run.
+def iperf3_error_result() -> Dict[str, Any]:
+    return {
+        "start": {
+            "connected": [],
+            "version": "iperf 3.9",
+            "system_info": system_info,
+        },
+        "intervals": [],
+        "end": {},
+        "error": "error - unable to start listener for connections: Address already in use",
+    }
+
+
+# Format
+# ======
+# Format data as iPerf3 does when writing to its log: tab indented, with the opening and closing braces of each block in the first column.
+def format_iperf3_block(
+    # The data returned by `iperf3_result` or `iperf3_error_result`.
+    data: Dict[str, Any],
+) -> str:
+    text = json.dumps(data, indent="\t", separators=(",", ":\t")) + "\n"
+    # An error also prints a message, which produces invalid JSON.
+    if "error" in data:
+        text += "iperf3: exiting\n"
+    return text
+
+
+# Generate logs
+# =============
+# Yield the blocks for one port's log file, in order.
+def generate_log_blocks(
+    # A random number generator, which makes the output reproducible.
+    rng: random.Random,
+    # The number of runs to produce.
+    num_runs: int,
+    # The fraction (from 0 to 1) of runs which produce an error.
+    error_rate: float = 0.1,
+    # The port the server listened on.
+    port: int = 5201,
+    # The start of the first run, in seconds since the epoch.
+    start_time: int = default_start_time,
+    # The length of each run, in seconds.
+    duration: int = 10,
+) -> Iterator[str]:
+    for run in range(num_runs):
+        if rng.random() < error_rate:
+            yield format_iperf3_block(iperf3_error_result())
+            continue
+        # Mix ``--bidir`` runs with receive-only runs, as in ``no_bidir_iperf3_output.json``.
+        bidir = rng.random() < 0.8
+        yield format_iperf3_block(
+            iperf3_result(
+                start_time + run * default_run_spacing + (port % 100),
+                rng.uniform(1e6, 5e7),
+                rng.uniform(1e6, 5e7) if bidir else None,
+                f"UE {rng.randrange(8)}" if bidir else None,
+                duration,
+                port,
+            )
+        )
+
+
+# Write ``num_ports`` log files, each containing ``num_runs`` runs, to ``log_dir``; return the Paths written. The file names match ``iperf3_log_file_name``.
+def write_synthetic_logs(
+    # The directory to write logs to.
+    log_dir: Path,
+    # The number of ports (log files) to write.
+    num_ports: int,
+    # The number of runs in each log file.
+    num_runs: int,
+    # See ``generate_log_blocks``.
+    error_rate: float = 0.1,
+    # The seed for the random number generator.
+    seed: int = 0,
+    # The port corresponding to the first log file.
+    starting_port: int = 5201,
+    # See ``generate_log_blocks``.
+    duration: int = 10,
+) -> List[Path]:
+    rng = random.Random(seed)
+    log_dir.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for index in range(num_ports):
+        port = starting_port + index
+        path = log_dir / f"port-{port}.json"
+        path.write_text(
+            "".join(
+                generate_log_blocks(rng, num_runs, error_rate, port, duration=duration)
+            )
+        )
+        paths.append(path)
+    return paths
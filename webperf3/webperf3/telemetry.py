@@ -0,0 +1,250 @@
+# *********************************************************
+# |docname| - Sample the Pi's CPU, temperature, and network
+# *********************************************************
+# A low ``receive_bps`` might mean the radio link is poor -- or that the Pi was CPU-bound, thermally throttled, or saturated on ``br0`` or its Wi-Fi interface. To tell these apart, this module samples the Pi's state at a fixed rate into a fixed-size ring buffer; the `log index <webperf3.py>` then annotates each iPerf3 run with a summary of the samples taken during that run.
+#
+# Each sample reads a few small files, which the kernel generates on demand:
+#
+# - ``/proc/stat``: the time all CPUs spent busy and in total.
+# - ``/proc/net/dev``: the bytes received and transmitted by each network interface.
+# - ``/sys/class/thermal/thermal_zone*/temp``: each thermal zone's temperature, in millidegrees C.
+# - ``/sys/devices/system/cpu/cpu*/cpufreq/scaling_cur_freq``: each CPU's clock, in kHz; the Pi lowers this when it throttles.
+# - ``/sys/devices/platform/soc/soc:firmware/get_throttled``: the Pi firmware's throttling flags, when the kernel provides them.
+#
+# Files which don't exist (such as the thermal zones in a container, or the firmware flags on a PC) are skipped; their part of the summary is ``None``. To keep the overhead low, each file is opened once, then re-read in place with ``os.pread``.
+#
+# .. contents:: Table of Contents
+#   :local:
+#   :depth: 2
+#
+#
+# Imports
+# =======
+# These are listed in the order prescribed by `PEP 8`_.
+#
+# Standard library
+# ----------------
+from collections import deque
+import glob
+import os
+from threading import Event, Lock, Thread
+import time
+from typing import (
+    Any,
+    Callable,
+    Deque,
+    Dict,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+# Third-party imports
+# -------------------
+# None.
+#
+# Local application imports
+# -------------------------
+# None.
+
+
+# Parse kernel files
+# ==================
+# Return ``(busy, total)`` CPU time, in clock ticks, from the contents of ``/proc/stat``.
+def parse_proc_stat(text: str) -> Tuple[int, int]:
+    # The first line sums all CPUs: ``cpu user nice system idle iowait irq softirq steal guest guest_nice``. Guest time is already included in user time.
+    times = [int(field) for field in text.split("\n", 1)[0].split()[1:9]]
+    idle = times[3] + times[4]
+    return sum(times) - idle, sum(times)
+
+
+# Return ``{interface: (received bytes, transmitted bytes)}`` from the contents of ``/proc/net/dev``.
+def parse_proc_net_dev(text: str) -> Dict[str, Tuple[int, int]]:
+    counters = {}
+    # Skip the two header lines.
+    for line in text.splitlines()[2:]:
+        interface, _, fields = line.partition(":")
+        values = fields.split()
+        if len(values) >= 9:
+            counters[interface.strip()] = (int(values[0]), int(values[8]))
+    return counters
+
+
+# Samples
+# =======
+class Sample(NamedTuple):
+    # The time of this sample, in seconds since the epoch.
+    time: float
+    # See ``parse_proc_stat``.
+    cpu_busy: int
+    cpu_total: int
+    # The highest temperature of any thermal zone, in millidegrees C.
+    temp: Optional[int]
+    # The lowest clock of any CPU, in kHz.
+    freq: Optional[int]
+    # The firmware's throttling flags.
+    throttled: Optional[int]
+    # For each monitored interface, ``(received bytes, transmitted bytes)``, or ``None`` if the interface doesn't exist.
+    net: Tuple[Optional[Tuple[int, int]], ...]
+
+
+# Return the ``(key, CSV column heading)`` of each value in a summary of ``interfaces``.
+def summary_fields(interfaces: Sequence[str]) -> List[Tuple[str, str]]:
+    fields = [
+        ("cpu_percent", "CPU use (%)"),
+        ("max_temp_c", "Max temperature (C)"),
+        ("min_freq_mhz", "Min CPU clock (MHz)"),
+        ("throttled", "Throttled"),
+    ]
+    for interface in interfaces:
+        fields += [
+            (f"{interface}_rx_bps", f"{interface} receive rate (bps)"),
+            (f"{interface}_tx_bps", f"{interface} transmit rate (bps)"),
+        ]
+    return fields
+
+
+# Summarize ``samples``, which must contain at least two samples, as a dict with the keys given by ``summary_fields``.
+def summarize_samples(
+    samples: Sequence[Sample], interfaces: Sequence[str]
+) -> Dict[str, Any]:
+    first, last = samples[0], samples[-1]
+    elapsed = last.time - first.time
+    cpu_total = last.cpu_total - first.cpu_total
+    temps = [s.temp for s in samples if s.temp is not None]
+    freqs = [s.freq for s in samples if s.freq is not None]
+    throttled = [s.throttled for s in samples if s.throttled is not None]
+    summary: Dict[str, Any] = dict(
+        cpu_percent=(
+            round(100 * (last.cpu_busy - first.cpu_busy) / cpu_total, 1)
+            if cpu_total
+            else None
+        ),
+        max_temp_c=max(temps) / 1000 if temps else None,
+        min_freq_mhz=min(freqs) // 1000 if freqs else None,
+        # Bits 0-3 report under-voltage, a capped clock, throttling, or a soft temperature limit right now.
+        throttled=any(flags & 0xF for flags in throttled) if throttled else None,
+    )
+    for index, interface in enumerate(interfaces):
+        start, end = first.net[index], last.net[index]
+        for direction, key in enumerate(("rx", "tx")):
+            summary[f"{interface}_{key}_bps"] = (
+                round((end[direction] - start[direction]) * 8 / elapsed)
+                if start and end and elapsed > 0
+                else None
+            )
+    return summary
+
+
+# Sampler
+# =======
+class TelemetrySampler:
+    def __init__(
+        self,
+        # The time between samples, in seconds.
+        interval: float = 1,
+        # The number of samples to keep; at the default interval, this covers an hour.
+        capacity: int = 3600,
+        # The network interfaces to monitor.
+        interfaces: Sequence[str] = ("br0", "wlan0"),
+        # This is provided for testing.
+        clock: Callable[[], float] = time.time,
+    ):
+        self.interval = interval
+        self.interfaces = list(interfaces)
+        self.clock = clock
+        self.samples: Deque[Sample] = deque(maxlen=capacity)
+        # Samples are added by the sampling thread and summarized by the log index.
+        self.lock = Lock()
+        self.stop_event = Event()
+        self.thread: Optional[Thread] = None
+        # The open file descriptor of each file read.
+        self.fds: Dict[str, int] = {}
+        self.temp_paths = sorted(glob.glob("/sys/class/thermal/thermal_zone*/temp"))
+        self.freq_paths = sorted(
+            glob.glob("/sys/devices/system/cpu/cpu[0-9]*/cpufreq/scaling_cur_freq")
+        )
+
+    # Return the contents of the file at ``path``, or ``None`` if it can't be read.
+    def _read(self, path: str, size: int = 4096) -> Optional[str]:
+        try:
+            fd = self.fds.get(path)
+            if fd is None:
+                fd = self.fds[path] = os.open(path, os.O_RDONLY)
+            return os.pread(fd, size, 0).decode()
+        except OSError:
+            return None
+
+    # Return the largest (or, if ``smallest``, the smallest) of the integers in the files at ``paths``, or ``None`` if none can be read.
+    def _extreme(self, paths: List[str], smallest: bool = False) -> Optional[int]:
+        values = []
+        for path in paths:
+            text = self._read(path, 64)
+            if text and text.strip().isdigit():
+                values.append(int(text))
+        if not values:
+            return None
+        return min(values) if smallest else max(values)
+
+    # Take one sample.
+    def sample(self) -> Optional[Sample]:
+        stat = self._read("/proc/stat")
+        if stat is None:
+            return None
+        net_dev = parse_proc_net_dev(self._read("/proc/net/dev", 65536) or "")
+        throttled = self._read("/sys/devices/platform/soc/soc:firmware/get_throttled")
+        return Sample(
+            self.clock(),
+            *parse_proc_stat(stat),
+            self._extreme(self.temp_paths),
+            self._extreme(self.freq_paths, smallest=True),
+            int(throttled, 16) if throttled else None,
+            tuple(net_dev.get(interface) for interface in self.interfaces),
+        )
+
+    def _run(self) -> None:
+        while True:
+            sample = self.sample()
+            if sample:
+                with self.lock:
+                    self.samples.append(sample)
+            if self.stop_event.wait(self.interval):
+                break
+        for fd in self.fds.values():
+            os.close(fd)
+
+    def start(self) -> None:
+        self.thread = Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join()
+
+    # Summaries
+    # ---------
+    # Summarize the samples taken from ``start`` to ``end`` (in seconds since the epoch), or return ``None`` if there are fewer than two.
+    def summarize(self, start: float, end: float) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            samples = [s for s in self.samples if start <= s.time <= end]
+        if len(samples) < 2:
+            return None
+        return summarize_samples(samples, self.interfaces)
+
+    # Report this sampler's settings, plus a summary of the last ``window`` seconds.
+    def status(self, window: float = 10) -> Dict[str, Any]:
+        now = self.clock()
+        with self.lock:
+            num_samples = len(self.samples)
+            oldest = self.samples[0].time if self.samples else None
+        return dict(
+            interval=self.interval,
+            capacity=self.samples.maxlen,
+            samples=num_samples,
+            oldest=oldest,
+            interfaces=self.interfaces,
+            recent=self.summarize(now - window, now),
+        )
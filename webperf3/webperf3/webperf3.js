@@ -12,11 +12,22 @@ const formatDate = (datesecs) =>
 const formatRate = (bps) =>
     bps ? Number(Math.round(bps)).toLocaleString() : "";
 
-// Given text, escape it so it formats correctly as HTML. Taken from https://stackoverflow.com/a/48054293. Note that this also transforms newlines into ``<br>`` -- see https://developer.mozilla.org/en-US/docs/Web/API/Node/textContent.
-const escapeHTML = (unsafeText) => {
-    const div = document.createElement("div");
-    div.textContent = unsafeText;
-    return div.innerHTML;
+// Summarize the telemetry recorded during a run, such as ``42% CPU, 61.5 °C, throttled``.
+const formatTelemetry = (telemetry) => {
+    if (!telemetry) {
+        return "";
+    }
+    const parts = [];
+    if (telemetry.cpu_percent != null) {
+        parts.push(`${telemetry.cpu_percent}% CPU`);
+    }
+    if (telemetry.max_temp_c != null) {
+        parts.push(`${telemetry.max_temp_c} °C`);
+    }
+    if (telemetry.throttled) {
+        parts.push("throttled");
+    }
+    return parts.join(", ");
 };
 
 // Compare two arrays with scalar contents from `SO <https://stackoverflow.com/a/19746771/16038919>`__. Insert snarky comment about JavaScript as a programming language here.
@@ -24,10 +35,48 @@ const scalar_array_equals = (array1, array2) =>
     array1.length === array2.length &&
     array1.every((value, index) => value === array2[index]);
 
-// Update the performance table
-// ============================
+// Table state
+// ===========
+// The client keeps the table in memory, then patches only the rows and cells which differ; rebuilding the whole table (and round-tripping it through ``localStorage``) on every update was janky with 100+ ports on the tablets used in the field.
+//
+// The rows most recently fetched from ``/table``.
+let iperf3_data = [];
+// For each row, true if it changed in the most recent update; these rows are highlighted.
+let changed_rows = [];
+// True after the first fetch, which sets the baseline that later updates are compared with.
+let have_data = false;
+// True while a fetch is in progress, and true if another update was requested meanwhile; this coalesces a burst of notifications into at most one extra fetch.
+let is_fetching = false;
+let fetch_again = false;
+// The number of snapshots received over the websocket; a fetch which started before the latest snapshot arrived is stale.
+let num_snapshots = 0;
+
+// Show ``new_data``, a table in the format returned by ``/table``.
+const set_table = (new_data) => {
+    // Compare only the scalar columns; the telemetry (an object) changes only when they do.
+    changed_rows = new_data.map(
+        (row, index) =>
+            have_data &&
+            !scalar_array_equals(
+                (iperf3_data[index] || []).slice(0, 4),
+                (row || []).slice(0, 4)
+            )
+    );
+    iperf3_data = new_data;
+    have_data = true;
+    document.getElementById("last-update").textContent =
+        new Date().toLocaleTimeString();
+    schedule_render();
+};
+
 // Fetch an updated table from the server.
 const update_table = () => {
+    if (is_fetching) {
+        fetch_again = true;
+        return;
+    }
+    is_fetching = true;
+    const snapshots_before = num_snapshots;
     fetch("/table")
         .then((response) => {
             if (!response.ok) {
@@ -35,48 +84,174 @@ const update_table = () => {
             }
             return response.json();
         })
-        .then((iperf3_data) => {
-            // Create the new table.
-            let old_iperf3_data;
-            try {
-                old_iperf3_data = JSON.parse(
-                    window.localStorage.getItem("iperf3-data")
-                );
-            } catch (e) {}
-            // The try/catch will succeed if there's nothing in local storage, but end up with a value of null. Replace this with an empty array.
-            old_iperf3_data = old_iperf3_data || [];
-            let html = `
-<tr>
-    <th>Port</th>
-    <th style="width: 15rem">Name</th>
-    <th style="width: 10rem">Timestamp</th>
-    <th style="width: 10rem">Send rate (bps)</th>
-    <th style="width: 10rem">Receive rate (bps)</th>
-</tr>`;
-            iperf3_data.forEach((row, index) => {
-                html += `
-<tr ${
-                    scalar_array_equals(old_iperf3_data[index] || [], row)
-                        ? ""
-                        : "style='background-color:lightcoral;'"
-                }>
-    <td>${index + 5201}</td>
-    <td>${escapeHTML(row[3])}</td>
-    <td>${formatDate(row[0])}</td>
-    <td>${formatRate(row[1])}</td>
-    <td>${formatRate(row[2])}</td>
-</tr>`;
-            });
-            window.localStorage.setItem(
-                "iperf3-data",
-                JSON.stringify(iperf3_data)
-            );
+        .then((new_data) => {
+            if (num_snapshots === snapshots_before) {
+                set_table(new_data);
+            }
+        })
+        .catch((error) =>
+            console.error(
+                "There has been a problem with your fetch operation:",
+                error
+            )
+        )
+        .finally(() => {
+            is_fetching = false;
+            if (fetch_again) {
+                fetch_again = false;
+                update_table();
+            }
+        });
+};
+
+// Render the table
+// ================
+// Rendering happens at most once per frame, no matter how many updates (or scroll events) arrive.
+let is_render_scheduled = false;
+const schedule_render = () => {
+    if (!is_render_scheduled) {
+        is_render_scheduled = true;
+        requestAnimationFrame(render);
+    }
+};
+
+// With more rows than this, only the rows visible in the table's scrolling container (plus ``overscan`` rows above and below) are in the DOM; spacer rows stand in for the rest.
+const virtualize_threshold = 100;
+const overscan = 10;
+// The height of a row, in pixels, measured once the first row is rendered.
+let row_height = 0;
+// The table's body, and the spacer rows at its top and bottom.
+let tbody;
+let top_spacer;
+let bottom_spacer;
+// The rendered rows. Each slot holds a ``tr``, its ``td`` elements, the text last written to each cell, and whether it's highlighted.
+const slots = [];
+const num_columns = 6;
+
+const create_spacer = () => {
+    const tr = document.createElement("tr");
+    tr.className = "spacer";
+    const td = document.createElement("td");
+    td.colSpan = num_columns;
+    tr.appendChild(td);
+    return tr;
+};
+
+const create_slot = () => {
+    const tr = document.createElement("tr");
+    const cells = [];
+    for (let column = 0; column < num_columns; column++) {
+        cells.push(tr.appendChild(document.createElement("td")));
+    }
+    return { tr, cells, texts: [], is_changed: false };
+};
+
+// Update the cells of ``slot`` to show row ``index``, touching only those which changed.
+const patch_slot = (slot, index) => {
+    const row = iperf3_data[index] || [];
+    const texts = [
+        String(index + 5201),
+        row[3] == null ? "" : String(row[3]),
+        formatDate(row[0]),
+        formatRate(row[1]),
+        formatRate(row[2]),
+        formatTelemetry(row[4]),
+    ];
+    texts.forEach((text, column) => {
+        if (slot.texts[column] !== text) {
+            slot.cells[column].textContent = text;
+            slot.texts[column] = text;
+        }
+    });
+    const is_changed = !!changed_rows[index];
+    if (slot.is_changed !== is_changed) {
+        slot.tr.classList.toggle("changed", is_changed);
+        slot.is_changed = is_changed;
+    }
+};
+
+const render = () => {
+    is_render_scheduled = false;
+    const container = document.getElementById("perf-table-container");
+    if (!tbody) {
+        tbody = document.getElementById("perf-table-body");
+        top_spacer = tbody.appendChild(create_spacer());
+        bottom_spacer = tbody.appendChild(create_spacer());
+        container.addEventListener("scroll", schedule_render, {
+            passive: true,
+        });
+    }
+
+    // Determine which rows to render.
+    const num_rows = iperf3_data.length;
+    let first = 0;
+    let last = num_rows;
+    const is_virtual = num_rows > virtualize_threshold && row_height > 0;
+    if (is_virtual) {
+        first = Math.max(
+            0,
+            Math.floor(container.scrollTop / row_height) - overscan
+        );
+        last = Math.min(
+            num_rows,
+            Math.ceil(
+                (container.scrollTop + container.clientHeight) / row_height
+            ) + overscan
+        );
+    }
+    top_spacer.style.height = `${first * row_height}px`;
+    bottom_spacer.style.height = `${(num_rows - last) * row_height}px`;
 
-            // Update the resulting HTML.
-            document.getElementById("perf-table").innerHTML = html;
-            document.getElementById("last-update").innerHTML =
-                new Date().toLocaleTimeString();
+    // Add or remove slots to match, then patch each one.
+    while (slots.length < last - first) {
+        const slot = create_slot();
+        tbody.insertBefore(slot.tr, bottom_spacer);
+        slots.push(slot);
+    }
+    while (slots.length > last - first) {
+        slots.pop().tr.remove();
+    }
+    slots.forEach((slot, offset) => patch_slot(slot, first + offset));
+
+    // Once a row's height is known, a large table can be virtualized.
+    if (!row_height && slots.length) {
+        row_height = slots[0].tr.getBoundingClientRect().height;
+        if (num_rows > virtualize_threshold) {
+            schedule_render();
+        }
+    }
+};
+
+// Alerts
+// ======
+// Show alerts from the anomaly detector, newest first. The id of the newest alert shown lets the client fetch only the alerts it missed while disconnected or resyncing.
+let last_alert_id = 0;
+const max_alerts_shown = 20;
+
+const show_alert = (alert) => {
+    if (alert.id <= last_alert_id) {
+        return;
+    }
+    last_alert_id = alert.id;
+    const list = document.getElementById("alerts");
+    const li = document.createElement("li");
+    li.className = `alert-${alert.kind}`;
+    li.textContent = `${formatDate(alert.timestamp)}: ${alert.message}`;
+    list.insertBefore(li, list.firstChild);
+    while (list.children.length > max_alerts_shown) {
+        list.lastChild.remove();
+    }
+};
+
+const fetch_alerts = () => {
+    fetch(`/alerts?since=${last_alert_id}&limit=${max_alerts_shown}`)
+        .then((response) => {
+            if (!response.ok) {
+                throw new Error("Network response was not OK");
+            }
+            return response.json();
         })
+        .then((alerts) => alerts.forEach(show_alert))
         .catch((error) =>
             console.error(
                 "There has been a problem with your fetch operation:",
@@ -85,6 +260,142 @@ const update_table = () => {
         );
 };
 
+// Binary messages
+// ===============
+// Decode the subset of `MessagePack <https://github.com/msgpack/msgpack/blob/master/spec.md>`_ which the server sends (see `wire.py`): nil, booleans, integers, floats, strings, binary (returned as a ``Uint8Array``), arrays, and maps (returned as objects).
+const text_decoder = new TextDecoder();
+
+const decode_msgpack = (buffer) => {
+    const view = new DataView(buffer);
+    const bytes = new Uint8Array(buffer);
+    let offset = 0;
+    const take = (length) => {
+        offset += length;
+        return offset - length;
+    };
+    const array = (length) => {
+        const result = [];
+        for (let index = 0; index < length; index++) {
+            result.push(decode());
+        }
+        return result;
+    };
+    const map = (length) => {
+        const result = {};
+        for (let index = 0; index < length; index++) {
+            const key = decode();
+            result[key] = decode();
+        }
+        return result;
+    };
+    const str = (length) =>
+        text_decoder.decode(bytes.subarray(take(length), offset));
+    const bin = (length) => bytes.slice(take(length), offset);
+    const uint64 = () =>
+        view.getUint32(take(8)) * 2 ** 32 + view.getUint32(offset - 4);
+    const decode = () => {
+        const type = view.getUint8(take(1));
+        if (type < 0x80) {
+            return type;
+        }
+        if (type < 0x90) {
+            return map(type & 0x0f);
+        }
+        if (type < 0xa0) {
+            return array(type & 0x0f);
+        }
+        if (type < 0xc0) {
+            return str(type & 0x1f);
+        }
+        if (type >= 0xe0) {
+            return type - 0x100;
+        }
+        switch (type) {
+            case 0xc0:
+                return null;
+            case 0xc2:
+                return false;
+            case 0xc3:
+                return true;
+            case 0xc4:
+                return bin(view.getUint8(take(1)));
+            case 0xc5:
+                return bin(view.getUint16(take(2)));
+            case 0xc6:
+                return bin(view.getUint32(take(4)));
+            case 0xca:
+                return view.getFloat32(take(4));
+            case 0xcb:
+                return view.getFloat64(take(8));
+            case 0xcc:
+                return view.getUint8(take(1));
+            case 0xcd:
+                return view.getUint16(take(2));
+            case 0xce:
+                return view.getUint32(take(4));
+            case 0xcf:
+                return uint64();
+            case 0xd0:
+                return view.getInt8(take(1));
+            case 0xd1:
+                return view.getInt16(take(2));
+            case 0xd2:
+                return view.getInt32(take(4));
+            case 0xd3:
+                return (
+                    view.getInt32(take(8)) * 2 ** 32 +
+                    view.getUint32(offset - 4)
+                );
+            case 0xd9:
+                return str(view.getUint8(take(1)));
+            case 0xda:
+                return str(view.getUint16(take(2)));
+            case 0xdb:
+                return str(view.getUint32(take(4)));
+            case 0xdc:
+                return array(view.getUint16(take(2)));
+            case 0xdd:
+                return array(view.getUint32(take(4)));
+            case 0xde:
+                return map(view.getUint16(take(2)));
+            case 0xdf:
+                return map(view.getUint32(take(4)));
+            default:
+                throw new Error(`Unsupported MessagePack type ${type}.`);
+        }
+    };
+    return decode();
+};
+
+// Unpack a column of little-endian float64s, with NaN for a missing value.
+const unpack_floats = (bin) => {
+    const view = new DataView(bin.buffer, bin.byteOffset, bin.byteLength);
+    const values = [];
+    for (let offset = 0; offset < bin.byteLength; offset += 8) {
+        const value = view.getFloat64(offset, true);
+        values.push(Number.isNaN(value) ? null : value);
+    }
+    return values;
+};
+
+// Convert a snapshot message to a table in the format returned by ``/table``.
+const decode_snapshot = (message) => {
+    const timestamps = unpack_floats(message.timestamp);
+    const send_bps = unpack_floats(message.send_bps);
+    const receive_bps = unpack_floats(message.receive_bps);
+    return timestamps.map((timestamp, index) =>
+        message.present[index]
+            ? [
+                  timestamp,
+                  send_bps[index],
+                  receive_bps[index],
+                  message.name[index],
+                  message.telemetry[index],
+              ]
+            : null
+    );
+};
+
 // Websocket
 // =========
 // A function to update the connection status of the webpage.
@@ -94,13 +405,19 @@ const setIsConnected = (text, backgroundColor) => {
     ic.style.backgroundColor = backgroundColor;
 };
 
-// Create a websocket to communicate with the CodeChat Server.
-const ws = new ReconnectingWebSocket(`ws://${window.location.hostname}:8765`);
+// Create a websocket to communicate with the CodeChat Server. The main page defines ``websocket_port``. Ask for binary messages, which contain the table itself; a server which doesn't offer them sends text messages instead.
+const ws = new ReconnectingWebSocket(
+    `ws://${window.location.hostname}:${websocket_port}`,
+    ["webperf3.msgpack"],
+    { binaryType: "arraybuffer" }
+);
 
 // When connected, update the webpage's connection status.
 ws.onopen = () => {
     console.log("webperf3 client: websocket to webperf3 server open.");
     setIsConnected("online", "white");
+    // Catch up on alerts sent while this page wasn't connected.
+    fetch_alerts();
 };
 
 // Provide logging to help track down errors.
@@ -114,10 +431,27 @@ ws.onclose = (event) => {
     setIsConnected("offline", "salmon");
 };
 
-// Handle messages, which is always new contents for the perf table.
+// Handle messages. Two tell the client to fetch the perf table: ``new data`` means the table changed, while ``resync`` means this client fell behind and missed some updates (possibly including alerts). A JSON message contains an alert. A binary message contains either the table (a snapshot) or an alert.
 ws.onmessage = (event) => {
-    if (event.data === "new data") {
+    if (event.data instanceof ArrayBuffer) {
+        const message = decode_msgpack(event.data);
+        if (message.type === "snapshot") {
+            num_snapshots++;
+            set_table(decode_snapshot(message));
+        } else if (message.type === "alert") {
+            show_alert(message.alert);
+        } else {
+            console.error(
+                `webperf3 client: websocket received unknown message type ${message.type}`
+            );
+        }
+    } else if (event.data === "new data") {
+        update_table();
+    } else if (event.data === "resync") {
         update_table();
+        fetch_alerts();
+    } else if (event.data.startsWith('{"alert"')) {
+        show_alert(JSON.parse(event.data).alert);
     } else {
         console.error(
             `webperf3 client: websocket received unknown message ${event.data}`
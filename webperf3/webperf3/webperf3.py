@@ -6,6 +6,8 @@
 # - `iPerf3 utilities`_, which run iPerf3 servers and interpret the results from JSON logs the servers create.
 # - A webserver_, which reports iPerf3 results.
 # - A `websocket and watcher`_, which looks for changes to the iPerf3 log files. A change causes the websocket to refresh the client, displaying any new results.
+# - A `telemetry sampler <telemetry.py>`, which records the Pi's CPU, temperature, and network use; each result is annotated with the telemetry recorded during its run.
+# - Optionally, a `persister <staging.py>`, which lets the logs live in RAM, copying them to the SD card in batches.
 #
 # Possible extensions:
 #
@@ -26,27 +28,45 @@
 #
 # Standard library
 # ^^^^^^^^^^^^^^^^
+import argparse
 import asyncio
 import csv
 from io import StringIO
 import json
+import multiprocessing
+import os
 from pathlib import Path
-import sys
+import signal
+import subprocess
 from textwrap import dedent
-from threading import Thread
+from threading import Event, Lock, Thread
 import time
-from typing import Any, Dict, List, Optional, Tuple, Union
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
 
 # Third-party imports
 # ^^^^^^^^^^^^^^^^^^^
-from bottle import response, route, run, static_file
-from watchgod import awatch
-import websockets
-import websockets.server
+# To start quickly on the Pi, the heavy third-party imports (bottle, paste, websockets, and watchgod) are performed by the functions which need them; this also keeps the log utilities importable by tools such as `replay <replay.py>` without loading the webserver. Only type checking imports them here.
+if TYPE_CHECKING:
+    import bottle
+    import websockets.server
+
+    from .shared_table import ResultsTable
+    from .telemetry import TelemetrySampler
 
 # Local application imports
 # ^^^^^^^^^^^^^^^^^^^^^^^^^
-from .ci_utils import is_win, xqt
+from .anomaly import AlertStore, AnomalyDetector, alert_message
+from .ci_utils import is_win
 
 # Globals
 # -------
@@ -54,6 +74,34 @@ from .ci_utils import is_win, xqt
 num_servers = None
 # The first port (which iPerf3 defaults to) to use when starting servers.
 starting_port = 5201
+# The directory where iPerf3 servers write their logs.
+log_dir = Path.home() / "iperf3-logs" if is_win else Path("/home/pi/iperf3-logs")
+# The port the websocket listens on.
+websocket_port = 8765
+# The name of the file, stored in the log directory, which persists the `log index`_, and the time between saves of it, in seconds.
+log_index_file_name = ".webperf3-index.json"
+log_index_save_interval = 60
+# The name of the journal, stored in the log directory, which persists the log index's telemetry.
+telemetry_file_name = ".webperf3-telemetry.jsonl"
+# Events set when each part of this program is ready; see `readiness`_.
+ready_events = {name: Event() for name in ("iperf3", "index", "websocket")}
+# The time this program started, in seconds since the epoch.
+start_time = time.time()
+# When serving with several worker processes, the `shared results table <shared_table.py>` the ingester publishes to and the workers read from; otherwise, ``None``.
+results_table: Optional["ResultsTable"] = None
+# The `telemetry sampler <telemetry.py>` which annotates each run, or ``None`` if sampling is disabled (or in a worker process).
+telemetry_sampler: Optional["TelemetrySampler"] = None
+# The network interfaces the telemetry sampler monitors; these determine the telemetry columns in ``/csv``.
+telemetry_interfaces = ["br0", "wlan0"]
+# The `anomaly detector <anomaly.py>` fed by each refresh of the log index, or ``None`` in a worker process.
+anomaly_detector: Optional[AnomalyDetector] = None
+# The alerts raised by the anomaly detector, and the name of the file, stored in the log directory, which records them.
+alert_store = AlertStore()
+alerts_file_name = ".webperf3-alerts.jsonl"
+# The token which enables the `admin endpoints <profiling.py>`, or ``None`` to omit them.
+admin_token: Optional[str] = None
+# The running `WebSocketWatcher`, if any.
+websocket_watcher: Optional["WebSocketWatcher"] = None
 
 
 # iPerf3 utilities
@@ -97,31 +145,38 @@ def read_iperf3_json_log(
         return {}
 
 
+# Split JSON-like log data from iPerf3 into blocks, each containing the text written by one run of iPerf3.
+def split_iperf3_json_log(
+    # The contents of an iPerf3 log file.
+    pseudo_json: str,
+    # Returns a list of blocks. Concatenating these reproduces ``pseudo_json``.
+) -> List[str]:
+    # See comments in ``read_iperf3_json_log``. Split the data based the beginning/end of JSON data.
+    blocks: List[str] = []
+    start = 0
+    while start < len(pseudo_json):
+        # Find the end of the current JSON block; if not found, go to the end of the string.
+        end = pseudo_json.find("\n{", start) + 1 or len(pseudo_json)
+        blocks.append(pseudo_json[start:end])
+        # Move to the next chunk.
+        start = end
+
+    return blocks
+
+
 # Read all entries in a JSON-like log data from iPerf3, returning them as an array of Python data structures.
 def read_all_iperf3_json_log(
     # See log_path_.
     log_path: Union[Path, str],
     # Returns an array of iPerf3 results.
 ) -> List[Dict[str, Any]]:
-    # See comments in ``read_iperf3_json_log``.
-    pseudo_json = Path(log_path).read_text()
-
-    # Split the data based the beginning/end of JSON data.
     json_arr: List[Dict[str, Any]] = []
-    start = 0
-    while True:
-        # Find the end of the current JSON block; if not found, go to the end of the string.
-        end = pseudo_json.find("\n{", start) + 1 or len(pseudo_json)
+    for json_fragment in split_iperf3_json_log(Path(log_path).read_text()):
         # Interpret this chunk as JSON.
-        json_fragment = pseudo_json[start:end]
         try:
             json_arr.append(json.loads(json_fragment))
         except json.decoder.JSONDecodeError:
             pass
-        # Move to the next chunk, or exit after the last chunk.
-        start = end
-        if start == len(pseudo_json):
-            break
 
     return json_arr
 
@@ -162,11 +217,7 @@ def iperf3_log_file_name(
     server_index: int,
     # A Path to an iPerf3 log file.
 ) -> Path:
-    return (
-        Path.home() / f"iperf3-logs/port-{server_index + starting_port}.json"
-        if is_win
-        else Path(f"/home/pi/iperf3-logs/port-{server_index + starting_port}.json")
-    )
+    return log_dir / f"port-{server_index + starting_port}.json"
 
 
 # Export all data
@@ -198,23 +249,321 @@ def export_csv(
     # 2.    Send bps
     # 3.    Receive bps
     # 4.    Name
-    data = [el for el in read_all_iperf3_logs(num_servers) if el[1]]
+    data = [el for el in log_index.read_all(num_servers) if el[1]]
     # Sort by the timestamp, which is element 1 of each tuple in the list.
     data.sort(key=lambda l: l[1])  # type: ignore
+    timestamps = [el[1] for el in data]
     # Convert the time to `excel's format <https://exceljet.net/excel-functions/excel-date-function>`_, including moving from GMT to local time. Note that ``DATE(1970,1,1)`` == 25569.
     data = [(el[0], el[4], (el[1] + time.localtime(el[1]).tm_gmtoff) / 86400 + 25569, el[2], el[3]) for el in data]  # type: ignore
+    # Append the `telemetry <telemetry.py>` recorded during each run; these columns are blank for runs without telemetry.
+    from .telemetry import summary_fields
+
+    fields = summary_fields(telemetry_interfaces)
+    data = [
+        el + tuple((log_index.run_telemetry(el[0], timestamp) or {}).get(key) for key, _ in fields)  # type: ignore
+        for el, timestamp in zip(data, timestamps)
+    ]
 
     # Write it out
     s = StringIO()
     writer = csv.writer(s)
     writer.writerow(
         ["Port", "Name", "Timestamp", "Send rate (bps)", "Receive rate (bps)"]
+        + [heading for _, heading in fields]
     )
     writer.writerows(data)
 
     return s.getvalue()
 
 
+# Log index
+# ---------
+# Parsing every log on every request is slow on the Pi, especially for the full history needed by ``/csv``. Instead, this index caches the performance data extracted from each log file, keyed by the file's size and modification time. When a log grows, only the newly appended data is parsed. The index is persisted to disk, so that a restart (such as a reboot of the Pi) doesn't require parsing all the logs again.
+class LogIndex:
+    def __init__(self) -> None:
+        # For each log file (as a string), a dict of:
+        #
+        # stat
+        #   The ``[size, modification time in ns]`` of the file when it was indexed.
+        # offset
+        #   The offset, in bytes, of the last block in the file. Since iPerf3 may still be writing this block, it's parsed again each time the file changes.
+        # results
+        #   The performance data (see ``extract_iperf3_performance``) of each valid block before ``offset``.
+        # tail
+        #   The performance data of each valid block at or after ``offset``.
+        # last
+        #   The performance data of the last block, or all ``None`` if the last block isn't valid; this matches ``read_iperf3_json_log``.
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        # The `telemetry <telemetry.py>` summary for each run, keyed by ``telemetry_key``. Entries are pruned with the runs they describe.
+        self.telemetry: Dict[str, Dict[str, Any]] = {}
+        # Telemetry is persisted in a journal (a JSON Lines file) rather than with the entries, so that new telemetry costs an append, and so that worker processes can read just the new telemetry. These are the keys added since the journal was last written, and True if telemetry was pruned since then, which requires rewriting the journal.
+        self.unjournaled: List[str] = []
+        self.journal_pruned = False
+        # When reading the journal: its ``(device, inode)``, which changes when it's rewritten, and the offset read up to.
+        self.journal_position: Tuple[Optional[Tuple[int, int]], int] = (None, 0)
+        # True if the entries changed since they were last saved.
+        self.dirty = False
+        # The runs parsed since ``refresh`` last returned, in the format of ``read_all``; requests also parse logs, so their runs wait here. This is ``None`` until ``refresh`` is first called, so that an index which is only read doesn't accumulate them.
+        self.new_runs: Optional[List[Tuple]] = None
+        # This index is shared by the webserver's threads and the watcher.
+        self.lock = Lock()
+
+    # The key for the telemetry of the run at ``timestamp`` on ``port``: a string, since the telemetry is stored as JSON. Runs on different ports may start in the same second, so each has its own summary.
+    @staticmethod
+    def telemetry_key(port: int, timestamp: Optional[int]) -> str:
+        return f"{port}:{timestamp}"
+
+    # Update the entry for ``log_path``, the log for ``port``, if the file changed, returning the entry or ``None`` if the file doesn't exist. The caller must hold ``self.lock``.
+    def _refresh(self, log_path: Path, port: int) -> Optional[Dict[str, Any]]:
+        key = str(log_path)
+        try:
+            st = log_path.stat()
+        except FileNotFoundError:
+            if self.entries.pop(key, None):
+                self._prune_telemetry(port, set())
+                self.dirty = True
+            return None
+        stat = [st.st_size, st.st_mtime_ns]
+        entry = self.entries.get(key)
+        if entry and entry["stat"] == stat:
+            return entry
+
+        # Parse only the data after the last block, unless the file shrank (for example, it was replaced).
+        rebuilt = not entry or st.st_size < entry["stat"][0]
+        if not entry or rebuilt:
+            entry = dict(stat=stat, offset=0, results=[])
+            num_runs = 0
+        else:
+            num_runs = len(entry["results"]) + len(entry["tail"])
+        with open(log_path, "rb") as f:
+            f.seek(entry["offset"])
+            # Use ``surrogateescape`` so that the encoded length of each block matches its length on disk.
+            text = f.read().decode("utf-8", "surrogateescape")
+        blocks = split_iperf3_json_log(text)
+
+        def parse(block: str) -> Optional[Dict[str, Any]]:
+            try:
+                log_data = json.loads(block)
+            except json.decoder.JSONDecodeError:
+                return None
+            self._annotate(port, log_data)
+            return log_data
+
+        for block in blocks[:-1]:
+            log_data = parse(block)
+            if log_data is not None:
+                entry["results"].append(extract_iperf3_performance(log_data))
+            entry["offset"] += len(block.encode("utf-8", "surrogateescape"))
+        tail_data = parse(blocks[-1]) if blocks else None
+        entry["tail"] = (
+            [] if tail_data is None else [extract_iperf3_performance(tail_data)]
+        )
+        entry["last"] = extract_iperf3_performance(tail_data or {})
+        entry["stat"] = stat
+        self.entries[key] = entry
+        # The runs before ``num_runs`` were parsed before, though the last of them may have moved from the tail to the results.
+        if self.new_runs is not None:
+            self.new_runs += [
+                (port,) + tuple(result)
+                for result in (entry["results"] + entry["tail"])[num_runs:]
+            ]
+        if rebuilt:
+            # Drop the telemetry of runs which are no longer in the log.
+            self._prune_telemetry(
+                port, {result[0] for result in entry["results"] + entry["tail"]}
+            )
+        self.dirty = True
+        return entry
+
+    # Remove the telemetry for runs on ``port`` whose timestamps aren't in ``timestamps``. The caller must hold ``self.lock``.
+    def _prune_telemetry(self, port: int, timestamps: Set[Optional[int]]) -> None:
+        keep = {self.telemetry_key(port, timestamp) for timestamp in timestamps}
+        prefix = f"{port}:"
+        for key in [
+            key for key in self.telemetry if key.startswith(prefix) and key not in keep
+        ]:
+            del self.telemetry[key]
+            self.journal_pruned = True
+
+    # Record the telemetry taken during the run in ``log_data`` on ``port``, if it's not already recorded. The caller must hold ``self.lock``.
+    def _annotate(self, port: int, log_data: Dict[str, Any]) -> None:
+        try:
+            start = log_data["start"]
+            timesecs = start["timestamp"]["timesecs"]
+            duration = start["test_start"]["duration"]
+        except (KeyError, TypeError):
+            return
+        key = self.telemetry_key(port, timesecs)
+        if telemetry_sampler is None or key in self.telemetry:
+            return
+        summary = telemetry_sampler.summarize(timesecs, timesecs + duration)
+        if summary:
+            self.telemetry[key] = summary
+            self.unjournaled.append(key)
+
+    # Return the telemetry summary for the run at ``timestamp`` on ``port``, or ``None`` if there's no telemetry for this run.
+    def run_telemetry(
+        self, port: int, timestamp: Optional[int]
+    ) -> Optional[Dict[str, Any]]:
+        return self.telemetry.get(self.telemetry_key(port, timestamp))
+
+    # Return the performance data from the last block in the log for ``server_index``, or ``None`` if the log doesn't exist.
+    def latest(self, server_index: int) -> Optional[Tuple]:
+        with self.lock:
+            entry = self._refresh(
+                iperf3_log_file_name(server_index), server_index + starting_port
+            )
+            return tuple(entry["last"]) if entry else None
+
+    # Return the same data as ``read_all_iperf3_logs``.
+    def read_all(
+        self,
+        # See num_servers_.
+        num_servers: int,
+    ) -> List[
+        Tuple[int, Optional[int], Optional[float], Optional[float], Optional[str]]
+    ]:
+        iperf3_data = []
+        with self.lock:
+            for server_index in range(num_servers):
+                port = server_index + starting_port
+                entry = self._refresh(iperf3_log_file_name(server_index), port)
+                if entry:
+                    iperf3_data += [
+                        (port,) + tuple(result)  # type: ignore
+                        for result in entry["results"] + entry["tail"]
+                    ]
+        return iperf3_data
+
+    # Bring the index up to date with the logs of ``num_servers`` servers, returning the runs parsed since the last call, in the format of ``read_all``. This reads only what was appended to each log.
+    def refresh(
+        self,
+        # See num_servers_.
+        num_servers: int,
+    ) -> List[Tuple]:
+        with self.lock:
+            if self.new_runs is None:
+                self.new_runs = []
+            for server_index in range(num_servers):
+                self._refresh(
+                    iperf3_log_file_name(server_index), server_index + starting_port
+                )
+            new_runs, self.new_runs = self.new_runs, []
+        return new_runs
+
+    # Load a persisted index. Each entry is checked against its file's current size and modification time when it's next used, so stale entries are re-parsed.
+    def load(self, index_path: Path) -> None:
+        try:
+            data = json.loads(index_path.read_text())
+        except (OSError, ValueError):
+            return
+        if not isinstance(data, dict):
+            data = {}
+        with self.lock:
+            self.entries = data.get("entries", {})
+            self.dirty = False
+
+    # Persist this index, if it changed. Write to a temporary file then rename it, so that a crash doesn't leave a partially-written index.
+    def save(self, index_path: Path) -> None:
+        with self.lock:
+            if not self.dirty:
+                return
+            text = json.dumps(dict(entries=self.entries))
+            self.dirty = False
+        temp_path = index_path.with_suffix(".tmp")
+        temp_path.write_text(text)
+        os.replace(temp_path, index_path)
+
+    # Append new telemetry to the journal at ``journal_path``; if telemetry was pruned, rewrite the journal instead, in the same way as ``save``.
+    def save_telemetry(self, journal_path: Path) -> None:
+        with self.lock:
+            pruned = self.journal_pruned
+            keys = list(self.telemetry) if pruned else self.unjournaled
+            lines = [
+                json.dumps(dict(key=key, telemetry=self.telemetry[key])) + "\n"
+                for key in keys
+                if key in self.telemetry
+            ]
+            self.unjournaled = []
+            self.journal_pruned = False
+        if pruned:
+            temp_path = journal_path.with_suffix(".tmp")
+            temp_path.write_text("".join(lines))
+            os.replace(temp_path, journal_path)
+        elif lines:
+            with open(journal_path, "a") as f:
+                f.writelines(lines)
+
+    # Read the telemetry added to the journal at ``journal_path`` since it was last read, or all of it if the journal was rewritten.
+    def load_telemetry(self, journal_path: Path) -> None:
+        try:
+            with open(journal_path, "rb") as f:
+                st = os.fstat(f.fileno())
+                identity, offset = self.journal_position
+                rewritten = identity != (st.st_dev, st.st_ino) or st.st_size < offset
+                if rewritten:
+                    offset = 0
+                f.seek(offset)
+                data = f.read()
+        except FileNotFoundError:
+            return
+        # Leave a partially-written line for the next read.
+        length = data.rfind(b"\n") + 1
+        with self.lock:
+            if rewritten:
+                self.telemetry = {}
+            for line in data[:length].splitlines():
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                self.telemetry[record["key"]] = record["telemetry"]
+            self.journal_position = ((st.st_dev, st.st_ino), offset + length)
+
+
+# The index used by the webserver.
+log_index = LogIndex()
+
+
+# The ``time.monotonic()`` after which to save the log index again.
+_next_index_save = 0.0
+
+
+# Bring the log index up to date with the logs, and persist its new telemetry. Pass any new runs to the anomaly detector, returning the alerts it raises. With worker processes, also publish the latest results to them.
+def refresh_log_index() -> List[Dict[str, Any]]:
+    global _next_index_save
+
+    new_runs = log_index.refresh(num_servers or 0)
+    log_index.save_telemetry(log_dir / telemetry_file_name)
+    # Rewriting the whole index after every run would cost a write of the full history to the SD card, so save it periodically (and at shutdown). After a crash, the runs since the last save are parsed again.
+    now = time.monotonic()
+    if now >= _next_index_save:
+        log_index.save(log_dir / log_index_file_name)
+        _next_index_save = now + log_index_save_interval
+    alerts: List[Dict[str, Any]] = []
+    if anomaly_detector is not None:
+        alerts = alert_store.add(
+            anomaly_detector.ingest(new_runs), log_dir / alerts_file_name
+        )
+    # Tell the workers about new alerts and results only after they're written, so that a worker which reads the files finds them.
+    if results_table is not None:
+        results_table.set_last_alert_id(alert_store.last_id)
+        results_table.publish(latest_results())
+    return alerts
+
+
+# Load the persisted log index, then bring it up to date; this runs at startup.
+def warm_log_index() -> None:
+    log_index.load(log_dir / log_index_file_name)
+    log_index.load_telemetry(log_dir / telemetry_file_name)
+    alert_store.load(log_dir / alerts_file_name)
+    # Train the anomaly detector's baselines on the history present at startup, which shouldn't raise alerts; after this, it sees only new runs.
+    if anomaly_detector is not None:
+        anomaly_detector.ingest(log_index.read_all(num_servers or 0), train=True)
+    refresh_log_index()
+    ready_events["index"].set()
+
+
 # Start iPerf3 servers
 # --------------------
 # TODO: will all these subprocesses automatically be killed when this program exits? That's what we want.
@@ -223,12 +572,21 @@ def start_iperf3_servers(
     num_servers: int,
 ) -> None:
 
+    # Launch each server directly, rather than through a shell, and don't wait for it; all the servers therefore start concurrently.
     for server_index in range(num_servers):
-        cmd = (
-            f"iperf3 --server --json --port {server_index + starting_port} "
-            f"--logfile {iperf3_log_file_name(server_index)}"
+        subprocess.Popen(
+            [
+                "iperf3",
+                "--server",
+                "--json",
+                "--port",
+                str(server_index + starting_port),
+                "--logfile",
+                str(iperf3_log_file_name(server_index)),
+            ],
+            # On Windows, give each server its own console, as ``start`` does.
+            creationflags=subprocess.CREATE_NEW_CONSOLE if is_win else 0,  # type: ignore
         )
-        xqt(f"start {cmd}" if is_win else f"{cmd} &")
 
 
 # Webserver
@@ -237,10 +595,9 @@ def start_iperf3_servers(
 # Main page
 # ---------
 # This is the main web page which displays iPerf3 stats.
-@route("/")
 def home_page():
     return dedent(
-        """
+        f"""
         <!DOCTYPE html>
         <html>
             <head>
@@ -249,21 +606,55 @@ def home_page():
 
                 <!-- Use the ``ReconnectingWebsocket`` to automatically reconnect a websocket when the network connection drops. -->
                 <script src="/static/ReconnectingWebsocket.js?v=1"></script>
-                <script src="/static/webperf3.js?v=1"></script>
+                <!-- Tell the client which port the websocket listens on. -->
+                <script>const websocket_port = {websocket_port};</script>
+                <script src="/static/webperf3.js?v=7"></script>
 
                 <style>
-                    table, th, td {
+                    table, th, td {{
                         border: 1px solid white;
                         border-collapse: collapse;
-                    }
-                    tr {
+                    }}
+                    tr {{
                         background-color: #96D4D4;
-                    }
+                    }}
+                    /* Rows which changed in the last update. */
+                    tr.changed {{
+                        background-color: lightcoral;
+                    }}
+                    /* Spacers stand in for the rows not rendered in a large table. */
+                    tr.spacer, tr.spacer td {{
+                        background-color: transparent;
+                        border: none;
+                        padding: 0;
+                    }}
+                    /* Alerts for drops and stalls are more urgent than those for a missing direction. */
+                    li.alert-drop, li.alert-stall {{
+                        color: darkred;
+                    }}
+                    #perf-table-container {{
+                        max-height: 75vh;
+                        overflow-y: auto;
+                    }}
                 </style>
             </head>
             <body>
                 <h1>iPerf3 performance measurements</h1>
-                <table id="perf-table"></table>
+                <div id="perf-table-container">
+                    <table id="perf-table">
+                        <thead>
+                            <tr>
+                                <th>Port</th>
+                                <th style="width: 15rem">Name</th>
+                                <th style="width: 10rem">Timestamp</th>
+                                <th style="width: 10rem">Send rate (bps)</th>
+                                <th style="width: 10rem">Receive rate (bps)</th>
+                                <th style="width: 15rem">Pi during run</th>
+                            </tr>
+                        </thead>
+                        <tbody id="perf-table-body"></tbody>
+                    </table>
+                </div>
                 <div>
                     Status: <span id="is_connected">waiting</span>.
                     Last update: <span id="last-update">Unknown</span>.
@@ -272,52 +663,311 @@ def home_page():
                 <div>
                     <button type="button" onclick="update_table();">Update now</button>
                     <button type="button" onclick="location.href='/csv'">Download all log data</button>
+                    <button type="button" onclick="location.href='/xlsx'">Download as an Excel workbook</button>
                 </div>
+                <h2>Alerts</h2>
+                <ul id="alerts"></ul>
             </body>
         </html>
         """
     )
 
 
+# Return the latest performance data for each server, followed by the `telemetry <telemetry.py>` recorded during that run (or ``None``). If there's no log file yet, this produces a blank entry.
+def latest_results() -> List[Optional[Tuple]]:
+    results = []
+    for index in range(num_servers or 0):
+        latest = log_index.latest(index)
+        results.append(
+            None
+            if latest is None
+            else latest + (log_index.run_telemetry(index + starting_port, latest[0]),)
+        )
+    return results
+
+
 # Create the table of performance results.
-@route("/table")
 def create_table():
-    # Look at logs to get current iPerf3 data.
-    iperf3_data = [None] * num_servers
-    for index in range(num_servers):
-        try:
-            iperf3_data[index] = extract_iperf3_performance(
-                read_iperf3_json_log(iperf3_log_file_name(index))
-            )
-        # If there's no log file yet, add a blank entry.
-        except FileNotFoundError:
-            pass
+    # A worker process renders the table only when the ingester publishes new results.
+    if results_table is not None:
+        return _cached_render("table", lambda rows: json.dumps(rows))
+
+    # Look at the log index to get current iPerf3 data.
+    return json.dumps(latest_results())
+
+
+# In a worker process, the rendered responses for the current version of the `shared results table <shared_table.py>`, keyed by name.
+_render_cache: Dict[str, Tuple[int, str]] = {}
 
-    return json.dumps(iperf3_data)
+
+# Return the cached response ``name`` if the shared results table hasn't changed since it was rendered; otherwise, render it by calling ``render`` with the table's rows.
+def _cached_render(name: str, render: Callable[[List[Any]], str]) -> str:
+    assert results_table is not None
+    version, rows = results_table.read()
+    cached = _render_cache.get(name)
+    if cached and cached[0] == version:
+        return cached[1]
+    text = render(rows)
+    _render_cache[name] = (version, text)
+    return text
 
 
 # CSV download
 # ------------
-@route("/csv")
 def download_csv():
+    from bottle import response
+
     # See the `bottle tutorial <https://bottlepy.org/docs/dev/tutorial.html#generating-content>`_ under "Changing the Default Encoding".
     response.content_type = "text/csv"
     # See the `Response object <https://bottlepy.org/docs/dev/tutorial.html#tutorial-response>`_.
     response.set_header("content_disposition", "attachment; filename=iperf3_log.csv")
+    # A worker process reads the full history from the logs itself, but only after the ingester reports a change.
+    if results_table is not None:
+        return _cached_render("csv", _export_worker_csv)
     return export_csv(num_servers)
 
 
+def _export_worker_csv(rows: List[Any]) -> str:
+    sync_worker_index()
+    return export_csv(num_servers or 0)
+
+
+# True once a worker process loaded the index the ingester persisted.
+_worker_index_loaded = False
+
+
+# In a worker process, bring the log index's telemetry, which only the ingester samples, up to date by reading what the ingester appended to its journal. The first time, start from the index the ingester persisted, rather than parsing every log; after that, the worker's index parses only what was appended to each log, like the ingester's.
+def sync_worker_index() -> None:
+    global _worker_index_loaded
+
+    if not _worker_index_loaded:
+        log_index.load(log_dir / log_index_file_name)
+        _worker_index_loaded = True
+    log_index.load_telemetry(log_dir / telemetry_file_name)
+
+
 # Static files
 # ------------
 # Serve static files (JS needed by the main page). Copied from the `bottle docs <http://bottlepy.org/docs/dev/tutorial.html#routing-static-files>`_.
-@route("/static/<filename>")
 def server_static(filename):
+    from bottle import static_file
+
     return static_file(filename, root=str(Path(__file__).parent))
 
 
+# Readiness
+# ---------
+# Report which parts of this program are ready. The response is JSON; its status is 503 (Service Unavailable) until everything is ready.
+def readiness():
+    from bottle import response
+
+    # A worker process learns which parts of the ingester are ready from the shared results table.
+    if results_table is not None:
+        ready = results_table.ready
+        status = {name: bool(ready & (1 << i)) for i, name in enumerate(ready_events)}
+    else:
+        status = {name: event.is_set() for name, event in ready_events.items()}
+    response.content_type = "application/json"
+    if not all(status.values()):
+        response.status = 503
+    return json.dumps(
+        dict(
+            status,
+            ready=all(status.values()),
+            uptime=time.time() - start_time,
+            num_servers=num_servers,
+            starting_port=starting_port,
+            websocket_port=websocket_port,
+        )
+    )
+
+
+# Stats
+# -----
+# Report the telemetry sampler's status, including a summary of the last few seconds, and the telemetry recorded during the latest run on each port. Only the ingester samples telemetry, so a worker process reports the sampler as ``null``.
+def stats():
+    from bottle import response
+
+    if results_table is not None:
+        _, rows = results_table.read()
+    else:
+        rows = latest_results()
+    response.content_type = "application/json"
+    return json.dumps(
+        dict(
+            sampler=telemetry_sampler.status() if telemetry_sampler else None,
+            ports=[
+                dict(
+                    port=index + starting_port,
+                    timestamp=row[0] if row else None,
+                    telemetry=row[4] if row else None,
+                )
+                for index, row in enumerate(rows)
+            ],
+        )
+    )
+
+
+# Alerts
+# ------
+# Return the alerts raised by the `anomaly detector <anomaly.py>`, oldest first. Query parameters (all optional) are ``since`` (return only alerts with a greater id), ``port``, ``ue``, and ``limit`` (the maximum number to return; the most recent are returned).
+def query_alerts():
+    from bottle import abort, request, response
+
+    # A worker process reads the alerts the ingester recorded, once it publishes a new one.
+    if results_table is not None:
+        alert_store.reload_if_behind(
+            log_dir / alerts_file_name, results_table.last_alert_id
+        )
+    try:
+        since = int(request.query.get("since", 0))
+        port = request.query.get("port")
+        limit = int(request.query.get("limit", 100))
+        alerts = alert_store.query(
+            since,
+            None if port is None else int(port),
+            request.query.getunicode("ue"),
+            limit,
+        )
+    except ValueError:
+        abort(400, "since, port, and limit must be integers.")
+    response.content_type = "application/json"
+    return json.dumps(alerts)
+
+
+# Routes
+# ------
+# Create the bottle application serving the pages above.
+def create_app() -> "bottle.Bottle":
+    import bottle
+
+    app = bottle.Bottle()
+    app.route("/")(home_page)
+    app.route("/table")(create_table)
+    app.route("/csv")(download_csv)
+    app.route("/static/<filename>")(server_static)
+    app.route("/ready")(readiness)
+    app.route("/stats")(stats)
+    app.route("/alerts")(query_alerts)
+    # See `columnar.py`.
+    from .columnar import download_columnar
+
+    app.route("/arrow")(lambda: download_columnar("arrow"))
+    app.route("/parquet")(lambda: download_columnar("parquet"))
+    # See `workbook.py`.
+    from .workbook import download_xlsx
+
+    app.route("/xlsx")(download_xlsx)
+    # See `profiling.py`.
+    if admin_token:
+        from .profiling import add_admin_routes
+
+        add_admin_routes(
+            app,
+            admin_token,
+            lambda: websocket_watcher.loop if websocket_watcher else None,
+        )
+    return app
+
+
 # Websocket and watcher
 # =====================
 # The watcher monitors the log directory, sending a message over a websocket to the client when the client needs to be updated.
+#
+# Messages
+# --------
+# Tell the client that new data is available.
+update_message = "new data"
+# Tell the client that it missed some messages, so it should fetch everything again.
+resync_message = "resync"
+
+
+# Broadcast hub
+# -------------
+# The hub sends each published message to every connected client. Each client has its own bounded queue, drained by its own coroutine; therefore, a slow or stalled client only delays itself.
+class BroadcastHub:
+    def __init__(
+        self,
+        # The maximum number of messages queued for a client. When a client's queue overflows, its backlog is replaced by a single `resync_message`.
+        queue_size: int = 8,
+        # The time, in seconds, to wait for a send to a client to complete before closing that client's connection.
+        send_timeout: float = 10,
+    ):
+        self.queue_size = queue_size
+        self.send_timeout = send_timeout
+        # A queue of messages for each connected client. A ``None`` message tells the client's coroutine to exit.
+        self.clients: Dict[Any, asyncio.Queue] = {}
+        # The clients which negotiated `binary messages <wire.py>`.
+        self.binary_clients: Set[Any] = set()
+        # The latest snapshot published, which is sent to binary clients when they connect; ``None`` if it may be stale.
+        self.last_snapshot: Optional[bytes] = None
+
+    # Queue a message for each client. The message is serialized once by the caller, then shared by all clients; binary clients receive ``binary`` instead, if it's provided.
+    def publish(self, message: Optional[str], binary: Optional[bytes] = None) -> None:
+        for websocket, queue in self.clients.items():
+            self._put(
+                queue,
+                (
+                    message
+                    if binary is None or websocket not in self.binary_clients
+                    else binary
+                ),
+            )
+
+    # Queue a message for one client, coalescing its backlog if its queue is full.
+    @staticmethod
+    def _put(queue: asyncio.Queue, message: Union[str, bytes, None]) -> None:
+        try:
+            queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # The client is too far behind to catch up by processing each message; instead, discard the backlog and tell it to fetch everything again. Shutdown takes priority over this.
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(None if message is None else resync_message)
+
+    # Tell all clients to disconnect.
+    def close(self) -> None:
+        self.publish(None)
+
+    # Send queued messages to a client until the hub closes, the client disconnects, or a send times out.
+    async def serve(
+        self,
+        # The opened websocket that can now be read or written.
+        websocket: "websockets.server.WebSocketServerProtocol",
+        # The message to send when the client connects.
+        initial_message: str = update_message,
+    ) -> None:
+        import websockets.exceptions
+
+        from .wire import msgpack_subprotocol
+
+        queue: asyncio.Queue = asyncio.Queue(self.queue_size)
+        if websocket.subprotocol == msgpack_subprotocol:
+            self.binary_clients.add(websocket)
+            # Send the table itself, if it's current.
+            queue.put_nowait(self.last_snapshot or initial_message)
+        else:
+            queue.put_nowait(initial_message)
+        self.clients[websocket] = queue
+        try:
+            while True:
+                message = await queue.get()
+                if message is None:
+                    break
+                await asyncio.wait_for(websocket.send(message), self.send_timeout)
+        except asyncio.TimeoutError:
+            print("Websocket send timed out; closing the connection.")
+            await websocket.close(1011, "send timeout")
+        except websockets.exceptions.WebSocketException:
+            # Just allow the socket to close.
+            pass
+        finally:
+            del self.clients[websocket]
+            self.binary_clients.discard(websocket)
+
+
+# Watcher
+# -------
 class WebSocketWatcher:
     # Startup / shutdown
     # ------------------
@@ -325,10 +975,26 @@ class WebSocketWatcher:
         self,
         # A Path to the directory containing logs.
         log_path: Path,
+        # The port to listen on.
+        port: int = 8765,
+        # See `BroadcastHub`.
+        queue_size: int = 8,
+        # See `BroadcastHub`.
+        send_timeout: float = 10,
+        # The interval, in seconds, between pings sent to each client; ``None`` disables pings.
+        ping_interval: Optional[float] = 20,
+        # The time, in seconds, to wait for a reply to a ping before closing the connection; this evicts dead clients.
+        ping_timeout: Optional[float] = 20,
+        # The size of the permessage-deflate window, in bits; 0 disables compression. See `wire.py`.
+        deflate_window_bits: int = 11,
     ):
         self.log_path = log_path
+        self.port = port
+        self.hub = BroadcastHub(queue_size, send_timeout)
+        self.ping_interval = ping_interval
+        self.ping_timeout = ping_timeout
+        self.deflate_window_bits = deflate_window_bits
         self.stop_event: Optional[asyncio.Event] = None
-        self.update_event: Optional[asyncio.Event] = None
         self.thread = None
         self.loop: Optional[asyncio.AbstractEventLoop] = None
 
@@ -347,89 +1013,364 @@ class WebSocketWatcher:
     async def update(
         self,
         # The opened websocket that can now be read or written.
-        websocket: websockets.server.WebSocketServerProtocol,
+        websocket: "websockets.server.WebSocketServerProtocol",
     ) -> None:
-        try:
-            while True:
-                # Send the table when the page first loads, or after new data is available.
-                await websocket.send("new data")
-
-                # Wait until the watcher signals a change.
-                assert isinstance(self.update_event, asyncio.Event)
-                await self.update_event.wait()
-
-                # Look for shutdown.
-                assert isinstance(self.stop_event, asyncio.Event)
-                if self.stop_event.is_set():
-                    break
-
-        except websockets.exceptions.WebSocketException:
-            # Just allow the socket to close.
-            pass
+        # Send the table when the page first loads, then after new data is available.
+        await self.hub.serve(websocket)
         print("Websocket connection closed.")
 
     async def watcher(self) -> None:
-        assert isinstance(self.update_event, asyncio.Event)
-        # Very important: this hangs in shutdown unless we pass ``self.stop_event`` to the watcher.
-        async for change in awatch(self.log_path, stop_event=self.stop_event):  # type: ignore
+        from watchgod import awatch, RegExpWatcher
+
+        from .wire import encode_alert, encode_snapshot
+
+        # Very important: this hangs in shutdown unless we pass ``self.stop_event`` to the watcher. Only watch the logs, so that saving the log index doesn't produce a change.
+        async for change in awatch(
+            self.log_path,
+            watcher_cls=RegExpWatcher,
+            watcher_kwargs=dict(re_files=r".*port-\d+\.json$"),
+            stop_event=self.stop_event,  # type: ignore
+        ):
             print(change)
-            # Signal any websockets to do an update.
-            self.update_event.set()
-            # Reset to prepare for the next signal.
-            self.update_event.clear()
+            # Parse the new data before telling clients about it, so their requests find a warm index.
+            refresh = refresh_log_index
+            # Profile the refresh if an admin started a deterministic profile. Import the profiler only if the admin endpoints are enabled, so that it doesn't slow startup otherwise.
+            if admin_token:
+                from .profiling import profiled
+
+                refresh = profiled(refresh)
+            alerts = await self.loop.run_in_executor(None, refresh)  # type: ignore
+            # Signal any websockets to do an update, then send any alerts. Binary clients receive the table itself; only encode it if there are any.
+            snapshot = None
+            if self.hub.binary_clients:
+                snapshot = await self.loop.run_in_executor(  # type: ignore
+                    None, lambda: encode_snapshot(latest_results())
+                )
+            self.hub.last_snapshot = snapshot
+            self.hub.publish(update_message, snapshot)
+            for alert in alerts:
+                self.hub.publish(
+                    alert_message(alert),
+                    encode_alert(alert) if self.hub.binary_clients else None,
+                )
 
-        # On shutdown, signal any waiting websockets so they can exit.
-        self.update_event.set()
+        # On shutdown, tell any connected websockets to exit.
+        self.hub.close()
 
     # This is the websocket server main loop, which waits for connections.
     async def amain(self) -> None:
+        import websockets
+
+        from .wire import available_subprotocols, deflate_extension
+
         self.loop = asyncio.get_running_loop()
         self.stop_event = asyncio.Event()
-        self.update_event = asyncio.Event()
 
         # Run the watcher.
         watcher_task = asyncio.create_task(self.watcher())
 
-        # Start the server; per the `docs <https://websockets.readthedocs.io/en/stable/reference/server.html#websockets.server.serve>`__, exiting this context manager shuts it down.
-        async with websockets.serve(self.update, "0.0.0.0", 8765):  # type:ignore
+        # Start the server; per the `docs <https://websockets.readthedocs.io/en/stable/reference/server.html#websockets.server.serve>`__, exiting this context manager shuts it down. The server sends pings, closing connections to clients which don't reply. It offers `binary messages <wire.py>` to clients which ask, and compresses messages with a reduced window.
+        deflate = deflate_extension(self.deflate_window_bits)
+        async with websockets.serve(  # type:ignore
+            self.update,
+            "0.0.0.0",
+            self.port,
+            ping_interval=self.ping_interval,
+            ping_timeout=self.ping_timeout,
+            subprotocols=available_subprotocols() or None,
+            compression=None,
+            extensions=[deflate] if deflate else None,
+        ):
+            ready_events["websocket"].set()
             # Run the server until a stop is requested.
             await self.stop_event.wait()
-        await watcher_task
+            await watcher_task
         print("Websocket server shutting down...")
 
 
+# Worker processes
+# ================
+# With ``--workers N``, N forked processes share one listening socket and serve HTTP requests; this process becomes the ingester, which runs the watcher, websocket, and log index and publishes the latest results to the `shared results table <shared_table.py>`. Since ``fork`` copies only the calling thread, the workers must be forked before this process starts any threads.
+#
+# Run the webserver in a worker process.
+def serve_worker(server: Any) -> None:
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        # The ingester shuts down the workers; don't print a traceback on Ctrl+C.
+        pass
+
+
+# Fork ``num_workers`` processes, each serving ``app`` on ``http_port``. Return the worker processes.
+def start_workers(
+    app: "bottle.Bottle", http_port: int, num_workers: int
+) -> List[multiprocessing.process.BaseProcess]:
+    from paste.httpserver import serve  # type: ignore
+
+    # Create a thread-per-request server without starting it; its listening socket is inherited by each worker.
+    server = serve(
+        app,
+        host="0.0.0.0",
+        port=http_port,
+        protocol_version="HTTP/1.1",
+        start_loop=False,
+        use_threadpool=False,
+        daemon_threads=True,
+    )
+    context = multiprocessing.get_context("fork")
+    workers: List[multiprocessing.process.BaseProcess] = [
+        context.Process(target=serve_worker, args=(server,), daemon=True)
+        for _ in range(num_workers)
+    ]
+    for worker in workers:
+        worker.start()
+    # Only the workers accept connections.
+    server.server_close()
+    print(f"Serving on port {http_port} with {num_workers} worker processes.")
+    return workers
+
+
+# Copy the ingester's ready events to the shared results table, until all are set.
+def share_readiness() -> None:
+    assert results_table is not None
+    while True:
+        ready = [event.is_set() for event in ready_events.values()]
+        results_table.set_ready(sum(1 << i for i, is_set in enumerate(ready) if is_set))
+        if all(ready):
+            return
+        time.sleep(0.1)
+
+
 # Main
 # ====
 def main(argv):
+    global num_servers, log_dir, websocket_port, results_table, telemetry_sampler, telemetry_interfaces, anomaly_detector, admin_token, websocket_watcher
+
     # Parse command line.
-    if len(argv) != 2:
+    parser = argparse.ArgumentParser(
+        prog=argv[0], description="Run iPerf3 servers and display their results."
+    )
+    parser.add_argument(
+        "num_ports",
+        type=int,
+        metavar="NUM_PORTS",
+        help="the number of ports to monitor.",
+    )
+    parser.add_argument(
+        "--http-port", type=int, default=80, help="the port for the webserver."
+    )
+    parser.add_argument(
+        "--ws-port",
+        type=int,
+        default=websocket_port,
+        help="the port for the websocket.",
+    )
+    parser.add_argument(
+        "--ws-queue-size",
+        type=int,
+        default=8,
+        help="the number of messages queued for each websocket client before its backlog is replaced by a resync.",
+    )
+    parser.add_argument(
+        "--ws-send-timeout",
+        type=float,
+        default=10,
+        help="the time, in seconds, to wait for a send to a websocket client before disconnecting it.",
+    )
+    parser.add_argument(
+        "--ws-ping-interval",
+        type=float,
+        default=20,
+        help="the time, in seconds, between pings sent to each websocket client.",
+    )
+    parser.add_argument(
+        "--ws-ping-timeout",
+        type=float,
+        default=20,
+        help="the time, in seconds, to wait for a reply to a ping before disconnecting a websocket client.",
+    )
+    parser.add_argument(
+        "--ws-deflate-window-bits",
+        type=int,
+        default=11,
+        choices=[0] + list(range(9, 16)),
+        help="the permessage-deflate window size for websocket messages, in bits; 0 disables compression.",
+    )
+    parser.add_argument(
+        "--log-dir", type=Path, default=log_dir, help="the directory for iPerf3 logs."
+    )
+    parser.add_argument(
+        "--no-iperf3",
+        action="store_true",
+        help="don't start iPerf3 servers; instead, another program (such as the load tester) writes the logs.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="the number of processes serving HTTP requests; more than one requires Linux.",
+    )
+    parser.add_argument(
+        "--telemetry-interval",
+        type=float,
+        default=1,
+        help="the time, in seconds, between samples of the CPU, temperature, and network; 0 disables sampling.",
+    )
+    parser.add_argument(
+        "--telemetry-samples",
+        type=int,
+        default=3600,
+        help="the number of telemetry samples to keep.",
+    )
+    parser.add_argument(
+        "--telemetry-interfaces",
+        default=",".join(telemetry_interfaces),
+        help="a comma-separated list of the network interfaces to sample.",
+    )
+    parser.add_argument(
+        "--alert-threshold",
+        type=float,
+        default=3,
+        help="raise an alert when a rate falls more than this many deviations below its baseline.",
+    )
+    parser.add_argument(
+        "--alert-warmup",
+        type=int,
+        default=5,
+        help="the number of runs on a port or from a UE needed before its rates can raise alerts.",
+    )
+    parser.add_argument(
+        "--admin-token",
+        default=os.environ.get("WEBPERF3_ADMIN_TOKEN"),
+        help="enable the profiling endpoints under /admin, which require this token; defaults to $WEBPERF3_ADMIN_TOKEN. Not available with --workers.",
+    )
+    parser.add_argument(
+        "--stage-dir",
+        type=Path,
+        help="log to this RAM-backed directory (such as a tmpfs) instead, persisting completed runs to --log-dir in batches.",
+    )
+    parser.add_argument(
+        "--persist-interval",
+        type=float,
+        default=60,
+        help="with --stage-dir, the time, in seconds, between batches written to --log-dir.",
+    )
+    args = parser.parse_args(argv[1:])
+    if args.workers < 1:
+        parser.error("--workers must be at least 1.")
+    if args.workers > 1 and is_win:
+        parser.error("--workers requires fork, which isn't available on Windows.")
+    num_servers = args.num_ports
+    log_dir = args.log_dir
+    websocket_port = args.ws_port
+    # A profile of one worker process would be of little use; see `profiling.py`.
+    if args.admin_token and args.workers > 1:
+        print("Note: the admin endpoints aren't available with --workers.")
+    else:
+        admin_token = args.admin_token
+    telemetry_interfaces = [
+        interface for interface in args.telemetry_interfaces.split(",") if interface
+    ]
+
+    # Set up logging subdirectory. When staging, restore the staging directory from the durable copy, then use it in place of the log directory; see `staging.py`.
+    persister = None
+    if args.stage_dir:
+        from .staging import LogPersister
+
+        persister = LogPersister(
+            args.stage_dir,
+            log_dir,
+            args.persist_interval,
+            replaced=[log_index_file_name],
+        )
+        restored = persister.recover()
         print(
-            dedent(
-                f"""
-                Usage: {argv[0]} NUM_PORTS
-                where NUM_PORTS gives the number of ports to monitor.
-
-                Error: {'missing NUM_PORTS.' if len(argv) < 2 else 'too many arguments.'}
-                """
-            ),
-            file=sys.stderr,
+            f"Staging iPerf3 data in {args.stage_dir} (restored {len(restored)} files); persisting it to {log_dir} every {args.persist_interval} seconds."
         )
-        return
-    global num_servers
-    num_servers = int(argv[1])
-
-    # Set up logging subdirectory.
-    log_dir = iperf3_log_file_name(0).parent
+        log_dir = args.stage_dir
     print(f"Logging iPerf3 data to {log_dir}.")
     log_dir.mkdir(exist_ok=True)
 
-    # Start the webserver and the watcher/websocket.
-    start_iperf3_servers(num_servers)
-    wsw = WebSocketWatcher(log_dir)
+    # Fork the workers first, before any threads exist.
+    workers = []
+    if args.workers > 1:
+        from .shared_table import ResultsTable
+
+        results_table = ResultsTable.create(num_servers)
+        workers = start_workers(create_app(), args.http_port, args.workers)
+        Thread(target=share_readiness, daemon=True).start()
+
+    if persister:
+        persister.start()
+
+    # Only the ingester detects anomalies; it's created after forking, so workers don't have one.
+    anomaly_detector = AnomalyDetector(
+        threshold=args.alert_threshold, warmup=args.alert_warmup
+    )
+
+    # Start sampling before indexing, so that runs which finish from now on are annotated. The sampler reads ``/proc``, so it requires Linux.
+    if args.telemetry_interval > 0 and not is_win:
+        from .telemetry import TelemetrySampler
+
+        telemetry_sampler = TelemetrySampler(
+            args.telemetry_interval, args.telemetry_samples, telemetry_interfaces
+        )
+        telemetry_sampler.start()
+
+    # Start everything concurrently: the iPerf3 servers and the log index in the background, the watcher/websocket in its own thread, and the webserver in this thread. See ``/ready`` to determine when all are running.
+    if args.no_iperf3:
+        ready_events["iperf3"].set()
+    else:
+
+        def start_servers():
+            start_iperf3_servers(num_servers)
+            ready_events["iperf3"].set()
+
+        Thread(target=start_servers, daemon=True).start()
+    Thread(target=warm_log_index, daemon=True).start()
+    wsw = websocket_watcher = WebSocketWatcher(
+        log_dir,
+        websocket_port,
+        args.ws_queue_size,
+        args.ws_send_timeout,
+        args.ws_ping_interval,
+        args.ws_ping_timeout,
+        args.ws_deflate_window_bits,
+    )
     wsw.start()
-    # Ideally, run an asyncio server; however, I don't understand how this would integrate into the event loop. So, use a multi-threaded server instead.
-    run(host="0.0.0.0", port=80, server="paste")
+    # Treat a terminate request like Ctrl+C, so that the workers and shared memory are cleaned up, and staged logs are persisted.
+    if workers or persister:
+        signal.signal(signal.SIGTERM, signal.default_int_handler)
+    if workers:
+        try:
+            for worker in workers:
+                worker.join()
+        except KeyboardInterrupt:
+            pass
+        for worker in workers:
+            worker.terminate()
+            worker.join()
+    else:
+        # Ideally, run an asyncio server; however, I don't understand how this would integrate into the event loop. So, use a multi-threaded server instead.
+        from bottle import run
+
+        # Use HTTP/1.1, so that clients (such as the `federation collector <federation.py>`) can keep connections alive.
+        run(
+            create_app(),
+            host="0.0.0.0",
+            port=args.http_port,
+            server="paste",
+            protocol_version="HTTP/1.1",
+        )
 
     # Shut down.
     print("Shutting down...")
     wsw.stop()
+    if telemetry_sampler:
+        telemetry_sampler.stop()
+    log_index.save(log_dir / log_index_file_name)
+    log_index.save_telemetry(log_dir / telemetry_file_name)
+    if persister:
+        persister.stop()
+    if results_table is not None:
+        results_table.close()
@@ -0,0 +1,121 @@
+# ************************************************
+# |docname| - Binary messages for websocket clients
+# ************************************************
+# Each notification tells a dashboard to fetch ``/table``; over the Pi's access point, with a room full of tablets, that's a burst of HTTP requests after every run. Instead, a client which asks for the ``webperf3.msgpack`` `subprotocol <https://developer.mozilla.org/en-US/docs/Web/API/WebSocket/WebSocket#protocols>`_ receives the table itself, as a compact binary `MessagePack <https://msgpack.org/>`_ message. Clients which don't ask (older dashboards, the `federation collector <federation.py>`, and the `load tester <loadtest.py>`) receive the same text messages as before. MessagePack is an optional dependency (``pip install webperf3[msgpack]``); without it, the server doesn't offer the subprotocol, so every client falls back to text.
+#
+# Each binary message is a map whose ``type`` is:
+#
+# ``snapshot``
+#   The table, in place of ``new data``, as columns of equal length (one entry per port). Numeric columns (``timestamp``, ``send_bps``, ``receive_bps``) are packed as little-endian float64 arrays, with NaN for a missing value; ``present`` is a byte per port, 0 if the port has no log yet; ``name`` and ``telemetry`` are arrays.
+# ``alert``
+#   An alert from the `anomaly detector <anomaly.py>`, in ``alert``.
+#
+# A binary client must still handle the text ``resync`` message. The websocket server also compresses all messages with permessage-deflate; see ``deflate_extension``.
+#
+# .. contents:: Table of Contents
+#   :local:
+#   :depth: 2
+#
+#
+# Imports
+# =======
+# These are listed in the order prescribed by `PEP 8`_.
+#
+# Standard library
+# ----------------
+import math
+import struct
+from typing import Any, Dict, List, Optional, Sequence
+
+# Third-party imports
+# -------------------
+# MessagePack is optional, and websockets is slow to import, so both are imported by the functions which need them.
+#
+# Local application imports
+# -------------------------
+# None.
+
+
+# Subprotocols
+# ============
+msgpack_subprotocol = "webperf3.msgpack"
+
+
+# Return the subprotocols the server offers.
+def available_subprotocols() -> List[str]:
+    try:
+        import msgpack  # noqa: F401
+    except ImportError:
+        return []
+    return [msgpack_subprotocol]
+
+
+# Return the permessage-deflate extension for ``websockets.serve``, or None to disable compression if ``window_bits`` is 0. A smaller window than zlib's default (15 bits, or 32 KiB) uses much less memory per client, while the messages here are far smaller than the window; likewise, ``memLevel`` 4 (rather than 8) shrinks each compressor. See the websockets `compression guide <https://websockets.readthedocs.io/en/stable/topics/compression.html>`_.
+def deflate_extension(window_bits: int) -> Optional[Any]:
+    if not window_bits:
+        return None
+    from websockets.extensions.permessage_deflate import ServerPerMessageDeflateFactory
+
+    return ServerPerMessageDeflateFactory(
+        server_max_window_bits=window_bits,
+        client_max_window_bits=window_bits,
+        compress_settings={"memLevel": 4},
+    )
+
+
+# Messages
+# ========
+# Pack ``values`` as little-endian float64s, with NaN for None.
+def pack_floats(values: Sequence[Optional[float]]) -> bytes:
+    return struct.pack(
+        f"<{len(values)}d", *(math.nan if value is None else value for value in values)
+    )
+
+
+def unpack_floats(data: bytes) -> List[Optional[float]]:
+    return [
+        None if math.isnan(value) else value
+        for value in struct.unpack(f"<{len(data) // 8}d", data)
+    ]
+
+
+# Encode the table (as returned by ``latest_results`` in `webperf3.py`) as a snapshot message.
+def encode_snapshot(rows: Sequence[Optional[Sequence[Any]]]) -> bytes:
+    import msgpack
+
+    padded = [row or (None,) * 5 for row in rows]
+    return msgpack.packb(
+        dict(
+            type="snapshot",
+            present=bytes(row is not None for row in rows),
+            timestamp=pack_floats([row[0] for row in padded]),
+            send_bps=pack_floats([row[1] for row in padded]),
+            receive_bps=pack_floats([row[2] for row in padded]),
+            name=[row[3] for row in padded],
+            telemetry=[row[4] for row in padded],
+        )
+    )
+
+
+# Decode a snapshot message, returning the table as ``/table`` does. This is the reference for the decoder in `webperf3.js`.
+def decode_snapshot(data: bytes) -> List[Optional[List[Any]]]:
+    import msgpack
+
+    message = msgpack.unpackb(data)
+    columns = zip(
+        unpack_floats(message["timestamp"]),
+        unpack_floats(message["send_bps"]),
+        unpack_floats(message["receive_bps"]),
+        message["name"],
+        message["telemetry"],
+    )
+    return [
+        [None if timestamp is None else int(timestamp), *rest] if present else None
+        for present, (timestamp, *rest) in zip(message["present"], columns)
+    ]
+
+
+def encode_alert(alert: Dict[str, Any]) -> bytes:
+    import msgpack
+
+    return msgpack.packb(dict(type="alert", alert=alert))
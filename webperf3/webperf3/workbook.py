@@ -0,0 +1,149 @@
+# ***********************************
+# |docname| - Export results to Excel
+# ***********************************
+# Operators open the ``/csv`` export in Excel, then format its timestamp column by hand. Instead, ``/xlsx`` provides a workbook with typed cells: timestamps are dates (in the Pi's local time, since Excel dates have no time zone) and rates are numbers. It contains a combined sheet with every run, sorted by time, followed by one sheet per port.
+#
+# The workbook is written by `XlsxWriter <https://xlsxwriter.readthedocs.io>`_ in constant memory mode, which flushes each row to a temporary file as soon as the next row is written; therefore, exporting tens of thousands of runs doesn't grow the Pi's memory use. The finished workbook is then streamed from a temporary file. XlsxWriter is an optional dependency: ``pip install webperf3[xlsx]``.
+#
+# .. contents:: Table of Contents
+#   :local:
+#   :depth: 2
+#
+#
+# Imports
+# =======
+# These are listed in the order prescribed by `PEP 8`_.
+#
+# Standard library
+# ----------------
+import os
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+import time
+from typing import Dict, Iterator, List, Tuple
+
+# Third-party imports
+# -------------------
+# XlsxWriter is optional, so it's imported by the functions which need it.
+#
+# Local application imports
+# -------------------------
+from . import webperf3
+from .telemetry import summary_fields
+
+
+# Dates
+# =====
+# Excel stores a date as the number of days since 1899-12-30; ``DATE(1970,1,1)`` == 25569.
+excel_epoch_days = 25569
+
+
+# Convert timestamps (in seconds since the epoch) to Excel dates in local time. Looking up the local time zone's offset is the slow part, and the offset changes only on the hour (at daylight saving transitions), so it's looked up once per hour of timestamps.
+class ExcelDates:
+    def __init__(self) -> None:
+        # The UTC offset, in seconds, of each hour (in hours since the epoch) seen.
+        self.offsets: Dict[int, int] = {}
+
+    def __call__(self, timestamp: float) -> float:
+        hour = int(timestamp // 3600)
+        offset = self.offsets.get(hour)
+        if offset is None:
+            offset = self.offsets[hour] = time.localtime(hour * 3600).tm_gmtoff
+        return (timestamp + offset) / 86400 + excel_epoch_days
+
+
+# Workbook
+# ========
+# Write a workbook of the runs from ``num_servers`` ports to ``path``.
+def export_xlsx(num_servers: int, path: Path) -> None:
+    import xlsxwriter
+
+    # Exclude blank entries, as ``export_csv`` does. Indices in each run are: port, timestamp, send bps, receive bps, name.
+    runs = [run for run in webperf3.log_index.read_all(num_servers) if run[1]]
+    fields = summary_fields(webperf3.telemetry_interfaces)
+    headings = ["Port", "Name", "Timestamp", "Send rate (bps)", "Receive rate (bps)"]
+    headings += [heading for _, heading in fields]
+
+    workbook = xlsxwriter.Workbook(str(path), {"constant_memory": True})
+    date_format = workbook.add_format({"num_format": "yyyy-mm-dd hh:mm:ss"})
+    rate_format = workbook.add_format({"num_format": "#,##0"})
+    bold = workbook.add_format({"bold": True})
+    excel_date = ExcelDates()
+
+    # Add a sheet named ``name`` containing ``runs``. In constant memory mode, each sheet must be written row by row.
+    def add_sheet(name: str, runs: List[Tuple]) -> None:
+        sheet = workbook.add_worksheet(name)
+        sheet.set_column(1, 1, 16)
+        sheet.set_column(2, 2, 20, date_format)
+        sheet.set_column(3, 4, 18, rate_format)
+        sheet.set_column(5, len(headings) - 1, 16)
+        sheet.freeze_panes(1, 0)
+        sheet.write_row(0, 0, headings, bold)
+        for row_index, (port, timestamp, send_bps, receive_bps, name) in enumerate(
+            runs, 1
+        ):
+            sheet.write_number(row_index, 0, port)
+            if name is not None:
+                sheet.write_string(row_index, 1, name)
+            sheet.write_number(row_index, 2, excel_date(timestamp), date_format)
+            for column, bps in ((3, send_bps), (4, receive_bps)):
+                if bps is not None:
+                    sheet.write_number(row_index, column, bps, rate_format)
+            telemetry = webperf3.log_index.run_telemetry(port, timestamp) or {}
+            for column, (key, _) in enumerate(fields, 5):
+                value = telemetry.get(key)
+                if value is not None:
+                    sheet.write(row_index, column, value)
+
+    # The combined sheet is first, so it's what Excel shows on opening.
+    add_sheet("All ports", sorted(runs, key=lambda run: run[1]))
+    # Group the runs by port in one pass. The index lists each port's runs in log order, which is by time.
+    port_runs: Dict[int, List[Tuple]] = {}
+    for run in runs:
+        port_runs.setdefault(run[0], []).append(run)
+    for server_index in range(num_servers):
+        port = server_index + webperf3.starting_port
+        add_sheet(f"Port {port}", port_runs.get(port, []))
+    workbook.close()
+
+
+# Endpoint
+# ========
+# The size of each piece of the workbook sent to the client.
+chunk_size = 65536
+
+
+# Yield the contents of the file at ``path`` in chunks, then delete it.
+def _stream_and_delete(path: Path) -> Iterator[bytes]:
+    try:
+        with open(path, "rb") as f:
+            while chunk := f.read(chunk_size):
+                yield chunk
+    finally:
+        os.unlink(path)
+
+
+def download_xlsx() -> Iterator[bytes]:
+    from bottle import abort, response
+
+    try:
+        import xlsxwriter  # noqa: F401
+    except ImportError:
+        abort(501, "This export requires XlsxWriter; install webperf3[xlsx].")
+
+    # A worker process first brings its index up to date with the telemetry the ingester recorded, as for ``/csv``.
+    if webperf3.results_table is not None:
+        webperf3.sync_worker_index()
+    with NamedTemporaryFile(suffix=".xlsx", delete=False) as f:
+        path = Path(f.name)
+    try:
+        export_xlsx(webperf3.num_servers or 0, path)
+    except BaseException:
+        path.unlink()
+        raise
+    response.content_type = (
+        "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    )
+    response.content_length = path.stat().st_size
+    response.set_header("content_disposition", "attachment; filename=iperf3_log.xlsx")
+    return _stream_and_delete(path)